@@ -1,25 +1,52 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from html import escape as html_escape
 from io import BytesIO
 from pathlib import Path
 from typing import List, Tuple
-from zipfile import ZipFile, ZIP_DEFLATED
-import os, time, subprocess, tempfile, shutil
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+import asyncio, gzip, hashlib, json, mimetypes, os, re, subprocess, threading, time, tempfile, shutil, zlib
 
 from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.routing import APIRoute
 from fastapi.responses import (
-    HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
+    FileResponse, HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
 )
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles  # ✅ مهم للـ /static
-
-from pypdf import PdfReader, PdfWriter
-from PIL import Image, ImageFile, ExifTags
+from starlette.background import BackgroundTask
+from starlette.datastructures import FormData, Headers, MutableHeaders
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from pypdf import PdfReader, PdfWriter, Transformation, __version__ as PYPDF_VERSION
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from PIL import Image, ExifTags
 import img2pdf
 
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+try:
+    import brotli  # اختياري: نسخة br من الملفات الثابتة إلى جانب gzip
+except ImportError:
+    brotli = None
 
 APP_TITLE = "PDF Web — أدوات بسيطة (Mobile-Ready)"
-app = FastAPI(title=APP_TITLE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _start_serving()
+    _start_job_workers()
+    office_pool.start()
+    yield
+    await _stop_serving()
+    await _stop_job_workers()
+    await office_pool.stop()
+    _shutdown_image_pool()
+
+
+app = FastAPI(title=APP_TITLE, lifespan=lifespan)
 
 # ------------ I18N (Backend messages) ------------
 SUPPORTED_LANGS = {"ar", "en", "tr"}
@@ -107,6 +134,122 @@ ERROR_MESSAGES = {
         "en": "Failed to run compression engine: {error}",
         "tr": "Sıkıştırma motoru çalıştırılamadı: {error}",
     },
+    "unknown_tool": {
+        "ar": "أداة غير معروفة: {tool}",
+        "en": "Unknown tool: {tool}",
+        "tr": "Bilinmeyen araç: {tool}",
+    },
+    "job_not_found": {
+        "ar": "المهمة غير موجودة أو انتهت صلاحيتها.",
+        "en": "Job not found or expired.",
+        "tr": "İş bulunamadı veya süresi doldu.",
+    },
+    "job_not_ready": {
+        "ar": "المهمة لم تنتهِ بعد.",
+        "en": "The job has not finished yet.",
+        "tr": "İş henüz tamamlanmadı.",
+    },
+    "server_busy": {
+        "ar": "الخادم مشغول حالياً، حاول مرة أخرى بعد قليل.",
+        "en": "The server is busy right now, please try again shortly.",
+        "tr": "Sunucu şu anda meşgul, lütfen biraz sonra tekrar deneyin.",
+    },
+    "file_too_large": {
+        "ar": "الملف {name} أكبر من الحد المسموح ({max} MB).",
+        "en": "File {name} is larger than the allowed limit ({max} MB).",
+        "tr": "{name} dosyası izin verilen sınırdan büyük ({max} MB).",
+    },
+    "request_too_large": {
+        "ar": "حجم الرفع الكلي أكبر من الحد المسموح ({max} MB).",
+        "en": "The total upload is larger than the allowed limit ({max} MB).",
+        "tr": "Toplam yükleme izin verilen sınırdan büyük ({max} MB).",
+    },
+    "ocr_missing": {
+        "ar": "أدوات التعرف على النص غير مثبتة على الخادم (tesseract-ocr و poppler-utils في apt.txt).",
+        "en": "OCR tools are not installed on the server (tesseract-ocr and poppler-utils in apt.txt).",
+        "tr": "Sunucuda OCR araçları yüklü değil (apt.txt içinde tesseract-ocr ve poppler-utils).",
+    },
+    "ocr_failed": {
+        "ar": "فشل التعرف على النص: {detail}",
+        "en": "OCR failed: {detail}",
+        "tr": "Metin tanıma başarısız: {detail}",
+    },
+    "too_many_pages": {
+        "ar": "عدد الصفحات كبير ({count}). الحد الأقصى {max}.",
+        "en": "Too many pages ({count}). Maximum allowed is {max}.",
+        "tr": "Çok fazla sayfa ({count}). İzin verilen en fazla sayı: {max}.",
+    },
+    "not_office": {
+        "ar": "الملف {name} ليس مستند Office (Word / Excel / PowerPoint / ODF / RTF).",
+        "en": "File {name} is not an Office document (Word / Excel / PowerPoint / ODF / RTF).",
+        "tr": "{name} bir Office belgesi değil (Word / Excel / PowerPoint / ODF / RTF).",
+    },
+    "office_missing": {
+        "ar": "LibreOffice غير مثبت على الخادم (libreoffice و python3-uno في apt.txt).",
+        "en": "LibreOffice is not installed on the server (libreoffice and python3-uno in apt.txt).",
+        "tr": "Sunucuda LibreOffice yüklü değil (apt.txt içinde libreoffice ve python3-uno).",
+    },
+    "office_failed": {
+        "ar": "فشل تحويل المستند: {detail}",
+        "en": "Document conversion failed: {detail}",
+        "tr": "Belge dönüştürme başarısız: {detail}",
+    },
+    "image_too_large": {
+        "ar": "الصورة {name} كبيرة جداً ({mp} ميغابكسل). الحد الأقصى {max}.",
+        "en": "Image {name} is too large ({mp} MP). Maximum is {max} MP.",
+        "tr": "{name} resmi çok büyük ({mp} MP). En fazla {max} MP.",
+    },
+    "request_too_expensive": {
+        "ar": "الطلب يحتاج ذاكرة أكثر من المسموح (~{need} MB من {budget} MB). قلّل عدد الملفات أو حجمها.",
+        "en": "This request needs more memory than allowed (~{need} MB of {budget} MB). Try fewer or smaller files.",
+        "tr": "Bu istek izin verilenden fazla bellek gerektiriyor (~{need} MB / {budget} MB). "
+              "Daha az veya daha küçük dosya deneyin.",
+    },
+    "bad_page_range": {
+        "ar": "تحديد الصفحات غير صالح: {spec}",
+        "en": "Invalid page selection: {spec}",
+        "tr": "Geçersiz sayfa seçimi: {spec}",
+    },
+    "page_out_of_range": {
+        "ar": "الملف {name} لا يحتوي الصفحات {pages} (عدد صفحاته {count}).",
+        "en": "{name} has no page(s) {pages} (it has {count} pages).",
+        "tr": "{name} dosyasında {pages} sayfası yok (toplam {count} sayfa).",
+    },
+    "thumbs_unavailable": {
+        "ar": "معاينة الصفحات غير متاحة على الخادم (poppler-utils في apt.txt).",
+        "en": "Page previews are not available on the server (poppler-utils in apt.txt).",
+        "tr": "Sunucuda sayfa önizlemesi kullanılamıyor (apt.txt içinde poppler-utils).",
+    },
+    "thumb_expired": {
+        "ar": "انتهت صلاحية المعاينة، أعد اختيار الملف.",
+        "en": "The preview has expired; please select the file again.",
+        "tr": "Önizlemenin süresi doldu; lütfen dosyayı yeniden seçin.",
+    },
+    "bad_upload": {
+        "ar": "تعذّرت قراءة الملفات المرفوعة.",
+        "en": "The uploaded form data could not be read.",
+        "tr": "Yüklenen form verisi okunamadı.",
+    },
+    "upload_not_found": {
+        "ar": "جلسة الرفع غير موجودة أو انتهت صلاحيتها.",
+        "en": "Upload session not found or expired.",
+        "tr": "Yükleme oturumu bulunamadı veya süresi doldu.",
+    },
+    "bad_upload_chunk": {
+        "ar": "جزء الرفع غير صالح.",
+        "en": "Invalid upload chunk.",
+        "tr": "Geçersiz yükleme parçası.",
+    },
+    "upload_incomplete": {
+        "ar": "لم يكتمل رفع كل الصور ({done} من {total}).",
+        "en": "Not all images have been uploaded yet ({done} of {total}).",
+        "tr": "Tüm resimler henüz yüklenmedi ({done} / {total}).",
+    },
+    "empty_image": {
+        "ar": "الصورة {name} فارغة (0 بايت).",
+        "en": "Image {name} is empty (0 bytes).",
+        "tr": "{name} resmi boş (0 bayt).",
+    },
 }
 
 
@@ -132,26 +275,221 @@ templates.env.globals["site_name"] = "PDF Web"
 
 # ✅ مجلد الملفات الثابتة (فيه static/locales/*.json)
 STATIC_DIR = BASE_DIR / "static"
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+STATIC_MAX_AGE = 365 * 24 * 3600
+STATIC_INLINE_MAX = 1024 * 1024  # أكبر من هذا => FileResponse عادي بدون ضغط مسبق
+STATIC_COMPRESS_MIN = 512
+
+
+def _load_static_assets(root: Path) -> dict:
+    # يُقرأ مرة عند الإقلاع: المسار => (بصمة، نوع، {ترميز: بايتات} أو None للملفات الكبيرة)
+    assets = {}
+    for path in sorted(root.rglob("*")):
+        if not path.is_file():
+            continue
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/json":
+            media_type += "; charset=utf-8"
+        if path.stat().st_size > STATIC_INLINE_MAX:
+            h = hashlib.sha256()
+            with open(path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                    h.update(chunk)
+            assets[path.relative_to(root).as_posix()] = (h.hexdigest()[:12], media_type, None)
+            continue
+        data = path.read_bytes()
+        variants = {"identity": data}
+        if len(data) >= STATIC_COMPRESS_MIN:
+            variants["gzip"] = gzip.compress(data, 9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+        assets[path.relative_to(root).as_posix()] = (hashlib.sha256(data).hexdigest()[:12], media_type, variants)
+    return assets
+
+
+def static_url(path: str) -> str:
+    # ?v=بصمة المحتوى => يمكن تخزينه immutable؛ أي تعديل يغيّر الرابط
+    asset = STATIC_ASSETS.get(path)
+    return f"/static/{path}?v={asset[0]}" if asset else f"/static/{path}"
+
+
+def _accepted_encodings(request: Request) -> set:
+    out = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            out.add(name.strip().lower())
+    return out
+
+
+def _negotiated_response(request: Request, variants: dict, etag: str, media_type: str, headers: dict) -> Response:
+    # ETag ضعيف: نفس المحتوى بأي ترميز
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", **headers}
+    if etag in [v.strip() for v in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    accepted = _accepted_encodings(request)
+    encoding = next((e for e in ("br", "gzip") if e in variants and e in accepted), "identity")
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(variants[encoding], media_type=media_type, headers=headers)
+
+
+STATIC_ASSETS = _load_static_assets(STATIC_DIR)
+templates.env.globals["static_url"] = static_url
+
+# نصوص الواجهة تُحمّل مرة واحدة؛ الصفحات تُترجم على الخادم بدل جلب JSON في كل زيارة
+LOCALES = {
+    lang: json.loads((STATIC_DIR / "locales" / f"{lang}.json").read_text("utf-8")) for lang in SUPPORTED_LANGS
+}
 
 MAX_IMAGES = 300
+MAX_IMAGE_MP = int(os.getenv("MAX_IMAGE_MP", "100"))  # ميغابكسل لكل صورة
+# حارس Pillow ضد قنابل فك الضغط (يرفض فوق ضعف هذا الرقم)؛ نحن نرفض قبله في تقدير الكلفة
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_MP * 1_000_000
+
+# ------------ Metrics (Prometheus text format) ------------
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # أو لكل طلب عبر الترويسة X-Server-Timing: 1
+_STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: dict, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in sorted(labels.items())]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines += self._render_one(dict(key), value)
+        return lines
+
+    def _render_one(self, labels: dict, value) -> List[str]:
+        return [f"{self.name}{self._labels(labels)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=_STAGE_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def _render_one(self, labels: dict, value) -> List[str]:
+        counts, total, n = value
+        lines = []
+        for b, c in zip(self.buckets, counts):
+            le = 'le="%s"' % b
+            lines.append(f"{self.name}_bucket{self._labels(labels, le)} {c}")
+        le = 'le="+Inf"'
+        lines += [
+            f"{self.name}_bucket{self._labels(labels, le)} {n}",
+            f"{self.name}_sum{self._labels(labels)} {total}",
+            f"{self.name}_count{self._labels(labels)} {n}",
+        ]
+        return lines
+
+
+STAGE_SECONDS = Histogram("pdfweb_stage_seconds", "Time spent per processing stage.")
+REQUEST_SECONDS = Histogram("pdfweb_request_seconds", "API request latency until response start.")
+BYTES_IN = Counter("pdfweb_bytes_in_total", "Uploaded bytes accepted per tool.")
+BYTES_OUT = Counter("pdfweb_bytes_out_total", "Result bytes produced per tool.")
+PAGES = Counter("pdfweb_pages_total", "PDF pages written per tool.")
+IMAGES = Counter("pdfweb_images_total", "Images converted.")
+INFLIGHT = Gauge("pdfweb_inflight_requests", "API requests currently being handled.")
+ADMISSION_COST = Histogram(
+    "pdfweb_admission_cost_bytes", "Estimated peak memory per admitted request.",
+    buckets=tuple(mb * 1024 * 1024 for mb in (16, 64, 256, 512, 1024, 2048, 4096)),
+)
+METRICS: List[_Metric] = [
+    STAGE_SECONDS, REQUEST_SECONDS, BYTES_IN, BYTES_OUT, PAGES, IMAGES, INFLIGHT, ADMISSION_COST
+]
+
+_stage_sink = threading.local()  # داخل عمّال الـ pool: نجمع التوقيتات ونعيدها للعملية الأم
+_request_timings: ContextVar[list | None] = ContextVar("request_timings", default=None)
+
+
+def record_stage(tool: str, stage: str, seconds: float):
+    sink = getattr(_stage_sink, "items", None)
+    if sink is not None:
+        sink.append((stage, seconds))
+        return
+    STAGE_SECONDS.observe(seconds, tool=tool, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(tool: str, stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(tool, stage, time.perf_counter() - t0)
+
+
+def _collect_stages(fn, *args):
+    _stage_sink.items = []
+    try:
+        return fn(*args), _stage_sink.items
+    finally:
+        _stage_sink.items = None
+
 
 # ------------ Helpers ------------
 _EXIF_ORIENTATION_TAG = next((k for k, v in ExifTags.TAGS.items() if v == "Orientation"), None)
 
 
 def _auto_orient(img: Image.Image) -> Image.Image:
+    # transpose أرخص من rotate(expand=True) ونفس النتيجة
     try:
         exif = img.getexif()
         if not exif:
             return img
         orientation = exif.get(_EXIF_ORIENTATION_TAG)
         if orientation == 3:
-            return img.rotate(180, expand=True)
+            return img.transpose(Image.Transpose.ROTATE_180)
         elif orientation == 6:
-            return img.rotate(270, expand=True)
+            return img.transpose(Image.Transpose.ROTATE_270)
         elif orientation == 8:
-            return img.rotate(90, expand=True)
+            return img.transpose(Image.Transpose.ROTATE_90)
     except Exception:
         pass
     return img
@@ -166,17 +504,23 @@ def _ensure_rgb(img: Image.Image) -> Image.Image:
 
 
 def _compress_to_jpeg_bytes(img: Image.Image, quality: int = 85) -> bytes:
-    img = _ensure_rgb(img)
-    buf = BytesIO()
-    img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
-    return buf.getvalue()
+    with timed("images-to-pdf", "jpeg_encode"):
+        img = _ensure_rgb(img)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return buf.getvalue()
+
+
+A4_MM = (210.0, 297.0)
 
 
 def _layout_a4_with_margins(margin_mm: float = 8.0):
-    a4_w_pt, a4_h_pt = img2pdf.mm_to_pt(210), img2pdf.mm_to_pt(297)
+    a4_w_pt, a4_h_pt = img2pdf.mm_to_pt(A4_MM[0]), img2pdf.mm_to_pt(A4_MM[1])
     left = right = top = bottom = img2pdf.mm_to_pt(margin_mm)
 
-    def _fun(imgwidthpx, imgheightpx, ndpi, metadata):
+    # توقيع img2pdf: (imgwidthpx, imgheightpx, ndpi) -> (pagewidth, pageheight, imgwidth, imgheight)
+    # والصورة تُوسَّط تلقائياً
+    def _fun(imgwidthpx, imgheightpx, ndpi):
         page_width, page_height = a4_w_pt, a4_h_pt
         box_w, box_h = page_width - left - right, page_height - top - bottom
         img_aspect = imgwidthpx / float(imgheightpx)
@@ -187,19 +531,1002 @@ def _layout_a4_with_margins(margin_mm: float = 8.0):
         else:
             h = box_h
             w = h * img_aspect
-        x = (page_width - w) / 2.0
-        y = (page_height - h) / 2.0
-        return (page_width, page_height, x, y, w, h)
+        return (page_width, page_height, w, h)
 
     return _fun
 
 
+def _target_scale(size: Tuple[int, int], max_dpi: int, style: str) -> float:
+    # أكبر عدد بكسلات يظهر فعلاً على صفحة A4 بدقة max_dpi (بغض النظر عن الاتجاه)
+    if max_dpi <= 0:
+        return 1.0
+    margin = 16.0 if style == "a4_margins" else 0.0
+    short_px = (A4_MM[0] - margin) / 25.4 * max_dpi
+    long_px = (A4_MM[1] - margin) / 25.4 * max_dpi
+    w, h = size
+    return min(1.0, long_px / max(w, h), short_px / min(w, h))
+
+
+# ------------ Image engine (process pool) ------------
+# IMAGE_ENGINE: "process" (افتراضي، كل الأنوية) أو "inline" (نفس العملية، للتطوير)
+IMAGE_ENGINE = os.getenv("IMAGE_ENGINE", "process").lower()
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_image_pool: ProcessPoolExecutor | None = None
+
+
+def _get_image_pool() -> ProcessPoolExecutor | None:
+    global _image_pool
+    if IMAGE_ENGINE != "process":
+        return None
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _image_pool
+
+
+def _replace_broken_pool(broken: ProcessPoolExecutor):
+    # عملية فرعية ماتت (OOM أو segfault في مفكك صور) => الـ pool كله معطّل للأبد؛ نبني واحداً جديداً.
+    # طلبات متزامنة قد تصل هنا معاً: الأول فقط يستبدل
+    global _image_pool
+    if _image_pool is broken:
+        _image_pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _shutdown_image_pool():
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+
+
+def _parse_max_dpi(value: str | None) -> int:
+    # "" أو قيمة غير صالحة => بدون تصغير
+    try:
+        return min(max(int(value), 0), 600) if value else 0
+    except ValueError:
+        return 0
+
+
+def _probe_image(src: str) -> Tuple[str, str, Tuple[int, int], bool, int]:
+    # Image.open يقرأ الترويسة فقط (بدون فك البكسلات)
+    with timed("images-to-pdf", "probe"), Image.open(src) as img:
+        try:
+            orientation = int(img.getexif().get(_EXIF_ORIENTATION_TAG) or 1)
+        except Exception:
+            orientation = 1
+        return (img.format or "").upper(), img.mode, img.size, bool(img.info.get("interlace")), orientation
+
+
+def _needs_decode(fmt: str, mode: str, interlaced: bool, orientation: int, compress: str | None, style: str) -> bool:
+    # هل يمرّ الملف إلى img2pdf كما هو؟ (بدون تصغير). نفس الشرط يستخدمه تقدير الذاكرة
+    if style == "a4_margins" and orientation in (5, 6, 7, 8):
+        # img2pdf يمرر للتخطيط أبعاد البكسلات الخام ثم يضيف /Rotate 90 => صفحة بالعرض
+        # وصورة صغيرة؛ نديرها هنا فيرى التخطيط الأبعاد الظاهرة
+        return True
+    if fmt == "JPEG":
+        return False
+    return not (fmt == "PNG" and compress != "1" and mode in ("RGB", "L") and not interlaced)
+
+
+def _prepare_image(src: str, compress: str | None, max_dpi: int = 0, style: str = "full_bleed") -> str | bytes:
+    # يعمل داخل عملية منفصلة ويأخذ مسار الملف المرفوع. JPEG/PNG تُمرَّر كما هي (نعيد المسار
+    # نفسه فيقرأه img2pdf مباشرة) والدوران يصبح /Rotate للصفحة؛ الفك الكامل فقط عند التحويل إلى JPEG
+    fmt, mode, size, interlaced, orientation = _probe_image(src)
+    scale = _target_scale(size, max_dpi, style)
+    if scale < 1.0:
+        return _downsample_to_jpeg(src, scale, max_dpi)
+    if not _needs_decode(fmt, mode, interlaced, orientation, compress, style):
+        return src
+    with Image.open(src) as img:
+        with timed("images-to-pdf", "decode"):
+            img.load()
+        with timed("images-to-pdf", "orient"):
+            img = _auto_orient(img)
+        return _compress_to_jpeg_bytes(img)
+
+
+def _downsample_to_jpeg(src: str, scale: float, max_dpi: int) -> bytes:
+    with Image.open(src) as img:
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        # draft: JPEG يُفك مباشرة بمقياس 1/2 أو 1/4 أو 1/8 (أسرع بكثير من الفك الكامل)
+        with timed("images-to-pdf", "decode"):
+            img.draft("RGB", target)
+            img = _ensure_rgb(img)
+        with timed("images-to-pdf", "resize"):
+            if img.size != target:
+                img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        with timed("images-to-pdf", "orient"):
+            img = _auto_orient(img)
+        with timed("images-to-pdf", "jpeg_encode"):
+            buf = BytesIO()
+            # dpi يحدد الحجم الفعلي للصفحة في وضع full_bleed
+            img.save(buf, format="JPEG", quality=85, optimize=True, progressive=True, dpi=(max_dpi, max_dpi))
+            return buf.getvalue()
+
+
+def _convert_to_pdf(streams, style: str) -> bytes:
+    # ifvalid: نتجاهل اتجاهات EXIF المعكوسة كما كان _auto_orient يفعل
+    rotation = img2pdf.Rotation.ifvalid
+    with timed("images-to-pdf", "img2pdf"):
+        if style == "a4_margins":
+            return img2pdf.convert(streams, layout_fun=_layout_a4_with_margins(8.0), rotation=rotation)
+        return img2pdf.convert(streams, rotation=rotation)
+
+
+def _image_to_pdf(src: str, compress: str | None, style: str, max_dpi: int = 0) -> bytes:
+    return _convert_to_pdf(_prepare_image(src, compress, max_dpi, style), style)
+
+
+async def _run_image_job(fn, *args):
+    loop = asyncio.get_running_loop()
+    pool = _get_image_pool()
+    if pool is None:
+        result, stages = _collect_stages(fn, *args)
+    else:
+        try:
+            result, stages = await loop.run_in_executor(pool, _collect_stages, fn, *args)
+        except BrokenProcessPool:
+            # محاولة واحدة على pool جديد: العملية التي ماتت قد تكون لطلب آخر؛
+            # إن كان هذا الملف هو السبب فسيفشل مرة ثانية وحده
+            _replace_broken_pool(pool)
+            pool = _get_image_pool()
+            try:
+                result, stages = await loop.run_in_executor(pool, _collect_stages, fn, *args)
+            except BrokenProcessPool:
+                _replace_broken_pool(pool)
+                raise
+    for stage, seconds in stages:
+        record_stage("images-to-pdf", stage, seconds)
+    return result
+
+
+# ------------ Streaming ZIP ------------
+class _ZipSink:
+    # كائن كتابة بلا seek: ZipFile يكتب data descriptors ونحن نرسل ما تجمّع فوراً
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _zip_method(data: bytes) -> int:
+    # PDF من صور (JPEG/Flate) مضغوط أصلاً — deflate يضيع وقتاً بلا فائدة
+    sample = data[:65536]
+    if sample and len(zlib.compress(sample, 1)) > 0.9 * len(sample):
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+async def _stream_zip(entries):
+    # entries: async iterator من (name, data) — كل عضو يُرسل بمجرد جاهزيته
+    sink = _ZipSink()
+    with ZipFile(sink, "w") as zf:
+        async for name, data in entries:
+            zf.writestr(name, data, compress_type=_zip_method(data))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ------------ Merge engine (qpdf, disk to disk) ------------
+# qpdf ينسخ الصفحات من الملفات إلى الناتج مباشرة => ذاكرة شبه ثابتة مهما كبر الناتج.
+# pypdf يبقي كل صفحة منسوخة في PdfWriter حتى write()، فنستخدمه فقط لـ dedupe أو إن غاب qpdf
+SPOOL_CHUNK = 1024 * 1024
+MERGE_TIMEOUT = float(os.getenv("MERGE_TIMEOUT", "300"))
+MERGE_FLATE_MIN = 1024  # streams بدون فلتر أكبر من هذا تُضغط Flate عند إزالة التكرار
+
+
+# pypdf لا يعرض قائمة كائنات الـ writer ولا بيانات الـ stream الخام (قبل فك الضغط) في API عام؛
+# كل وصول خاص يمر من هنا. حذف كائن = None في القائمة كما يفعل compress_identical_objects (pypdf >= 4.3)
+_PYPDF_OBJECTS = (
+    tuple(int(x) for x in re.findall(r"\d+", PYPDF_VERSION)[:2]) >= (4, 3)
+    and isinstance(getattr(PdfWriter(), "_objects", None), list)
+)
+
+
+class _WriterObjects:
+    def __init__(self, writer: PdfWriter):
+        self._objects = writer._objects
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __getitem__(self, idx: int):
+        return self._objects[idx]
+
+    def replace(self, idx: int, obj):
+        self._objects[idx] = obj
+
+    def drop(self, idx: int):
+        self._objects[idx] = None
+
+    def since(self, start: int) -> list:
+        return self._objects[start:]
+
+
+def _stream_bytes(obj: StreamObject) -> bytes:
+    # البيانات كما هي في الملف؛ get_data() يفك Flate وهو أبطأ بكثير للبصمة
+    data = getattr(obj, "_data", None)
+    return data if isinstance(data, bytes) else obj.get_data()
+
+
+def _replace_refs(obj, remap: dict):
+    items = obj.items() if isinstance(obj, DictionaryObject) else enumerate(obj)
+    for k, v in list(items):
+        if isinstance(v, IndirectObject):
+            if v.idnum in remap:
+                obj[k] = remap[v.idnum]
+        elif isinstance(v, (DictionaryObject, ArrayObject)):
+            _replace_refs(v, remap)
+
+
+class _StreamDeduper:
+    # ملفات من نفس المصدر (فواتير، تقارير) تحمل نفس الخطوط والشعارات وملفات ICC؛
+    # بعد إضافة صفحات كل مستند نبصم الـ streams الجديدة ونحيل المكرر منها إلى أول نسخة.
+    # على pypdf لا يطابق _PYPDF_OBJECTS لا نلمس الكائنات: الدمج يعمل بلا إزالة تكرار
+    def __init__(self, writer: PdfWriter):
+        self.writer = writer
+        self.objects = _WriterObjects(writer) if _PYPDF_OBJECTS else None
+        self.seen: dict = {}     # بصمة => IndirectObject لأول نسخة
+        self.digests: dict = {}  # idnum => بصمة (قبل إعادة الضغط)
+        self.mark = len(self.objects) if self.objects is not None else 0
+        self.shared = 0
+
+    def _value_key(self, value) -> str:
+        if isinstance(value, IndirectObject):
+            target = value.get_object()
+            if value.pdf is self.writer and isinstance(target, StreamObject):
+                return self._digest(target)
+            return f"{value.idnum} R"
+        if isinstance(value, DictionaryObject):
+            return "<<" + " ".join(f"{k} {self._value_key(value.raw_get(k))}" for k in sorted(value)) + ">>"
+        if isinstance(value, ArrayObject):
+            return "[" + " ".join(self._value_key(v) for v in value) + "]"
+        return repr(value)
+
+    def _digest(self, obj: StreamObject) -> str:
+        # البيانات الخام + القاموس؛ المراجع إلى streams أخرى (SMask, ICCBased) تدخل ببصمتها
+        idnum = obj.indirect_reference.idnum
+        if idnum not in self.digests:
+            self.digests[idnum] = f"cycle {idnum}"
+            h = hashlib.sha256(_stream_bytes(obj))
+            for k in sorted(obj):
+                if k != "/Length":
+                    h.update(f"{k} {self._value_key(obj.raw_get(k))}".encode())
+            self.digests[idnum] = h.hexdigest()
+        return self.digests[idnum]
+
+    def add_document(self, refs_from: int | None = None):
+        # refs_from: أين نبحث عن المراجع للنسخ المحذوفة (افتراضياً كائنات هذا المستند فقط)
+        objects = self.objects
+        if objects is None:
+            return
+        remap: dict = {}
+        for idx in range(self.mark, len(objects)):
+            obj = objects[idx]
+            if not isinstance(obj, StreamObject):
+                continue
+            ref = obj.indirect_reference
+            first = self.seen.setdefault(self._digest(obj), ref)
+            if first.idnum != ref.idnum:
+                remap[ref.idnum] = first
+                objects.drop(idx)
+                self.shared += 1
+            elif "/Filter" not in obj and len(_stream_bytes(obj)) >= MERGE_FLATE_MIN:
+                packed = obj.flate_encode(level=6)
+                packed.indirect_reference = ref
+                objects.replace(idx, packed)
+        if remap:
+            for obj in objects.since(self.mark if refs_from is None else refs_from):
+                if isinstance(obj, (DictionaryObject, ArrayObject)):
+                    _replace_refs(obj, remap)
+        self.mark = len(objects)
+
+
+def _parse_page_spec(spec: str | None) -> dict:
+    # "1:1-3,7;2:2-" => {1: [(1, 3), (7, 7)], 2: [(2, None)]}
+    # المفتاح = ترتيب الملف في الرفع (من 1) لا اسمه: الأسماء قد تتكرر أو تحتوي ; , :
+    # الترقيم من 1؛ "5-1" بترتيب عكسي؛ "3:" يستبعد الملف؛ الملفات غير المذكورة تُدمج كاملة
+    selection: dict = {}
+    for part in (spec or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        index, sep, ranges = part.partition(":")
+        try:
+            index = int(index)
+        except ValueError:
+            raise ValueError(part)
+        if not sep or index < 1:
+            raise ValueError(part)
+        out = selection.setdefault(index, [])
+        for r in ranges.split(","):
+            r = r.strip()
+            if not r:
+                continue
+            a, dash, b = (x.strip() for x in r.partition("-"))
+            try:
+                first = int(a) if a else 1
+                last = (int(b) if b else None) if dash else first
+            except ValueError:
+                raise ValueError(part)
+            if first < 1 or (last is not None and last < 1):
+                raise ValueError(part)
+            out.append((first, last))
+    return selection
+
+
+def _pick_pages(files: list, selection: dict) -> dict:
+    # ملف => نطاقاته، قبل أي فرز أو تصفية (المفاتيح ترتيب الرفع)؛ رقم بلا ملف => ValueError
+    unknown = [str(i) for i in selection if i > len(files)]
+    if unknown:
+        raise ValueError(", ".join(unknown))
+    return {f: selection.get(i) for i, f in enumerate(files, 1)}
+
+
+def _select_pages(count: int, ranges) -> Tuple[List[int], List[str]]:
+    # => فهارس الصفحات (من 0) بالترتيب المطلوب + النطاقات التي تتجاوز عدد الصفحات
+    picked: List[int] = []
+    missing: List[str] = []
+    for first, last in ranges:
+        last = count if last is None else last
+        if max(first, last) > count:
+            missing.append(str(first) if first == last else f"{first}-{last}")
+        seq = range(min(first, last) - 1, min(max(first, last), count))
+        picked += seq if first <= last else reversed(seq)
+    return picked, missing
+
+
+def _merge_sources(
+    writer: PdfWriter, sources, lang: str, progress=None, dedupe: bool = False, selection: list | None = None
+) -> Tuple[int, List[str]]:
+    # sources: [(name, stream)] — الـ stream يبقى مفتوحاً حتى writer.write
+    # selection: نطاقات كل مصدر بنفس ترتيب sources (None = كل الصفحات) — انظر _pick_pages
+    total_pages = 0
+    errors: List[str] = []
+    deduper = _StreamDeduper(writer) if dedupe else None
+    for i, (name, stream) in enumerate(sources):
+        try:
+            with timed("merge-pdf", "pdf_read"):
+                reader = PdfReader(stream)
+                if reader.is_encrypted:
+                    try:
+                        reader.decrypt("")  # محاولة كلمة مرور فارغة
+                    except Exception:
+                        errors.append(msg("password_protected", lang, name=name))
+                        continue
+                pages = reader.pages
+                ranges = selection[i] if selection else None
+                if ranges is not None:
+                    picked, missing = _select_pages(len(pages), ranges)
+                    if missing:
+                        errors.append(msg(
+                            "page_out_of_range", lang, name=name, pages=",".join(missing), count=len(pages)
+                        ))
+                    pages = [reader.pages[i] for i in picked]
+                for p in pages:
+                    writer.add_page(p)
+                    total_pages += 1
+                    if progress:
+                        progress()
+            if deduper:
+                with timed("merge-pdf", "dedupe"):
+                    deduper.add_document()
+        except Exception as e:
+            errors.append(msg("read_error", lang, name=name, error=e))
+    return total_pages, errors
+
+
+def _merge_files_to_disk(
+    entries: List[Tuple[str, Path]], dst: Path, lang: str, progress=None, dedupe: bool = False,
+    selection: list | None = None,
+) -> Tuple[int, List[str]]:
+    with ExitStack() as stack:
+        sources = [(name, stack.enter_context(open(path, "rb"))) for name, path in entries]
+        writer = PdfWriter()
+        total_pages, errors = _merge_sources(writer, sources, lang, progress, dedupe, selection)
+        if total_pages:
+            with timed("merge-pdf", "pdf_write"), open(dst, "wb") as out:
+                writer.write(out)
+    return total_pages, errors
+
+
+def _qpdf_ranges(picked: List[int]) -> str:
+    # فهارس من 0 => صيغة qpdf من 1: [0, 1, 2, 6, 4, 3] => "1-3,7,5-4" (النطاق العكسي مدعوم)
+    out, i = [], 0
+    while i < len(picked):
+        j = i
+        if i + 1 < len(picked) and abs(picked[i + 1] - picked[i]) == 1:
+            step = picked[i + 1] - picked[i]
+            while j + 1 < len(picked) and picked[j + 1] - picked[j] == step:
+                j += 1
+        out.append(str(picked[i] + 1) if i == j else f"{picked[i] + 1}-{picked[j] + 1}")
+        i = j + 1
+    return ",".join(out)
+
+
+def _plan_merge(
+    entries: List[Tuple[str, Path]], lang: str, progress=None, selection: list | None = None
+) -> Tuple[List[Tuple[Path, str]], int, List[str]]:
+    # => [(ملف، نطاقات qpdf)] + عدد الصفحات + الأخطاء. نقرأ شجرة الصفحات فقط، ملفاً واحداً كل مرة
+    plan: List[Tuple[Path, str]] = []
+    total_pages = 0
+    errors: List[str] = []
+    for i, (name, path) in enumerate(entries):
+        try:
+            with timed("merge-pdf", "pdf_read"):
+                reader = PdfReader(path)
+                if reader.is_encrypted:
+                    try:
+                        ok = reader.decrypt("")  # كلمة مرور فارغة؛ qpdf يجربها أيضاً
+                    except Exception:
+                        ok = False
+                    if not ok:
+                        errors.append(msg("password_protected", lang, name=name))
+                        continue
+                count = len(reader.pages)
+        except Exception as e:
+            errors.append(msg("read_error", lang, name=name, error=e))
+            continue
+        ranges = selection[i] if selection else None
+        picked = list(range(count))
+        if ranges is not None:
+            picked, missing = _select_pages(count, ranges)
+            if missing:
+                errors.append(msg("page_out_of_range", lang, name=name, pages=",".join(missing), count=count))
+        if not picked:
+            continue
+        plan.append((path, _qpdf_ranges(picked)))
+        total_pages += len(picked)
+        if progress:
+            for _ in picked:
+                progress()
+    return plan, total_pages, errors
+
+
+async def _merge_to_disk(
+    entries: List[Tuple[str, Path]], dst: Path, lang: str, progress=None, dedupe: bool = False,
+    selection: list | None = None,
+) -> Tuple[int, List[str]]:
+    if dedupe or QPDF_BIN is None:
+        # إزالة التكرار تحتاج المستند كاملاً في PdfWriter (ذاكرة تنمو مع الناتج)
+        return await asyncio.to_thread(_merge_files_to_disk, entries, dst, lang, progress, dedupe, selection)
+    plan, total_pages, errors = await asyncio.to_thread(_plan_merge, entries, lang, progress, selection)
+    if not total_pages:
+        return 0, errors
+    cmd = [QPDF_BIN, "--empty", "--pages"]
+    for path, ranges in plan:
+        cmd += [str(path), ranges]
+    cmd += ["--", str(dst)]
+    try:
+        code, out, err = await merge_pool.run(cmd, timeout=MERGE_TIMEOUT, stage="qpdf_merge")
+    except asyncio.TimeoutError:
+        dst.unlink(missing_ok=True)
+        raise JobError("pdf_creation_failed", error=f"timeout ({int(MERGE_TIMEOUT)}s)")
+    # 3 = تحذيرات فقط والناتج صالح
+    if code not in (0, 3) or not dst.exists():
+        dst.unlink(missing_ok=True)
+        raise JobError("pdf_creation_failed", error=(err or out or b"").decode("utf-8", "replace").strip())
+    return total_pages, errors
+
+
+# ------------ Upload ingestion (streaming to disk) ------------
+# الرفع يُكتب على القرص أثناء استقباله، ونفحص أول البايتات (magic) لكل ملف؛
+# الطلب يُقطع فور تجاوز الحدود أو وصول ملف من نوع خاطئ بدل انتظار الجسم كاملاً
+MAX_FILE_MB = int(os.getenv("MAX_FILE_MB", "100"))
+MAX_REQUEST_MB = int(os.getenv("MAX_REQUEST_MB", "500"))
+MAX_FIELD_BYTES = 64 * 1024
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", tempfile.gettempdir()))
+_SNIFF_BYTES = 1024  # ترويسة PDF قد تأتي بعد بايتات زائدة (حتى 1024 حسب المواصفة)
+
+# الحقل => (النوع المطلوب، التصرّف مع غيره): reject يقطع الطلب، skip يتجاهل الملف (الدمج)
+UPLOAD_FIELDS = {
+    "images": ("image", "reject"), "files": ("pdf", "skip"), "file": ("pdf", "reject"),
+    "document": ("office", "reject"),
+}
+_KIND_ERRORS = {"image": "not_image", "pdf": "must_be_pdf", "office": "not_office"}
+
+_IMAGE_MAGIC = (
+    b"\xff\xd8\xff",          # JPEG
+    b"\x89PNG\r\n\x1a\n",     # PNG
+    b"GIF87a", b"GIF89a",
+    b"BM",                     # BMP
+    b"II*\x00", b"MM\x00*",     # TIFF
+)
+
+
+def _sniff(head: bytes) -> str | None:
+    if head.startswith(_IMAGE_MAGIC) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP"):
+        return "image"
+    if b"%PDF-" in head:
+        return "pdf"
+    # OOXML/ODF (zip)، ملفات Office القديمة (OLE2)، RTF
+    if head.startswith((b"PK\x03\x04", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", b"{\\rtf")):
+        return "office"
+    return None
+
+
+class UploadRejected(Exception):
+    def __init__(self, status: int, key: str, **kwargs):
+        super().__init__(key)
+        self.status = status
+        self.key = key
+        self.kwargs = kwargs
+
+
+class IngestedFile(UploadFile):
+    # UploadFile على القرص مع ما عرفناه أثناء الاستقبال: path و kind و sha256
+    def __init__(self, field: str, filename: str, headers: Headers):
+        fd, path = tempfile.mkstemp(prefix="upload-", dir=UPLOAD_DIR)
+        super().__init__(os.fdopen(fd, "w+b"), size=0, filename=filename, headers=headers)
+        self.field = field
+        self.path = Path(path)
+        self.kind: str | None = None
+        self.sha256 = ""
+        self._digest = hashlib.sha256()
+        self._head: bytearray | None = bytearray()
+        self._skip = False
+
+    def discard(self):
+        self.file.close()
+        self.path.unlink(missing_ok=True)
+
+    async def close(self):
+        await super().close()
+        self.path.unlink(missing_ok=True)  # قد يكون نُقل (مجلد المهمة)
+
+
+class _UploadIngest:
+    def __init__(self, request: Request):
+        self.request = request
+        self.items: list = []
+        self.fields: dict = {}
+        self.files: List[IngestedFile] = []
+        self.received = 0
+        self._headers: list = []
+        self._header_name = b""
+        self._header_value = b""
+        self._field = ""
+        self._file: IngestedFile | None = None
+        self._data = bytearray()
+
+    @property
+    def lang(self) -> str:
+        # حقل lang يسبق الملفات في نماذج الواجهة
+        return normalize_lang(self.fields.get("lang") or self.request.query_params.get("lang"))
+
+    def on_part_begin(self):
+        self._headers = []
+        self._file = None
+        self._data = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers.append((self._header_name.lower(), self._header_value))
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        disposition = dict(self._headers).get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        if b"name" not in options:
+            raise UploadRejected(400, "bad_upload")
+        self._field = options[b"name"].decode("utf-8", "replace")
+        if b"filename" not in options:
+            return
+        if self._field == "images" and sum(f.field == "images" for f in self.files) >= MAX_IMAGES:
+            raise UploadRejected(400, "too_many_images", count=f"{MAX_IMAGES}+", max=MAX_IMAGES)
+        filename = options[b"filename"].decode("utf-8", "replace")
+        self._file = IngestedFile(self._field, filename, Headers(raw=self._headers))
+        self.files.append(self._file)
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            self._data += data[start:end]
+            if len(self._data) > MAX_FIELD_BYTES:
+                raise UploadRejected(400, "bad_upload")
+            return
+        self._write(self._file, data[start:end])
+
+    def on_part_end(self):
+        f = self._file
+        if f is None:
+            value = self._data.decode("utf-8", "replace")
+            self.fields[self._field] = value
+            self.items.append((self._field, value))
+            return
+        if not f.filename and not f.size and not f._head:
+            # حقل ملف فارغ من المتصفح (لم يُختر شيء)؛ ملف بلا اسم لكن له محتوى يبقى
+            self.files.remove(f)
+            f.discard()
+            return
+        if f._head is not None:
+            self._write(f, self._sniffed(f))
+        f.sha256 = f._digest.hexdigest()
+        f.file.seek(0)
+        self.items.append((f.field, f))
+
+    def _write(self, f: IngestedFile, chunk: bytes):
+        if f._head is not None:
+            f._head += chunk
+            if len(f._head) < _SNIFF_BYTES:
+                return
+            chunk = self._sniffed(f)
+        f.size += len(chunk)
+        if f.size > MAX_FILE_MB * 1024 * 1024:
+            raise UploadRejected(413, "file_too_large", name=f.filename, max=MAX_FILE_MB)
+        if not f._skip:
+            f._digest.update(chunk)
+            f.file.write(chunk)
+
+    def _sniffed(self, f: IngestedFile) -> bytes:
+        head, f._head = bytes(f._head), None
+        f.kind = _sniff(head)
+        expected, policy = UPLOAD_FIELDS.get(f.field, (None, None))
+        if expected and f.kind != expected:
+            if policy == "reject":
+                raise UploadRejected(400, _KIND_ERRORS[expected], name=f.filename)
+            f._skip = True  # يبقى في النموذج (kind=None) ليظهر في تفاصيل الأخطاء
+        return head
+
+    async def parse(self) -> FormData:
+        _, params = parse_options_header(self.request.headers.get("content-type"))
+        if b"boundary" not in params:
+            raise UploadRejected(400, "bad_upload")
+        parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        })
+        try:
+            async for chunk in self.request.stream():
+                self.received += len(chunk)
+                if self.received > MAX_REQUEST_MB * 1024 * 1024:
+                    raise UploadRejected(413, "request_too_large", max=MAX_REQUEST_MB)
+                # الكتابة على القرص خارج الـ event loop
+                await asyncio.to_thread(parser.write, chunk)
+            parser.finalize()
+        except BaseException as e:
+            for f in self.files:
+                f.discard()
+            if isinstance(e, FormParserError):
+                raise UploadRejected(400, "bad_upload") from e
+            raise
+        return FormData(self.items)
+
+
+class IngestRoute(APIRoute):
+    # يقرأ multipart بنفسه قبل FastAPI؛ أخطاء الرفع تعود JSON مترجمة وتُغلق الاتصال
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def ingest_handler(request: Request) -> Response:
+            if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+                return await handler(request)
+            ingest = _UploadIngest(request)
+            t0 = time.perf_counter()
+            try:
+                if int(request.headers.get("content-length") or 0) > MAX_REQUEST_MB * 1024 * 1024:
+                    raise UploadRejected(413, "request_too_large", max=MAX_REQUEST_MB)
+                request._form = await ingest.parse()  # FastAPI يستخدم النموذج الجاهز
+            except UploadRejected as e:
+                return JSONResponse(
+                    {"error": msg(e.key, ingest.lang, **e.kwargs)},
+                    status_code=e.status,
+                    headers={"Connection": "close"},
+                )
+            tool = _API_TOOLS.get(request.url.path)
+            if tool is None:
+                return await handler(request)
+            record_stage(tool, "upload_read", time.perf_counter() - t0)
+            form = request._form
+            uploads = [
+                (f.kind, f.path, f.filename or "file") for _, f in form.multi_items()
+                if isinstance(f, IngestedFile)
+            ]
+            image_opts = _image_opts(tool, form.get("compress"), _parse_max_dpi(form.get("max_dpi")), form.get("style"))
+            # الحد يُطبّق بعد الرفع: رفع بطيء لا يحجز مكاناً في صنف الأداة ولا في الميزانية
+            try:
+                with timed(tool, "estimate"):
+                    cost = await asyncio.to_thread(
+                        _estimate_cost, uploads, GS_WORKERS if tool == "compress-batch" else 0, image_opts
+                    )
+                return await _run_in_class(tool, lambda: handler(request), cost=cost)
+            except JobError as e:
+                return JSONResponse({"error": msg(e.key, ingest.lang, **e.kwargs)}, status_code=413)
+            except PoolBusy:
+                return JSONResponse(
+                    {"error": msg("server_busy", ingest.lang)}, status_code=503, headers={"Retry-After": "10"}
+                )
+
+        return ingest_handler
+
+
+app.router.route_class = IngestRoute
+
+
+# ------------ Result cache (content-addressed) ------------
+# RESULT_CACHE_TTL=0 أو RESULT_CACHE_MAX_MB=0 => تعطيل الكاش
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", Path(tempfile.gettempdir()) / "pdfweb-cache"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "512"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "600"))  # ثوانٍ — قصير عمداً للخصوصية
+RESULT_CACHE_EVICT_INTERVAL = 10.0  # ثوانٍ بين مسحين كاملين للمجلد
+
+
+class ResultCache:
+    # mtime = وقت الإنشاء (لا يُمدد أبداً => TTL مطلق للخصوصية)؛ atime = آخر استخدام (ترتيب LRU)
+    def __init__(self, root: Path, max_bytes: int, ttl: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._last_evict = 0.0
+        self._added = 0  # بايتات كُتبت منذ آخر مسح
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def key(self, tool: str, digests: List[str], params: dict) -> str:
+        h = hashlib.sha256(tool.encode())
+        h.update(json.dumps(params, sort_keys=True).encode())
+        for d in digests:
+            h.update(d.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Path | None:
+        if not self.enabled:
+            return None
+        path = self.root / key
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        if time.time() - st.st_mtime > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path, (time.time(), st.st_mtime))  # LRU فقط؛ mtime يبقى كما هو
+        except OSError:
+            return None
+        return path
+
+    def hold(self, key: str) -> Path | None:
+        # hard link خاص بالطلب: الإخلاء أو انتهاء الصلاحية لا يحذفه أثناء الإرسال؛ المستدعي يحذفه
+        path = self.get(key)
+        if path is None:
+            return None
+        held = self.root / f".hold-{os.urandom(8).hex()}"
+        try:
+            os.link(path, held)
+        except OSError:
+            return None
+        return held
+
+    def read(self, key: str) -> bytes | None:
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def put_bytes(self, key: str, data: bytes):
+        if not self.enabled:
+            return
+        self._store(key, lambda out: out.write(data))
+
+    def put_file(self, key: str, src: Path):
+        if not self.enabled:
+            return
+
+        def _copy(out):
+            with open(src, "rb") as fh:
+                shutil.copyfileobj(fh, out, SPOOL_CHUNK)
+
+        self._store(key, _copy)
+
+    def _store(self, key: str, write):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as out:
+                write(out)
+            os.replace(tmp, self.root / key)
+            self._added += (self.root / key).stat().st_size
+            # المسح الكامل مكلف (كل صفحة OCR تُخزَّن): مرة كل فترة أو بعد كتابة عُشر الحد
+            now = time.monotonic()
+            if now - self._last_evict > RESULT_CACHE_EVICT_INTERVAL or self._added > self.max_bytes // 10:
+                self._last_evict, self._added = now, 0
+                self._evict()
+        except OSError:
+            pass  # الكاش اختياري — لا نُفشل الطلب بسببه
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        total = 0
+        for p in self.root.iterdir():
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if p.name.startswith("."):
+                # .tmp-/.hold- تركها طلب انقطع فجأة
+                if now - st.st_mtime > max(self.ttl, 3600):
+                    p.unlink(missing_ok=True)
+                continue
+            if now - st.st_mtime > self.ttl:
+                p.unlink(missing_ok=True)
+                continue
+            entries.append((st.st_atime, st.st_size, p))
+            total += st.st_size
+        entries.sort()
+        limit = self.max_bytes
+        while entries and total > limit:
+            _, size, p = entries.pop(0)
+            p.unlink(missing_ok=True)
+            total -= size
+
+
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 1024 * 1024, RESULT_CACHE_TTL)
+
+
+def _file_response(
+    path: Path, media_type: str, filename: str, cache: str | None = "MISS", etag: str | None = None,
+    background=None,
+) -> FileResponse:
+    # من القرص مباشرة (sendfile/pathsend إن دعمه الخادم): Content-Length وETag وRange/If-Range
+    # => المتصفح يستأنف التنزيل المنقطع على الجوال بدل البدء من الصفر.
+    # etag = مفتاح المحتوى (مفتاح الكاش) حتى يتطابق بين MISS وHIT وبين workers مختلفة
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if cache:
+        headers["X-Cache"] = cache
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+    return FileResponse(path, media_type=media_type, headers=headers, background=background)
+
+
+def _cache_hit_response(key: str, media_type: str, filename: str) -> FileResponse | None:
+    held = result_cache.hold(key)
+    if held is None:
+        return None
+    # المفتاح يصف المحتوى => ETag ثابت
+    return _file_response(
+        held, media_type, filename, "HIT", etag=key, background=BackgroundTask(held.unlink, missing_ok=True)
+    )
+
+
 # ------------ Health / Infra ------------
 @app.get("/healthz", response_class=PlainTextResponse)
 def healthz():
     return "ok"
 
 
+_API_TOOLS = {
+    "/api/images-to-pdf": "images-to-pdf",
+    "/api/merge-pdf": "merge-pdf",
+    "/api/compress-pdf": "compress-pdf",
+    "/api/compress-pdf/batch": "compress-batch",
+    "/api/ocr-pdf": "ocr-pdf",
+    "/api/office-to-pdf": "office-to-pdf",
+    "/api/thumbnails": "thumbnails",
+}
+
+
+class MetricsMiddleware:
+    # ASGI خام لا BaseHTTPMiddleware: الطلب يبقى "قيد التنفيذ" حتى آخر جزء من الجسم
+    # (تنزيل ZIP متدفق أو ملف كبير)، لا حتى بداية الرد فقط
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        tool = _API_TOOLS.get(scope["path"]) if scope["type"] == "http" else None
+        if tool is None:
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        timings = [] if (SERVER_TIMING or headers.get("x-server-timing") == "1") else None
+        token = _request_timings.set(timings)
+        INFLIGHT.inc(tool=tool)
+        t0 = time.perf_counter()
+        done = False
+
+        def finish():
+            nonlocal done
+            if not done:
+                done = True
+                INFLIGHT.dec(tool=tool)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - t0
+                REQUEST_SECONDS.observe(elapsed, tool=tool, status=message["status"])
+                if timings is not None:
+                    # نجمع كل مرحلة (الصور تُعالج بالتوازي، فالمجموع وقت عمل لا وقت انتظار)
+                    totals: dict = {}
+                    for stage, seconds in timings:
+                        totals[stage] = totals.get(stage, 0.0) + seconds
+                    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+                    parts.append(f"total;dur={elapsed * 1000:.1f}")
+                    MutableHeaders(scope=message).append("Server-Timing", ", ".join(parts))
+            await send(message)
+            if message["type"] == "http.response.pathsend" or (
+                message["type"] == "http.response.body" and not message.get("more_body", False)
+            ):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()  # خطأ أو انقطاع العميل قبل آخر جزء
+            _request_timings.reset(token)
+
+
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    lines: List[str] = []
+    for m in METRICS:
+        lines += m.render()
+    # قيم لحظية تُقرأ عند الطلب
+    queued_jobs = _job_queue.qsize() if _job_queue is not None else 0
+    running_jobs = sum(1 for j in list(jobs.values()) if j["state"] == "running")
+    for name, help_text, value in (
+        ("pdfweb_gs_queue_depth", "Ghostscript runs waiting for a worker slot.", gs_pool.waiting),
+        ("pdfweb_gs_running", "Ghostscript processes currently running.", gs_pool.running),
+        ("pdfweb_gs_workers", "Ghostscript worker slots.", gs_pool.workers),
+        ("pdfweb_ocr_queue_depth", "OCR page steps waiting for a worker slot.", ocr_pool.waiting),
+        ("pdfweb_ocr_running", "pdftoppm/tesseract processes currently running.", ocr_pool.running),
+        ("pdfweb_thumb_queue_depth", "Thumbnail renders waiting for a worker slot.", thumb_pool.waiting),
+        ("pdfweb_office_queue_depth", "Office conversions waiting for a LibreOffice instance.", office_pool.waiting),
+        ("pdfweb_office_running", "Office conversions currently running.", office_pool.running),
+        ("pdfweb_memory_budget_bytes", "Admission memory budget of this process.", memory_budget.total),
+        ("pdfweb_memory_reserved_bytes", "Estimated memory reserved by admitted requests.", memory_budget.used),
+        ("pdfweb_memory_waiting", "Requests waiting for memory budget.", memory_budget.waiting),
+        ("pdfweb_jobs_queued", "Async jobs waiting in the queue.", queued_jobs),
+        ("pdfweb_jobs_running", "Async jobs currently running.", running_jobs),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+    for name, help_text, attr in (
+        ("pdfweb_class_running", "Requests running per tool concurrency class.", "running"),
+        ("pdfweb_class_waiting", "Requests waiting for a slot per tool concurrency class.", "waiting"),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f'{name}{{class="{c.name}"}} {getattr(c, attr)}' for c in TOOL_CLASSES.values()]
+    lines += [
+        "# HELP pdfweb_event_loop_lag_seconds Event loop scheduling delay (last sample).",
+        "# TYPE pdfweb_event_loop_lag_seconds gauge",
+        f"pdfweb_event_loop_lag_seconds {_loop_lag:.4f}",
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
 # HEAD / لفحص Render
 @app.head("/")
 def home_head():
@@ -228,64 +1555,116 @@ def robots_txt():
 @app.get("/sitemap.txt", response_class=PlainTextResponse)
 def sitemap_txt():
     base = os.getenv("RENDER_EXTERNAL_URL", "").rstrip("/")
-    paths = ["/", "/merge/pdf", "/compress/pdf", "/about", "/privacy", "/cookies", "/contact"]
+    paths = ["/", "/merge/pdf", "/compress/pdf", "/ocr/pdf", "/office/pdf", "/about", "/privacy", "/cookies", "/contact"]
     return "\n".join([(base + p) if base else p for p in paths])
 
 
-# ------------ Pages ------------
-@app.get("/", response_class=HTMLResponse)
-def home(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse(
-        "convert_images.html",
-        {"request": request, "title": "صور إلى PDF", "active": "img2pdf", "lang": lang},
+@app.get("/static/{path:path}")
+def static_file(request: Request, path: str, v: str | None = None):
+    asset = STATIC_ASSETS.get(path)
+    if asset is None:
+        return PlainTextResponse("Not Found", status_code=404)
+    digest, media_type, variants = asset
+    # بدون ?v= الصحيحة قد يتغير الملف لاحقاً => إعادة تحقق بالـ ETag
+    cache = f"public, max-age={STATIC_MAX_AGE}, immutable" if v == digest else "no-cache"
+    if variants is None:
+        return FileResponse(STATIC_DIR / path, media_type=media_type, headers={"Cache-Control": cache})
+    return _negotiated_response(request, variants, f'W/"{digest}"', media_type, {"Cache-Control": cache})
+
+
+# ------------ Pages (server-side i18n, cached per template+lang) ------------
+_I18N_ELEMENT = re.compile(
+    r'<(?P<tag>[a-zA-Z][a-zA-Z0-9]*)(?P<attrs>[^>]*?\sdata-i18n="(?P<key>[^"]+)"[^>]*)>(?P<body>.*?)</(?P=tag)>',
+    re.S,
+)
+_page_cache: dict = {}  # (template, lang) => ({ترميز: بايتات}, etag)
+
+
+def _translate_html(html: str, strings: dict) -> str:
+    # مثل سكربت الترجمة في المتصفح (textContent = النص) لكن مرة واحدة لكل (قالب، لغة)
+    def _sub(m):
+        text = strings.get(m["key"])
+        if not text or f"<{m['tag']}" in m["body"]:  # عنصر متداخل بنفس الوسم => نتركه كما هو
+            return m[0]
+        return f"<{m['tag']}{m['attrs']}>{html_escape(text, quote=False)}</{m['tag']}>"
+
+    return _I18N_ELEMENT.sub(_sub, html)
+
+
+def _page_lang(request: Request, lang: str | None) -> str:
+    # ?lang= أولاً ثم الكوكي التي يضعها مبدّل اللغة
+    return normalize_lang(lang or request.cookies.get("lang"))
+
+
+def render_page(request: Request, name: str, lang: str, title: str, title_key: str | None = None, **ctx) -> Response:
+    entry = _page_cache.get((name, lang))
+    if entry is None:
+        strings = LOCALES[lang]
+        html = templates.env.get_template(name).render(
+            title=strings.get(title_key, title), lang=lang, locale_urls={
+                code: static_url(f"locales/{code}.json") for code in sorted(SUPPORTED_LANGS)
+            }, **ctx,
+        )
+        body = _translate_html(html, strings).encode("utf-8")
+        variants = {"identity": body, "gzip": gzip.compress(body, 6, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=9)
+        entry = _page_cache[(name, lang)] = (variants, f'W/"{hashlib.sha256(body).hexdigest()[:16]}"')
+    variants, etag = entry
+    return _negotiated_response(
+        request, variants, etag, "text/html; charset=utf-8",
+        {"Cache-Control": "no-cache", "Content-Language": lang, "Vary": "Accept-Encoding, Cookie"},
     )
 
 
+@app.get("/", response_class=HTMLResponse)
+def home(request: Request, lang: str | None = None):
+    return render_page(request, "convert_images.html", _page_lang(request, lang), "صور إلى PDF", "img2pdf_title",
+                       active="img2pdf")
+
+
 @app.get("/merge/pdf", response_class=HTMLResponse)
-def merge_pdf_page(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse(
-        "merge_pdf.html",
-        {"request": request, "title": "دمج ملفات PDF", "active": "merge", "lang": lang},
-    )
+def merge_pdf_page(request: Request, lang: str | None = None):
+    return render_page(request, "merge_pdf.html", _page_lang(request, lang), "دمج ملفات PDF", "merge_title",
+                       active="merge")
 
 
 @app.get("/compress/pdf", response_class=HTMLResponse)
-def compress_pdf_page(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse(
-        "compress_pdf.html",
-        {"request": request, "title": "ضغط PDF", "active": "compress", "lang": lang},
-    )
+def compress_pdf_page(request: Request, lang: str | None = None):
+    return render_page(request, "compress_pdf.html", _page_lang(request, lang), "ضغط PDF", "compress_title",
+                       active="compress")
+
+
+@app.get("/ocr/pdf", response_class=HTMLResponse)
+def ocr_pdf_page(request: Request, lang: str | None = None):
+    return render_page(request, "ocr_pdf.html", _page_lang(request, lang), "التعرف على النص (OCR)", "ocr_title",
+                       active="ocr")
+
+
+@app.get("/office/pdf", response_class=HTMLResponse)
+def office_pdf_page(request: Request, lang: str | None = None):
+    return render_page(request, "office_pdf.html", _page_lang(request, lang), "Office إلى PDF", "office_title",
+                       active="office")
 
 
 @app.get("/about", response_class=HTMLResponse)
-def about(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse("about.html", {"request": request, "title": "من نحن", "lang": lang})
+def about(request: Request, lang: str | None = None):
+    return render_page(request, "about.html", _page_lang(request, lang), "من نحن", "about_title")
 
 
 @app.get("/privacy", response_class=HTMLResponse)
-def privacy(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse(
-        "privacy.html", {"request": request, "title": "سياسة الخصوصية", "lang": lang}
-    )
+def privacy(request: Request, lang: str | None = None):
+    return render_page(request, "privacy.html", _page_lang(request, lang), "سياسة الخصوصية", "privacy_title")
 
 
 @app.get("/cookies", response_class=HTMLResponse)
-def cookies(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse(
-        "cookies.html", {"request": request, "title": "سياسة ملفات الارتباط", "lang": lang}
-    )
+def cookies(request: Request, lang: str | None = None):
+    return render_page(request, "cookies.html", _page_lang(request, lang), "سياسة ملفات الارتباط", "cookies_title")
 
 
 @app.get("/contact", response_class=HTMLResponse)
-def contact(request: Request, lang: str = "ar"):
-    lang = normalize_lang(lang)
-    return templates.TemplateResponse("contact.html", {"request": request, "title": "اتصل بنا", "lang": lang})
+def contact(request: Request, lang: str | None = None):
+    return render_page(request, "contact.html", _page_lang(request, lang), "اتصل بنا", "contact_title")
 
 
 # ------------ APIs ------------
@@ -297,9 +1676,13 @@ async def images_to_pdf(
     per_file: str = Form(None),      # "1" => PDF per image (zipped)
     style: str = Form("full_bleed"), # full_bleed | a4_margins
     compress: str = Form(None),      # "1" to recompress non-JPEG for smaller PDFs
+    max_dpi: str = Form(""),         # "", "300", "200", "150" => تصغير الصور إلى دقة الصفحة
+    linearize: str = Form(None),     # "1" => Fast Web View
     lang: str = Form("ar"),
 ):
     lang = normalize_lang(lang)
+    max_dpi = _parse_max_dpi(max_dpi)
+    linearize = linearize == "1"
 
     if not images:
         return JSONResponse({"error": msg("no_images", lang)}, status_code=400)
@@ -314,86 +1697,115 @@ async def images_to_pdf(
     elif order == "mtime":
         images.sort(key=lambda f: getattr(getattr(f, "spooled", None), "mtime", time.time()))
 
-    singles: List[Tuple[str, bytes]] = []
-    layout_fun = _layout_a4_with_margins(8.0) if style == "a4_margins" else None
-    pdf_writer_bytes = BytesIO()
+    # النوع فُحص أثناء الرفع (magic bytes)؛ الملفات على القرص
+    BYTES_IN.inc(sum(f.size for f in images), tool="images-to-pdf")
+
+    if not outfile.lower().endswith(".pdf"):
+        outfile += ".pdf"
+
+    digests = [f.sha256 for f in images]
+    cache_params = {
+        "order": order, "per_file": per_file == "1", "style": style, "compress": compress == "1",
+        "max_dpi": max_dpi, "linearize": linearize,
+    }
+    if per_file == "1":
+        # أسماء الملفات تدخل في الـ ZIP
+        cache_params["names"] = [f.filename or "image" for f in images]
+    cache_key = result_cache.key("images-to-pdf", digests, cache_params)
+    if per_file == "1":
+        hit = _cache_hit_response(cache_key, "application/zip", "images_pdf.zip")
+    else:
+        hit = _cache_hit_response(cache_key, "application/pdf", outfile)
+    if hit is not None:
+        return hit
 
     if per_file == "1":
-        for f in images:
-            if not (f.content_type or "").startswith("image/"):
-                return JSONResponse(
-                    {"error": msg("not_image", lang, name=f.filename)},
-                    status_code=400,
-                )
+        tasks = [
+            asyncio.ensure_future(_run_image_job(_image_to_pdf, str(f.path), compress, style, max_dpi))
+            for f in images
+        ]
+        # ننتظر الصورة الأولى فقط: خطأ مبكر => 400 كالسابق، وإلا يبدأ الإرسال فوراً
+        try:
+            await tasks[0]
+        except Exception as e:
+            for t in tasks:
+                t.cancel()
+            return JSONResponse(
+                {"error": msg("image_process_failed", lang, name=images[0].filename, error=e)},
+                status_code=400,
+            )
+
+        failed: List[str] = []
+
+        async def _members():
+            # بالترتيب المطلوب؛ الأخطاء اللاحقة تُجمع في errors.txt داخل الـ ZIP
+            for f, task in zip(images, tasks):
+                try:
+                    pdf_bytes = await task
+                except Exception as e:
+                    failed.append(msg("image_process_failed", lang, name=f.filename, error=e))
+                    continue
+                yield (f.filename or "image").rsplit(".", 1)[0] + ".pdf", pdf_bytes
+            if failed:
+                yield "errors.txt", "\n".join(failed).encode("utf-8")
+
+        async def _body():
+            spool = tempfile.NamedTemporaryFile(prefix="zip-", delete=False) if result_cache.enabled else None
+            complete = False
             try:
-                data = await f.read()
-                with Image.open(BytesIO(data)) as img:
-                    img = _auto_orient(img)
-                    if compress == "1" and (img.format or "").upper() != "JPEG":
-                        data_bytes = _compress_to_jpeg_bytes(img)
-                    else:
-                        data_bytes = data if (img.format or "").upper() == "JPEG" else _compress_to_jpeg_bytes(img)
-                pdf_bytes = (
-                    img2pdf.convert(data_bytes)
-                    if style == "full_bleed"
-                    else img2pdf.convert(data_bytes, layout_fun=layout_fun)
-                )
-                name = (f.filename or "image").rsplit(".", 1)[0] + ".pdf"
-                singles.append((name, pdf_bytes))
-            except Exception as e:
-                return JSONResponse(
-                    {"error": msg("image_process_failed", lang, name=f.filename, error=e)},
-                    status_code=400,
-                )
+                async for chunk in _stream_zip(_members()):
+                    if spool:
+                        spool.write(chunk)
+                    BYTES_OUT.inc(len(chunk), tool="images-to-pdf")
+                    yield chunk
+                complete = not failed
+                IMAGES.inc(len(tasks) - len(failed))
+                PAGES.inc(len(tasks) - len(failed), tool="images-to-pdf")
+            finally:
+                for t in tasks:
+                    t.cancel()
+                if spool:
+                    spool.close()
+                    if complete:
+                        await asyncio.to_thread(result_cache.put_file, cache_key, Path(spool.name))
+                    os.unlink(spool.name)
 
-        zip_bytes = BytesIO()
-        with ZipFile(zip_bytes, "w", ZIP_DEFLATED) as zf:
-            for name, blob in singles:
-                zf.writestr(name, blob)
-        zip_bytes.seek(0)
         return StreamingResponse(
-            zip_bytes,
+            _body(),
             media_type="application/zip",
-            headers={"Content-Disposition": 'attachment; filename="images_pdf.zip"'},
+            headers={"Content-Disposition": 'attachment; filename="images_pdf.zip"', "X-Cache": "MISS"},
         )
 
     try:
-        img_streams: List[bytes] = []
-        for f in images:
-            if not (f.content_type or "").startswith("image/"):
-                return JSONResponse(
-                    {"error": msg("not_image", lang, name=f.filename)},
-                    status_code=400,
-                )
-            data = await f.read()
-            with Image.open(BytesIO(data)) as img:
-                img = _auto_orient(img)
-                if compress == "1" and (img.format or "").upper() != "JPEG":
-                    data_bytes = _compress_to_jpeg_bytes(img)
-                else:
-                    data_bytes = data if (img.format or "").upper() == "JPEG" else _compress_to_jpeg_bytes(img)
-            img_streams.append(data_bytes)
-
-        pdf_data = (
-            img2pdf.convert(img_streams)
-            if style == "full_bleed"
-            else img2pdf.convert(img_streams, layout_fun=layout_fun)
+        img_streams = await asyncio.gather(
+            *(_run_image_job(_prepare_image, str(f.path), compress, max_dpi, style) for f in images)
         )
-        pdf_writer_bytes.write(pdf_data)
+
+        pdf_data = await asyncio.to_thread(_convert_to_pdf, img_streams, style)
     except Exception as e:
         return JSONResponse(
             {"error": msg("pdf_creation_failed", lang, error=e)},
             status_code=500,
         )
 
-    pdf_writer_bytes.seek(0)
-    if not outfile.lower().endswith(".pdf"):
-        outfile += ".pdf"
-
-    return StreamingResponse(
-        pdf_writer_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{outfile}"'},
+    tmp = Path(tempfile.mkdtemp(prefix="img2pdf-"))
+    dst = tmp / "out.pdf"
+    try:
+        await asyncio.to_thread(dst.write_bytes, pdf_data)
+        del pdf_data
+        if linearize:
+            await _linearize(dst)
+        await asyncio.to_thread(result_cache.put_file, cache_key, dst)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    IMAGES.inc(len(img_streams))
+    PAGES.inc(len(img_streams), tool="images-to-pdf")
+    BYTES_OUT.inc(dst.stat().st_size, tool="images-to-pdf")
+
+    return _file_response(
+        dst, "application/pdf", outfile, etag=cache_key,
+        background=BackgroundTask(shutil.rmtree, tmp, ignore_errors=True),
     )
 
 
@@ -402,153 +1814,2216 @@ async def merge_pdf(
     files: List[UploadFile] = File(...),
     outfile: str = Form("merged.pdf"),
     order: str = Form("name"),   # name | as_is
+    dedupe: str = Form(None),    # "1" => مشاركة الموارد المتطابقة (خطوط، شعارات) بين الملفات
+    pages: str = Form(None),     # اختيار صفحات بترتيب الرفع: "1:1-3,7;2:2-"
+    linearize: str = Form(None), # "1" => Fast Web View
     lang: str = Form("ar"),
 ):
     lang = normalize_lang(lang)
+    dedupe = dedupe == "1"
+    linearize = linearize == "1"
 
     if not files:
         return JSONResponse({"error": msg("no_files", lang)}, status_code=400)
+    try:
+        picks = _pick_pages(files, _parse_page_spec(pages))
+    except ValueError as e:
+        return JSONResponse({"error": msg("bad_page_range", lang, spec=e)}, status_code=400)
 
     if order == "name":
         files.sort(key=lambda f: (f.filename or "").lower())
 
-    writer = PdfWriter()
-    total_pages = 0
-    errors = []
+    if not outfile.lower().endswith(".pdf"):
+        outfile += ".pdf"
 
+    errors: List[str] = []
+    accepted: List[UploadFile] = []
     for f in files:
-        name = f.filename or "file.pdf"
-        if not (name.lower().endswith(".pdf") or (f.content_type or "").endswith("pdf")):
-            errors.append(msg("not_pdf", lang, name=name))
+        # غير الـ PDF لم يُكتب على القرص أصلاً (فحص magic أثناء الرفع)
+        if f.kind != "pdf":
+            errors.append(msg("not_pdf", lang, name=f.filename or "file.pdf"))
             continue
-        data = await f.read()
-        try:
-            reader = PdfReader(BytesIO(data))
-            if reader.is_encrypted:
-                try:
-                    reader.decrypt("")  # محاولة كلمة مرور فارغة
-                except Exception:
-                    errors.append(msg("password_protected", lang, name=name))
-                    continue
-            for p in reader.pages:
-                writer.add_page(p)
-                total_pages += 1
-        except Exception as e:
-            errors.append(msg("read_error", lang, name=name, error=e))
+        accepted.append(f)
+    BYTES_IN.inc(sum(f.size for f in accepted), tool="merge-pdf")
+    digests = [f.sha256 for f in accepted]
+    selection = [picks[f] for f in accepted]
+    # الاختيار بحسب ترتيب الملفات لا أسمائها، فنفس المحتوى بأسماء أخرى يصيب الكاش
+    cache_params = {"order": order, "dedupe": dedupe, "pages": selection, "linearize": linearize}
+
+    # الرفع على القرص أصلاً؛ qpdf يكتب الناتج على القرص ونرسله عبر FileResponse (sendfile)
+    tmp = Path(tempfile.mkdtemp(prefix="merge-"))
+    try:
+        entries = [(f.filename or "file.pdf", f.path) for f in accepted]
+        cache_key = result_cache.key("merge-pdf", digests, cache_params)
+        hit = _cache_hit_response(cache_key, "application/pdf", outfile)
+        if hit is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return hit
+
+        dst = tmp / "out.pdf"
+        total_pages, read_errors = await _merge_to_disk(entries, dst, lang, None, dedupe, selection)
+        errors += read_errors
+        if total_pages:
+            if linearize:
+                await _linearize(dst)
+            await asyncio.to_thread(result_cache.put_file, cache_key, dst)
+    except PoolBusy:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "10"})
+    except JobError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg(e.key, lang, **e.kwargs), "details": errors}, status_code=500)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
 
     if total_pages == 0:
+        shutil.rmtree(tmp, ignore_errors=True)
         return JSONResponse(
             {"error": msg("no_valid_pages", lang), "details": errors},
             status_code=400,
         )
 
-    buf = BytesIO()
-    writer.write(buf)
-    buf.seek(0)
+    PAGES.inc(total_pages, tool="merge-pdf")
+    BYTES_OUT.inc(dst.stat().st_size, tool="merge-pdf")
+    return _file_response(
+        dst, "application/pdf", outfile, etag=cache_key,
+        background=BackgroundTask(shutil.rmtree, tmp, ignore_errors=True),
+    )
 
-    if not outfile.lower().endswith(".pdf"):
-        outfile += ".pdf"
 
-    return StreamingResponse(
-        buf,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{outfile}"'},
-    )
+# ------------ Ghostscript engine ------------
+GS_BIN = shutil.which("gs")  # يُحسب مرة واحدة عند الإقلاع
+GS_WORKERS = int(os.getenv("GS_WORKERS", "0")) or (os.cpu_count() or 1)
+GS_MAX_QUEUE = int(os.getenv("GS_MAX_QUEUE", "32"))      # أقصى عدد طلبات منتظرة
+GS_MAX_WAIT = float(os.getenv("GS_MAX_WAIT", "60"))      # أقصى انتظار في الطابور (ثوانٍ)
+GS_TIMEOUT = float(os.getenv("GS_TIMEOUT", "180"))
 
 
-# ------------ Compress PDF API (Ghostscript) ------------
-@app.post("/api/compress-pdf")
-async def compress_pdf(
-    file: UploadFile = File(...),
-    outfile: str = Form("compressed.pdf"),
-    level: str = Form("medium"),     # low | medium | high
-    dpi: str = Form("150"),          # "", "150", "120", "96", "72"
-    grayscale: str = Form(None),     # "1" or None
-    lang: str = Form("ar"),
-):
-    lang = normalize_lang(lang)
+class PoolBusy(Exception):
+    pass
 
-    if not file:
-        return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
-    if not (file.filename or "").lower().endswith(".pdf"):
-        return JSONResponse({"error": msg("must_be_pdf", lang)}, status_code=400)
 
-    # تأكد من تواجد Ghostscript
-    if shutil.which("gs") is None:
-        return JSONResponse(
-            {"error": msg("gs_missing", lang)},
-            status_code=500,
-        )
+class ClientDisconnected(Exception):
+    pass
+
+
+class SubprocessPool:
+    # طابور محدود لأدوات خارجية ثقيلة (gs, pdftoppm, tesseract): عدد ثابت من العمليات المتزامنة
+    def __init__(self, workers: int, max_queue: int, max_wait: float, tool: str = "compress-pdf"):
+        self.tool = tool
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(workers)  # المنتظرون يُخدمون بالترتيب (FIFO)
+
+    async def run(
+        self, cmd: List[str], timeout: float = GS_TIMEOUT, stage: str = "gs", env: dict | None = None
+    ) -> Tuple[int, bytes, bytes]:
+        if self.waiting >= self.max_queue:
+            raise PoolBusy()
+        self.waiting += 1
+        try:
+            with timed(self.tool, stage + "_queue"):
+                await asyncio.wait_for(self._sem.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            raise PoolBusy()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env
+            )
+            try:
+                with timed(self.tool, stage):
+                    out, err = await asyncio.wait_for(proc.communicate(), timeout)
+            except BaseException:
+                # timeout أو إلغاء (انقطاع العميل) => نقتل العملية فوراً
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+                raise
+            return proc.returncode, out, err
+        finally:
+            self.running -= 1
+            self._sem.release()
+
+
+gs_pool = SubprocessPool(GS_WORKERS, GS_MAX_QUEUE, GS_MAX_WAIT)
+
+
+async def _run_until_disconnect(request: Request, coro, poll: float = 1.0):
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+            raise ClientDisconnected()
 
+
+def _build_gs_cmd(
+    src: Path, dst: Path, level: str, dpi: str, grayscale: str | None,
+    first_page: int | None = None, last_page: int | None = None,
+) -> List[str]:
     pdfsettings = {
         "low": "/screen",     # أصغر حجم
         "medium": "/ebook",   # موصى به
         "high": "/printer"    # جودة أعلى
     }.get(level, "/ebook")
 
-    with tempfile.TemporaryDirectory() as tmp:
-        src = Path(tmp) / "in.pdf"
-        dst = Path(tmp) / "out.pdf"
-        src.write_bytes(await file.read())
+    cmd = [
+        GS_BIN or "gs", "-sDEVICE=pdfwrite",
+        "-dCompatibilityLevel=1.4",
+        f"-dPDFSETTINGS={pdfsettings}",
+        "-dNOPAUSE", "-dQUIET", "-dBATCH",
+    ]
 
-        cmd = [
-            "gs", "-sDEVICE=pdfwrite",
-            "-dCompatibilityLevel=1.4",
-            f"-dPDFSETTINGS={pdfsettings}",
-            "-dNOPAUSE", "-dQUIET", "-dBATCH",
+    # Downsampling
+    if dpi:
+        try:
+            val = int(dpi)
+            cmd += [
+                "-dColorImageDownsampleType=/Average",
+                f"-dColorImageResolution={val}",
+                "-dGrayImageDownsampleType=/Average",
+                f"-dGrayImageResolution={val}",
+                "-dMonoImageDownsampleType=/Subsample",
+                f"-dMonoImageResolution={val}",
+            ]
+        except Exception:
+            pass
+
+    # تدرّج رمادي اختياري
+    if grayscale == "1":
+        cmd += [
+            "-sColorConversionStrategy=Gray",
+            "-dProcessColorModel=/DeviceGray",
+            "-dConvertCMYKImagesToRGB=true",
         ]
 
-        # Downsampling
-        if dpi:
-            try:
-                val = int(dpi)
-                cmd += [
-                    "-dColorImageDownsampleType=/Average",
-                    f"-dColorImageResolution={val}",
-                    "-dGrayImageDownsampleType=/Average",
-                    f"-dGrayImageResolution={val}",
-                    "-dMonoImageDownsampleType=/Subsample",
-                    f"-dMonoImageResolution={val}",
-                ]
-            except Exception:
-                pass
+    # نطاق صفحات (للضغط المجزّأ)
+    if first_page is not None:
+        cmd += [f"-dFirstPage={first_page}", f"-dLastPage={last_page}"]
 
-        # تدرّج رمادي اختياري
-        if grayscale == "1":
-            cmd += [
-                "-sColorConversionStrategy=Gray",
-                "-dProcessColorModel=/DeviceGray",
-                "-dConvertCMYKImagesToRGB=true",
-            ]
+    cmd += ["-sOutputFile=" + str(dst), str(src)]
+    return cmd
 
-        cmd += ["-sOutputFile=" + str(dst), str(src)]
 
-        try:
-            proc = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=180,
-            )
-            if not dst.exists():
-                detail = proc.stderr or proc.stdout or ""
-                return JSONResponse(
-                    {"error": msg("compress_failed", lang, detail=detail)},
-                    status_code=500,
-                )
-            data = dst.read_bytes()
-        except Exception as e:
-            return JSONResponse(
-                {"error": msg("compress_engine_failed", lang, error=e)},
-                status_code=500,
-            )
+# ------------ Linearized output (qpdf, Fast Web View) ------------
+# linearize=1 => الصفحة الأولى ومراجعها في بداية الملف؛ عارض الجوال يعرضها قبل اكتمال التنزيل.
+# qpdf بعد كل الأدوات (حتى الضغط: دمج الأجزاء عبر pypdf يُفسد خطية gs)
+QPDF_BIN = shutil.which("qpdf")
+QPDF_TIMEOUT = float(os.getenv("QPDF_TIMEOUT", "60"))
+
+qpdf_pool = SubprocessPool(GS_WORKERS, GS_MAX_QUEUE, GS_MAX_WAIT, tool="linearize")
+merge_pool = SubprocessPool(GS_WORKERS, GS_MAX_QUEUE, GS_MAX_WAIT, tool="merge-pdf")
+
+
+async def _linearize(path: Path) -> bool:
+    # تحسين اختياري: أي فشل (أو غياب qpdf) يترك الملف كما هو
+    if QPDF_BIN is None:
+        return False
+    out = path.with_name(path.name + ".lin")
+    try:
+        code, _, _ = await qpdf_pool.run(
+            [QPDF_BIN, "--linearize", str(path), str(out)], timeout=QPDF_TIMEOUT, stage="qpdf"
+        )
+    except (PoolBusy, asyncio.TimeoutError, OSError):
+        code = -1
+    # 3 = تحذيرات فقط والناتج صالح
+    if code not in (0, 3) or not out.exists():
+        out.unlink(missing_ok=True)
+        return False
+    os.replace(out, path)
+    return True
+
+
+# ------------ Chunked compression (parallel gs) ------------
+GS_CHUNK_MIN_PAGES = int(os.getenv("GS_CHUNK_MIN_PAGES", "80"))  # أو الحجم أدناه => تجزئة
+GS_CHUNK_MIN_MB = int(os.getenv("GS_CHUNK_MIN_MB", "25"))
+GS_CHUNK_PAGES = int(os.getenv("GS_CHUNK_PAGES", "25"))          # أقل عدد صفحات لكل جزء
+# أقصى أجزاء متزامنة لطلب واحد: ملف ضخم واحد لا يحجز كل GS_WORKERS ولا يملأ طابور gs_pool
+GS_CHUNK_PARALLEL = int(os.getenv("GS_CHUNK_PARALLEL", "0")) or max(1, GS_WORKERS // 2)
+
+
+def _count_pages(path: Path) -> int:
+    try:
+        reader = PdfReader(path)
+        if reader.is_encrypted:
+            return 0
+        return len(reader.pages)
+    except Exception:
+        return 0
+
+
+def _plan_chunks(pages: int, size: int) -> List[Tuple[int, int]]:
+    # يعيد نطاقات صفحات (1-based، شاملة) أو [] لتشغيل gs واحد
+    if pages < GS_CHUNK_MIN_PAGES and size < GS_CHUNK_MIN_MB * 1024 * 1024:
+        return []
+    n = min(GS_CHUNK_PARALLEL, pages // max(GS_CHUNK_PAGES, 1))
+    if n < 2:
+        return []
+    step, extra = divmod(pages, n)
+    ranges = []
+    first = 1
+    for i in range(n):
+        last = first + step - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+def _copy_outline(reader: PdfReader, writer: PdfWriter, items, parent=None):
+    last = None
+    for item in items:
+        if isinstance(item, list):
+            if last is not None:
+                _copy_outline(reader, writer, item, last)
+            continue
+        try:
+            page = reader.get_destination_page_number(item)
+        except Exception:
+            continue
+        if page is None or page < 0:
+            continue
+        last = writer.add_outline_item(item.title, page, parent=parent)
+
+
+def _stitch_chunks(src: Path, parts: List[Path], dst: Path):
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(str(part), import_outline=False)
+    # gs يُسقط العلامات المرجعية عند تحديد نطاق صفحات => ننسخها من الأصل
+    reader = PdfReader(src)
+    try:
+        _copy_outline(reader, writer, reader.outline)
+    except Exception:
+        pass
+    if reader.metadata:
+        writer.add_metadata({k: v for k, v in reader.metadata.items() if isinstance(v, str)})
+    with open(dst, "wb") as out:
+        writer.write(out)
+
+
+async def _compress_chunked(
+    src: Path, dst: Path, ranges: List[Tuple[int, int]], level: str, dpi: str, grayscale: str | None,
+    on_part_done=None,
+) -> Tuple[int, bytes, bytes]:
+    parts = [dst.with_name(f"part-{i}.pdf") for i in range(len(ranges))]
+    sem = asyncio.Semaphore(GS_CHUNK_PARALLEL)
+
+    async def _part(part: Path, first: int, last: int):
+        async with sem:
+            result = await gs_pool.run(_build_gs_cmd(src, part, level, dpi, grayscale, first, last))
+        if on_part_done:
+            on_part_done()
+        return result
+
+    tasks = [asyncio.ensure_future(_part(part, first, last)) for part, (first, last) in zip(parts, ranges)]
+    try:
+        # أول فشل (PoolBusy/timeout) يُلغي البقية => gs_pool.run يقتل عملياتهم بدل تركها بلا منتظر
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+        results = [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for part, result in zip(parts, results):
+        if not part.exists():
+            return result
+    with timed("compress-pdf", "stitch"):
+        await asyncio.to_thread(_stitch_chunks, src, parts, dst)
+    return 0, b"", b""
+
+
+# ------------ Compress PDF API (Ghostscript) ------------
+@app.post("/api/compress-pdf")
+async def compress_pdf(
+    request: Request,
+    file: UploadFile = File(...),
+    outfile: str = Form("compressed.pdf"),
+    level: str = Form("medium"),     # low | medium | high
+    dpi: str = Form("150"),          # "", "150", "120", "96", "72"
+    grayscale: str = Form(None),     # "1" or None
+    linearize: str = Form(None),     # "1" => Fast Web View
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    linearize = linearize == "1"
+
+    # محتوى الملف (وليس امتداده) فُحص أثناء الرفع
+    if not file:
+        return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
+
+    # تأكد من تواجد Ghostscript
+    if GS_BIN is None:
+        return JSONResponse(
+            {"error": msg("gs_missing", lang)},
+            status_code=500,
+        )
 
     if not outfile.lower().endswith(".pdf"):
         outfile += ".pdf"
 
+    # تطبيع المعاملات حتى تتطابق مفاتيح الكاش بين المحاولات
+    level = level if level in ("low", "medium", "high") else "medium"
+    try:
+        dpi = str(int(dpi)) if dpi else ""
+    except ValueError:
+        dpi = ""
+    grayscale = "1" if grayscale == "1" else None
+
+    src = file.path
+    BYTES_IN.inc(file.size, tool="compress-pdf")
+
+    cache_key = result_cache.key(
+        "compress-pdf", [file.sha256],
+        {"level": level, "dpi": dpi, "grayscale": grayscale == "1", "linearize": linearize},
+    )
+    hit = _cache_hit_response(cache_key, "application/pdf", outfile)
+    if hit is not None:
+        return hit
+
+    tmp = Path(tempfile.mkdtemp(prefix="compress-"))
+    dst = tmp / "out.pdf"
+    try:
+        with timed("compress-pdf", "page_count"):
+            pages = await asyncio.to_thread(_count_pages, src)
+        ranges = _plan_chunks(pages, src.stat().st_size)
+        if ranges:
+            job = _compress_chunked(src, dst, ranges, level, dpi, grayscale)
+        else:
+            job = gs_pool.run(_build_gs_cmd(src, dst, level, dpi, grayscale))
+
+        _, out, err = await _run_until_disconnect(request, job)
+        if not dst.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+            detail = (err or out or b"").decode("utf-8", "replace")
+            return JSONResponse(
+                {"error": msg("compress_failed", lang, detail=detail)},
+                status_code=500,
+            )
+        if linearize:
+            await _linearize(dst)
+        await asyncio.to_thread(result_cache.put_file, cache_key, dst)
+        PAGES.inc(pages, tool="compress-pdf")
+        BYTES_OUT.inc(dst.stat().st_size, tool="compress-pdf")
+    except PoolBusy:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse(
+            {"error": msg("server_busy", lang)},
+            status_code=503,
+            headers={"Retry-After": "10"},
+        )
+    except ClientDisconnected:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse(
+            {"error": msg("compress_engine_failed", lang, error=f"timeout ({int(GS_TIMEOUT)}s)")},
+            status_code=500,
+        )
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse(
+            {"error": msg("compress_engine_failed", lang, error=e)},
+            status_code=500,
+        )
+
+    return _file_response(
+        dst, "application/pdf", outfile, etag=cache_key,
+        background=BackgroundTask(shutil.rmtree, tmp, ignore_errors=True),
+    )
+
+
+async def _compress_batch_file(
+    f: UploadFile, dst: Path, params: dict, sem: asyncio.Semaphore, lang: str
+) -> Tuple[dict, Path | None]:
+    # => (سطر الحالة، ملف الناتج أو None). نفس مفتاح الكاش للضغط الفردي
+    entry = {"name": f.filename or "file.pdf", "status": "ok", "in": f.size}
+    if f.kind != "pdf":
+        entry.update(status="not_pdf", error=msg("not_pdf", lang, name=entry["name"]))
+        return entry, None
+    cache_key = result_cache.key(
+        "compress-pdf", [f.sha256], {**params, "grayscale": params["grayscale"] == "1", "linearize": False}
+    )
+    # hard link خاص بنا: الإخلاء بين البحث والنسخ لا يُسقط الـ ZIP كله؛ أي فشل => نعود إلى gs
+    held = await asyncio.to_thread(result_cache.hold, cache_key)
+    if held is not None:
+        try:
+            await asyncio.to_thread(shutil.move, held, dst)
+        except OSError:
+            held.unlink(missing_ok=True)
+            held = None
+    if held is None:
+        try:
+            async with sem:
+                _, out, err = await gs_pool.run(
+                    _build_gs_cmd(f.path, dst, params["level"], params["dpi"], params["grayscale"])
+                )
+        except asyncio.TimeoutError:
+            entry.update(status="failed", error=msg("compress_engine_failed", lang, error=f"timeout ({int(GS_TIMEOUT)}s)"))
+            return entry, None
+        except PoolBusy:
+            entry.update(status="failed", error=msg("server_busy", lang))
+            return entry, None
+        except Exception as e:
+            entry.update(status="failed", error=msg("compress_engine_failed", lang, error=e))
+            return entry, None
+        if not dst.exists():
+            detail = (err or out or b"").decode("utf-8", "replace")
+            entry.update(status="failed", error=msg("compress_failed", lang, detail=detail))
+            return entry, None
+        await asyncio.to_thread(result_cache.put_file, cache_key, dst)
+    entry["out"] = dst.stat().st_size
+    entry["ratio"] = round(entry["out"] / max(f.size, 1), 3)
+    if entry["out"] >= f.size:
+        # أصبح أكبر => لا فائدة؛ الأصل يبقى عند المستخدم
+        entry["status"] = "larger"
+        dst.unlink(missing_ok=True)
+        return entry, None
+    return entry, dst
+
+
+@app.post("/api/compress-pdf/batch")
+async def compress_pdf_batch(
+    files: List[UploadFile] = File(...),
+    level: str = Form("medium"),
+    dpi: str = Form("150"),
+    grayscale: str = Form(None),
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    if not files:
+        return JSONResponse({"error": msg("no_files", lang)}, status_code=400)
+    if GS_BIN is None:
+        return JSONResponse({"error": msg("gs_missing", lang)}, status_code=500)
+
+    level = level if level in ("low", "medium", "high") else "medium"
+    try:
+        dpi = str(int(dpi)) if dpi else ""
+    except ValueError:
+        dpi = ""
+    params = {"level": level, "dpi": dpi, "grayscale": "1" if grayscale == "1" else None}
+    BYTES_IN.inc(sum(f.size for f in files if f.kind == "pdf"), tool="compress-pdf")
+
+    tmp = Path(tempfile.mkdtemp(prefix="cbatch-"))
+    # لا يدخل طابور gs_pool من الطلب الواحد أكثر من GS_WORKERS ملف في نفس الوقت
+    sem = asyncio.Semaphore(GS_WORKERS)
+    tasks = [
+        asyncio.ensure_future(_compress_batch_file(f, tmp / f"out-{i}.pdf", params, sem, lang))
+        for i, f in enumerate(files)
+    ]
+
+    async def _members():
+        # بترتيب الانتهاء: أول ملف جاهز يُرسل أولاً؛ status.json في النهاية
+        report: List[dict] = []
+        used: set = set()
+        for fut in asyncio.as_completed(tasks):
+            entry, path = await fut
+            report.append(entry)
+            if path is None:
+                continue
+            stem = entry["name"].rsplit(".", 1)[0] or "file"
+            name, n = f"{stem}.pdf", 1
+            while name in used:
+                n += 1
+                name = f"{stem} ({n}).pdf"
+            used.add(name)
+            data = await asyncio.to_thread(path.read_bytes)
+            path.unlink(missing_ok=True)
+            BYTES_OUT.inc(len(data), tool="compress-pdf")
+            yield name, data
+        yield "status.json", json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8")
+
+    async def _body():
+        try:
+            async for chunk in _stream_zip(_members()):
+                yield chunk
+        finally:
+            for task in tasks:
+                task.cancel()  # انقطاع العميل => gs يُقتل داخل gs_pool.run
+            await asyncio.gather(*tasks, return_exceptions=True)
+            shutil.rmtree(tmp, ignore_errors=True)
+
     return StreamingResponse(
-        BytesIO(data),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{outfile}"'}
+        _body(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="compressed_pdfs.zip"'},
     )
+
+
+# ------------ OCR (pdftoppm + tesseract) ------------
+# كل صفحة: pdftoppm يرسمها رمادية ثم tesseract يخرج طبقة نص فقط (textonly_pdf) تُركّب فوق
+# الصفحة الأصلية، فتبقى الجودة والحجم كما هما. الطبقات تُخزن في الكاش ببصمة محتوى الصفحة
+PDFTOPPM_BIN = shutil.which("pdftoppm")
+TESSERACT_BIN = shutil.which("tesseract")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "64"))
+OCR_MAX_WAIT = float(os.getenv("OCR_MAX_WAIT", "300"))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "300"))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "120"))  # لكل صفحة
+OCR_LANGS = set(os.getenv("OCR_LANGS", "ara,eng,tur").split(","))
+# tesseract يستخدم OpenMP؛ التوازي عندنا بين الصفحات => خيط واحد لكل عملية
+_OCR_ENV = {**os.environ, "OMP_THREAD_LIMIT": "1"}
+
+ocr_pool = SubprocessPool(OCR_WORKERS, OCR_MAX_QUEUE, OCR_MAX_WAIT, tool="ocr-pdf")
+
+
+def _parse_ocr_lang(value: str | None) -> str:
+    langs = [l for l in (value or "").split("+") if l in OCR_LANGS]
+    return "+".join(langs) or "eng"
+
+
+def _hash_pdf_object(obj, h, seen: set):
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in seen:
+            h.update(f"{obj.idnum} R".encode())
+            return
+        seen.add(obj.idnum)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        h.update(_stream_bytes(obj))
+    if isinstance(obj, DictionaryObject):
+        for k in sorted(obj):
+            if k not in ("/Parent", "/Annots", "/StructParents"):
+                h.update(k.encode())
+                _hash_pdf_object(obj.raw_get(k), h, seen)
+    elif isinstance(obj, ArrayObject):
+        for v in obj:
+            _hash_pdf_object(v, h, seen)
+    else:
+        h.update(repr(obj).encode())
+
+
+def _page_digests(src: Path) -> List[str]:
+    # بصمة ما يظهر في الصفحة (المحتوى والموارد والأبعاد)، فنفس الصفحة في ملف آخر تُصيب الكاش
+    digests = []
+    for page in PdfReader(src).pages:
+        h = hashlib.sha256()
+        _hash_pdf_object(page, h, set())
+        digests.append(h.hexdigest())
+    return digests
+
+
+async def _ocr_page(src: Path, index: int, digest: str, work: Path, ocr_lang: str) -> bytes:
+    cache_key = result_cache.key("ocr-page", [digest], {"lang": ocr_lang, "dpi": OCR_DPI})
+    cached = await asyncio.to_thread(result_cache.read, cache_key)
+    if cached is not None:
+        return cached
+
+    base = work / f"page-{index}"
+    n = str(index + 1)
+    code, out, err = await ocr_pool.run(
+        [PDFTOPPM_BIN, "-r", str(OCR_DPI), "-f", n, "-l", n, "-gray", "-singlefile", str(src), str(base)],
+        OCR_TIMEOUT, stage="render",
+    )
+    raster = base.with_suffix(".pgm")
+    if not raster.exists():
+        raise RuntimeError((err or out or b"pdftoppm").decode("utf-8", "replace"))
+    try:
+        code, out, err = await ocr_pool.run(
+            [TESSERACT_BIN, str(raster), str(base), "-l", ocr_lang, "--dpi", str(OCR_DPI),
+             "-c", "textonly_pdf=1", "pdf"],
+            OCR_TIMEOUT, stage="tesseract", env=_OCR_ENV,
+        )
+    finally:
+        raster.unlink(missing_ok=True)
+    layer = base.with_suffix(".pdf")
+    if not layer.exists():
+        raise RuntimeError((err or out or b"tesseract").decode("utf-8", "replace"))
+    data = await asyncio.to_thread(layer.read_bytes)
+    layer.unlink()
+    await asyncio.to_thread(result_cache.put_bytes, cache_key, data)
+    return data
+
+
+def _apply_text_layers(src: Path, layers: List[bytes], dst: Path):
+    writer = PdfWriter(clone_from=str(src))
+    deduper = _StreamDeduper(writer)  # خط GlyphLessFont يتكرر في كل طبقة
+    for page, layer in zip(writer.pages, layers):
+        text = PdfReader(BytesIO(layer)).pages[0]
+        # pdftoppm يرسم الـ CropBox بعد تطبيق /Rotate؛ ننقل الدوران للمحتوى فيتطابق الإحداثيان
+        page.transfer_rotation_to_content()
+        box = page.cropbox
+        op = Transformation().scale(
+            float(box.width) / float(text.mediabox.width), float(box.height) / float(text.mediabox.height)
+        ).translate(float(box.left), float(box.bottom))
+        page.merge_transformed_page(text, op, over=True)
+    deduper.add_document(refs_from=0)  # merge_transformed_page يغيّر /Contents في صفحات موجودة
+    with open(dst, "wb") as out:
+        writer.write(out)
+
+
+async def _ocr_pdf(src: Path, dst: Path, ocr_lang: str, on_page_done=None) -> int:
+    with timed("ocr-pdf", "page_hash"):
+        digests = await asyncio.to_thread(_page_digests, src)
+    if len(digests) > OCR_MAX_PAGES:
+        raise JobError("too_many_pages", count=len(digests), max=OCR_MAX_PAGES)
+
+    # لا يدخل طابور ocr_pool من الطلب الواحد أكثر من OCR_WORKERS صفحة في نفس الوقت
+    sem = asyncio.Semaphore(OCR_WORKERS)
+
+    async def _one(index: int, digest: str) -> bytes:
+        async with sem:
+            layer = await _ocr_page(src, index, digest, dst.parent, ocr_lang)
+        if on_page_done:
+            on_page_done()
+        return layer
+
+    tasks = [asyncio.ensure_future(_one(i, d)) for i, d in enumerate(digests)]
+    try:
+        layers = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    with timed("ocr-pdf", "stitch"):
+        await asyncio.to_thread(_apply_text_layers, src, layers, dst)
+    return len(digests)
+
+
+async def _images_to_ocr_source(paths: List[Path], dst: Path):
+    # دفعة صور => PDF عبر نفس محرك الصور (الدوران من EXIF يصبح /Rotate ويعالجه pdftoppm)
+    streams = await asyncio.gather(
+        *(_run_image_job(_prepare_image, str(p), None, 0, "full_bleed") for p in paths)
+    )
+    pdf_data = await asyncio.to_thread(_convert_to_pdf, streams, "full_bleed")
+    await asyncio.to_thread(dst.write_bytes, pdf_data)
+
+
+@app.post("/api/ocr-pdf")
+async def ocr_pdf(
+    request: Request,
+    file: UploadFile = File(None),              # PDF ممسوح ضوئياً
+    images: List[UploadFile] = File(None),      # أو دفعة صور
+    outfile: str = Form("ocr.pdf"),
+    ocr_lang: str = Form("eng"),                # لغات tesseract: ara | eng | tur أو مزيج مثل ara+eng
+    linearize: str = Form(None),                # "1" => Fast Web View
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    ocr_lang = _parse_ocr_lang(ocr_lang)
+    linearize = linearize == "1"
+
+    if not file and not images:
+        return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
+    if images and len(images) > MAX_IMAGES:
+        return JSONResponse(
+            {"error": msg("too_many_images", lang, count=len(images), max=MAX_IMAGES)},
+            status_code=400,
+        )
+    if PDFTOPPM_BIN is None or TESSERACT_BIN is None:
+        return JSONResponse({"error": msg("ocr_missing", lang)}, status_code=500)
+
+    if not outfile.lower().endswith(".pdf"):
+        outfile += ".pdf"
+
+    uploads = [file] if file else images
+    BYTES_IN.inc(sum(f.size for f in uploads), tool="ocr-pdf")
+    cache_key = result_cache.key(
+        "ocr-pdf", [f.sha256 for f in uploads], {"lang": ocr_lang, "dpi": OCR_DPI, "linearize": linearize}
+    )
+    hit = _cache_hit_response(cache_key, "application/pdf", outfile)
+    if hit is not None:
+        return hit
+
+    tmp = Path(tempfile.mkdtemp(prefix="ocr-"))
+    dst = tmp / "out.pdf"
+    try:
+        if file:
+            src = file.path
+        else:
+            src = tmp / "images.pdf"
+            await _images_to_ocr_source([f.path for f in images], src)
+        pages = await _run_until_disconnect(request, _ocr_pdf(src, dst, ocr_lang))
+        if linearize:
+            await _linearize(dst)
+        await asyncio.to_thread(result_cache.put_file, cache_key, dst)
+    except PoolBusy:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "10"})
+    except ClientDisconnected:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return Response(status_code=499)
+    except JobError as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg(e.key, lang, **e.kwargs)}, status_code=400)
+    except asyncio.TimeoutError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse(
+            {"error": msg("ocr_failed", lang, detail=f"timeout ({int(OCR_TIMEOUT)}s)")}, status_code=500
+        )
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg("ocr_failed", lang, detail=e)}, status_code=500)
+
+    PAGES.inc(pages, tool="ocr-pdf")
+    BYTES_OUT.inc(dst.stat().st_size, tool="ocr-pdf")
+    return _file_response(
+        dst, "application/pdf", outfile, etag=cache_key,
+        background=BackgroundTask(shutil.rmtree, tmp, ignore_errors=True),
+    )
+
+
+# ------------ Page thumbnails (pdftoppm) ------------
+# الملف يُرفع مرة ويُحفظ ببصمته؛ كل صورة مصغّرة تُرسم عند طلبها فقط (img loading="lazy")
+# وتُخزن بمفتاح (بصمة المستند، الصفحة، العرض). THUMB_TTL=0 => تعطيل المعاينة
+THUMB_CACHE_DIR = Path(os.getenv("THUMB_CACHE_DIR", Path(tempfile.gettempdir()) / "pdfweb-thumbs"))
+THUMB_CACHE_MAX_MB = int(os.getenv("THUMB_CACHE_MAX_MB", "256"))
+THUMB_TTL = int(os.getenv("THUMB_TTL", "1800"))
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "0")) or (os.cpu_count() or 1)
+THUMB_MAX_QUEUE = int(os.getenv("THUMB_MAX_QUEUE", "200"))
+THUMB_MAX_WAIT = float(os.getenv("THUMB_MAX_WAIT", "30"))
+THUMB_TIMEOUT = float(os.getenv("THUMB_TIMEOUT", "30"))
+THUMB_WIDTH = 160
+THUMB_MAX_WIDTH = 480
+
+thumb_cache = ResultCache(THUMB_CACHE_DIR, THUMB_CACHE_MAX_MB * 1024 * 1024, THUMB_TTL)
+# طابور مستقل: معاينة صغيرة لا تنتظر خلف OCR طويل
+thumb_pool = SubprocessPool(THUMB_WORKERS, THUMB_MAX_QUEUE, THUMB_MAX_WAIT, tool="thumbnails")
+
+
+def _thumb_doc_key(doc: str) -> str:
+    return thumb_cache.key("thumb-doc", [doc], {})
+
+
+async def _render_thumb(src: Path, page: int, width: int) -> bytes | None:
+    work = Path(tempfile.mkdtemp(prefix="thumb-"))
+    try:
+        base = work / "thumb"
+        n = str(page)
+        await thumb_pool.run(
+            [PDFTOPPM_BIN, "-f", n, "-l", n, "-scale-to-x", str(width), "-scale-to-y", "-1",
+             "-jpeg", "-jpegopt", "quality=70", "-singlefile", str(src), str(base)],
+            THUMB_TIMEOUT, stage="render",
+        )
+        out = base.with_suffix(".jpg")
+        # صفحة خارج المستند => لا ملف
+        return await asyncio.to_thread(out.read_bytes) if out.exists() else None
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+@app.post("/api/thumbnails")
+async def create_thumbnails(
+    file: UploadFile = File(...),
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    if PDFTOPPM_BIN is None or not thumb_cache.enabled:
+        return JSONResponse({"error": msg("thumbs_unavailable", lang)}, status_code=500)
+
+    BYTES_IN.inc(file.size, tool="thumbnails")
+    pages = await asyncio.to_thread(_count_pages, file.path)
+    if not pages:
+        return JSONResponse({"error": msg("no_valid_pages", lang)}, status_code=400)
+
+    # نفس الملف مرة أخرى => لا نسخ (get يجدد صلاحيته)
+    key = _thumb_doc_key(file.sha256)
+    if thumb_cache.get(key) is None:
+        await asyncio.to_thread(thumb_cache.put_file, key, file.path)
+    return {"doc": file.sha256, "pages": pages, "name": file.filename}
+
+
+@app.get("/api/thumbnails/{doc}/{page}")
+async def page_thumbnail(doc: str, page: int, w: int = THUMB_WIDTH, lang: str = "ar"):
+    lang = normalize_lang(lang)
+    if not re.fullmatch(r"[0-9a-f]{64}", doc) or page < 1:
+        return JSONResponse({"error": msg("thumb_expired", lang)}, status_code=404)
+    width = max(32, min(w, THUMB_MAX_WIDTH))
+    # المحتوى ثابت لنفس (المستند، الصفحة، العرض)؛ private لأنه ملف المستخدم
+    headers = {"Cache-Control": f"private, max-age={THUMB_TTL}, immutable"}
+
+    key = thumb_cache.key("thumb", [doc], {"page": page, "width": width})
+    cached = await asyncio.to_thread(thumb_cache.read, key)
+    if cached is not None:
+        return Response(cached, media_type="image/jpeg", headers=headers)
+
+    src = thumb_cache.hold(_thumb_doc_key(doc))
+    if src is None or PDFTOPPM_BIN is None:
+        return JSONResponse({"error": msg("thumb_expired", lang)}, status_code=404)
+    try:
+        data = await _render_thumb(src, page, width)
+    except (PoolBusy, asyncio.TimeoutError):
+        return JSONResponse({"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "5"})
+    finally:
+        src.unlink(missing_ok=True)
+    if data is None:
+        return JSONResponse({"error": msg("no_valid_pages", lang)}, status_code=404)
+    await asyncio.to_thread(thumb_cache.put_bytes, key, data)
+    return Response(data, media_type="image/jpeg", headers=headers)
+
+
+# ------------ Office engine (warm LibreOffice pool) ------------
+# تشغيل soffice لكل طلب يكلف ثوانٍ ومئات الـ MB؛ بدلاً منه عدة نسخ دائمة (كل واحدة بملف
+# تعريف خاص وتستمع على pipe) ونرسل لها التحويل عبر UNO (uno_convert.py)
+SOFFICE_BIN = shutil.which("soffice") or shutil.which("libreoffice")
+# Python النظام (python3-uno)، وليس الـ venv الخاص بالتطبيق
+UNO_PYTHON = os.getenv("UNO_PYTHON") or next(
+    (p for p in ("/usr/lib/libreoffice/program/python", "/usr/bin/python3") if os.path.exists(p)), None
+)
+UNO_SCRIPT = BASE_DIR / "uno_convert.py"
+OFFICE_WORKERS = int(os.getenv("OFFICE_WORKERS", "2"))
+# 0 => لا تُشغّل النسخ عند الإقلاع بل عند أول تحويل في هذه العملية (أول طلب ينتظر الإقلاع)
+OFFICE_WARM = os.getenv("OFFICE_WARM", "1") == "1"
+OFFICE_MAX_QUEUE = int(os.getenv("OFFICE_MAX_QUEUE", "16"))
+OFFICE_MAX_WAIT = float(os.getenv("OFFICE_MAX_WAIT", "60"))
+OFFICE_TIMEOUT = float(os.getenv("OFFICE_TIMEOUT", "120"))
+OFFICE_START_TIMEOUT = float(os.getenv("OFFICE_START_TIMEOUT", "60"))
+OFFICE_RECYCLE_AFTER = int(os.getenv("OFFICE_RECYCLE_AFTER", "50"))    # تحويلات قبل إعادة التشغيل
+OFFICE_MAX_RSS_MB = int(os.getenv("OFFICE_MAX_RSS_MB", "1024"))        # أو عند تجاوز هذه الذاكرة
+OFFICE_DIR = Path(os.getenv("OFFICE_DIR", Path(tempfile.gettempdir()) / "pdfweb-office"))
+OFFICE_EXTENSIONS = {
+    "doc", "docx", "odt", "rtf", "xls", "xlsx", "ods", "ppt", "pptx", "odp", "pps", "ppsx", "odg",
+}
+
+
+def _uno_importable() -> bool:
+    # /usr/bin/python3 قد لا يرى python3-uno => نعرف ذلك عند الإقلاع بدل أن يفشل كل تحويل بعد المهلة
+    try:
+        return subprocess.run(
+            [UNO_PYTHON, "-c", "import uno"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30
+        ).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def _office_ext(filename: str) -> str | None:
+    # LibreOffice يستدل على النوع من الامتداد أيضاً (zip قد يكون docx أو xlsx أو odt) => لا نخمّن
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return ext if ext in OFFICE_EXTENSIONS else None
+
+
+def _tree_rss_mb(pid: int) -> float:
+    # soffice سكربت يشغّل oosplash ثم soffice.bin => نجمع الشجرة كلها
+    total, todo = 0, [pid]
+    while todo:
+        p = todo.pop()
+        try:
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+            for task in Path(f"/proc/{p}/task").iterdir():
+                todo += [int(c) for c in (task / "children").read_text().split()]
+        except (OSError, ValueError):
+            continue
+    return total / 1024.0
+
+
+class OfficeInstance:
+    def __init__(self, index: int):
+        self.index = index
+        self.pipe = f"pdfweb-{os.getpid()}-{index}"
+        self.profile = OFFICE_DIR / f"profile-{os.getpid()}-{index}"
+        self.proc: asyncio.subprocess.Process | None = None
+        self.conversions = 0
+
+    async def _uno(self, *args: str, timeout: float) -> Tuple[int, bytes, bytes]:
+        proc = await asyncio.create_subprocess_exec(
+            UNO_PYTHON, str(UNO_SCRIPT), self.pipe, *args,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout)
+        except BaseException:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        return proc.returncode, out, err
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            SOFFICE_BIN, "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+            "--nolockcheck", f"-env:UserInstallation={self.profile.as_uri()}",
+            f"--accept=pipe,name={self.pipe};urp;StarOffice.ComponentContext",
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,  # مجموعة عمليات خاصة => نقتل soffice.bin معه
+        )
+        self.conversions = 0
+        deadline = time.monotonic() + OFFICE_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if await self.healthy():
+                return
+            await asyncio.sleep(0.5)
+        await self.stop()
+        raise RuntimeError("LibreOffice did not start")
+
+    async def healthy(self) -> bool:
+        if self.proc is None or self.proc.returncode is not None:
+            return False
+        try:
+            code, _, _ = await self._uno("--ping", timeout=10)
+        except asyncio.TimeoutError:
+            return False
+        return code == 0
+
+    def worn_out(self) -> bool:
+        if self.conversions >= OFFICE_RECYCLE_AFTER:
+            return True
+        return self.proc is not None and _tree_rss_mb(self.proc.pid) > OFFICE_MAX_RSS_MB
+
+    async def stop(self):
+        if self.proc is not None and self.proc.returncode is None:
+            try:
+                os.killpg(self.proc.pid, 9)
+            except ProcessLookupError:
+                pass
+            await self.proc.wait()
+        self.proc = None
+        shutil.rmtree(self.profile, ignore_errors=True)
+
+    async def convert(self, src: Path, dst: Path) -> Tuple[int, bytes, bytes]:
+        self.conversions += 1
+        return await self._uno(str(src), str(dst), timeout=OFFICE_TIMEOUT)
+
+
+class OfficePool:
+    def __init__(self, workers: int, max_queue: int, max_wait: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.running = 0
+        self.instances: List[OfficeInstance] = []
+        self._idle: asyncio.Queue | None = None
+        self._tasks: set = set()
+        self._cold: List[OfficeInstance] = []  # نسخ لم تُشغّل بعد (OFFICE_WARM=0)
+        self.uno_ok = True
+
+    @property
+    def available(self) -> bool:
+        return bool(SOFFICE_BIN and UNO_PYTHON and self.workers > 0 and self.uno_ok)
+
+    def start(self):
+        # التسخين في الخلفية حتى لا يتأخر إقلاع التطبيق؛ الطلبات تنتظر في الطابور
+        if not self.available:
+            return
+        self.uno_ok = _uno_importable()
+        if not self.uno_ok:
+            return  # office_missing بدل طابور ينتظر نسخاً لن تعمل أبداً
+        OFFICE_DIR.mkdir(parents=True, exist_ok=True)
+        self._idle = asyncio.Queue()
+        self.instances = [OfficeInstance(i) for i in range(self.workers)]
+        if not OFFICE_WARM:
+            self._cold = list(self.instances)
+            return
+        for inst in self.instances:
+            self._background(self._restart(inst))
+
+    async def stop(self):
+        for t in list(self._tasks):
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*(inst.stop() for inst in self.instances), return_exceptions=True)
+
+    def _background(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _restart(self, inst: OfficeInstance):
+        await inst.stop()
+        while True:
+            try:
+                with timed("office-to-pdf", "soffice_start"):
+                    await inst.start()
+                break
+            except Exception:
+                await asyncio.sleep(5)
+        self._idle.put_nowait(inst)
+
+    async def convert(self, src: Path, dst: Path) -> Tuple[int, bytes, bytes]:
+        if self.waiting >= self.max_queue:
+            raise PoolBusy()
+        if self._cold and self._idle.qsize() <= self.waiting:
+            self._background(self._restart(self._cold.pop()))  # لا نسخة فارغة لهذا الطلب => نشغّل واحدة
+        self.waiting += 1
+        try:
+            with timed("office-to-pdf", "office_queue"):
+                inst = await asyncio.wait_for(self._idle.get(), self.max_wait)
+        except asyncio.TimeoutError:
+            raise PoolBusy()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        healthy = False
+        try:
+            if inst.proc is None or inst.proc.returncode is not None:
+                raise RuntimeError("LibreOffice instance exited")
+            with timed("office-to-pdf", "convert"):
+                result = await inst.convert(src, dst)
+            healthy = result[0] == 0 or await inst.healthy()
+            return result
+        finally:
+            self.running -= 1
+            # نسخة متعطلة أو مستهلكة تُعاد في الخلفية؛ الطلب التالي يأخذ نسخة أخرى جاهزة
+            if healthy and not inst.worn_out():
+                self._idle.put_nowait(inst)
+            else:
+                self._background(self._restart(inst))
+
+
+office_pool = OfficePool(OFFICE_WORKERS, OFFICE_MAX_QUEUE, OFFICE_MAX_WAIT)
+
+
+def _office_input(path: Path, filename: str, work: Path) -> Path:
+    ext = _office_ext(filename)
+    if ext is None:
+        raise JobError("not_office", name=filename or "document")
+    target = work / ("input." + ext)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    return target
+
+
+@app.post("/api/office-to-pdf")
+async def office_to_pdf(
+    request: Request,
+    document: UploadFile = File(...),  # docx/xlsx/pptx/odt/ods/odp/doc/xls/ppt/rtf
+    outfile: str = Form(None),
+    linearize: str = Form(None),       # "1" => Fast Web View
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    linearize = linearize == "1"
+
+    if not document:
+        return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
+    if not office_pool.available:
+        return JSONResponse({"error": msg("office_missing", lang)}, status_code=500)
+    if _office_ext(document.filename or "") is None:
+        return JSONResponse({"error": msg("not_office", lang, name=document.filename or "document")}, status_code=400)
+
+    outfile = outfile or (document.filename or "document").rsplit(".", 1)[0] + ".pdf"
+    if not outfile.lower().endswith(".pdf"):
+        outfile += ".pdf"
+
+    BYTES_IN.inc(document.size, tool="office-to-pdf")
+    cache_key = result_cache.key("office-to-pdf", [document.sha256], {"linearize": linearize})
+    hit = _cache_hit_response(cache_key, "application/pdf", outfile)
+    if hit is not None:
+        return hit
+
+    tmp = Path(tempfile.mkdtemp(prefix="office-"))
+    dst = tmp / "out.pdf"
+    try:
+        src = _office_input(document.path, document.filename or "", tmp)
+        _, out, err = await _run_until_disconnect(request, office_pool.convert(src, dst))
+        if not dst.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+            detail = (err or out or b"").decode("utf-8", "replace")
+            return JSONResponse({"error": msg("office_failed", lang, detail=detail)}, status_code=500)
+        if linearize:
+            await _linearize(dst)
+        await asyncio.to_thread(result_cache.put_file, cache_key, dst)
+    except PoolBusy:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "10"})
+    except ClientDisconnected:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse(
+            {"error": msg("office_failed", lang, detail=f"timeout ({int(OFFICE_TIMEOUT)}s)")}, status_code=500
+        )
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return JSONResponse({"error": msg("office_failed", lang, detail=e)}, status_code=500)
+
+    PAGES.inc(await asyncio.to_thread(_count_pages, dst), tool="office-to-pdf")
+    BYTES_OUT.inc(dst.stat().st_size, tool="office-to-pdf")
+    return _file_response(
+        dst, "application/pdf", outfile, etag=cache_key,
+        background=BackgroundTask(shutil.rmtree, tmp, ignore_errors=True),
+    )
+
+
+# ------------ Serving (concurrency classes, readiness) ------------
+# كل صنف أدوات له حد طلبات متزامنة وطابور قصير داخل العملية، فطلب صور ثقيل لا يجوّع
+# الدمج والصفحات. الحدود لكل worker؛ gunicorn.conf.py يقسم الأنوية بين الـ workers
+LIMIT_MAX_QUEUE = int(os.getenv("LIMIT_MAX_QUEUE", "16"))
+LIMIT_MAX_WAIT = float(os.getenv("LIMIT_MAX_WAIT", "30"))
+READY_MAX_SATURATION = float(os.getenv("READY_MAX_SATURATION", "0.8"))
+READY_MAX_LAG = float(os.getenv("READY_MAX_LAG", "0.5"))  # تأخر حلقة الأحداث (ثوانٍ)
+
+
+class ConcurrencyClass:
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(limit)
+
+    @property
+    def saturation(self) -> float:
+        return (self.running + self.waiting) / (self.limit + self.max_queue)
+
+    async def acquire(self, bounded: bool = True):
+        # bounded=False للمهام: تنتظر دورها بدل 503
+        if bounded and self.waiting >= self.max_queue:
+            raise PoolBusy()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.max_wait if bounded else None)
+        except asyncio.TimeoutError:
+            raise PoolBusy()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.running -= 1
+                self._sem.release()
+
+        return release
+
+
+TOOL_CLASSES = {
+    "image": ConcurrencyClass("image", int(os.getenv("LIMIT_IMAGE", "2")), LIMIT_MAX_QUEUE, LIMIT_MAX_WAIT),
+    "merge": ConcurrencyClass("merge", int(os.getenv("LIMIT_MERGE", "2")), LIMIT_MAX_QUEUE, LIMIT_MAX_WAIT),
+    "gs": ConcurrencyClass("gs", int(os.getenv("LIMIT_GS", str(GS_WORKERS))), LIMIT_MAX_QUEUE, LIMIT_MAX_WAIT),
+    "ocr": ConcurrencyClass("ocr", int(os.getenv("LIMIT_OCR", "2")), LIMIT_MAX_QUEUE, LIMIT_MAX_WAIT),
+    "office": ConcurrencyClass(
+        "office", int(os.getenv("LIMIT_OFFICE", str(OFFICE_WORKERS))), LIMIT_MAX_QUEUE, LIMIT_MAX_WAIT
+    ),
+}
+_TOOL_CLASS = {
+    "images-to-pdf": "image",
+    "merge-pdf": "merge",
+    "compress-pdf": "gs",
+    "compress-batch": "gs",
+    "ocr-pdf": "ocr",
+    "office-to-pdf": "office",
+}
+
+# ------------ Admission control (memory budget) ------------
+# قبل أي فك: نقدّر ذاكرة الذروة من الترويسات (أبعاد الصور، حجم ملفات PDF) ونحجزها من ميزانية
+# العملية؛ طلب يتجاوز الميزانية وحده => 413، وإلا ينتظر حتى يتحرر ما يكفي (أو 503 بعد LIMIT_MAX_WAIT)
+PDF_MEM_FACTOR = 3                    # pypdf: المصدر + الكائنات المنسوخة + الكتابة
+ADMISSION_BASE = 16 * 1024 * 1024     # كلفة ثابتة لكل طلب
+
+
+def _default_memory_budget_mb() -> int:
+    # 60% من حد الـ cgroup (الحاوية) أو ذاكرة الجهاز، مقسومة على عدد الـ workers
+    total = 0
+    try:
+        raw = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        total = int(raw) if raw != "max" else 0
+    except (OSError, ValueError):
+        pass
+    if not total:
+        try:
+            total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (OSError, ValueError):
+            total = 2048 * 1024 * 1024
+    workers = int(os.getenv("WEB_CONCURRENCY", "1")) or 1
+    return max(256, int(total * 0.6 / workers / (1024 * 1024)))
+
+
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "0")) or _default_memory_budget_mb()
+
+
+def _image_decode_cost(path: Path, name: str, opts: tuple | None = None) -> int:
+    # opts: (compress, max_dpi, style) كما يستقبلها _prepare_image => نحسب ما يفكه فعلاً؛
+    # None (OCR وغيره) => فك كامل. Image.open يقرأ الترويسة فقط
+    try:
+        with Image.open(path) as img:
+            w, h = img.size
+            bands = len(img.getbands())
+            fmt, mode, interlaced = (img.format or "").upper(), img.mode, bool(img.info.get("interlace"))
+            try:
+                orientation = int(img.getexif().get(_EXIF_ORIENTATION_TAG) or 1)
+            except Exception:
+                orientation = 1
+    except Image.DecompressionBombError:
+        raise JobError("image_too_large", name=name, mp=">" + str(2 * MAX_IMAGE_MP), max=MAX_IMAGE_MP)
+    except Exception:
+        return 0  # ملف تالف: المعالج يبلّغ عنه لاحقاً
+    if w * h > Image.MAX_IMAGE_PIXELS:
+        raise JobError("image_too_large", name=name, mp=round(w * h / 1_000_000), max=MAX_IMAGE_MP)
+    if opts is not None:
+        compress, max_dpi, style = opts
+        scale = _target_scale((w, h), max_dpi, style)
+        if scale < 1.0 and fmt == "JPEG":
+            # draft يفك بمقياس 1/2 أو 1/4 أو 1/8 لا يقل عن الهدف
+            reduce = 1
+            while reduce < 8 and scale * reduce * 2 <= 1.0:
+                reduce *= 2
+            return (w // reduce) * (h // reduce) * (bands + 3)
+        if scale >= 1.0 and not _needs_decode(fmt, mode, interlaced, orientation, compress, style):
+            return 0  # يمرّ إلى img2pdf كما هو؛ حجم الملف محسوب في stored
+    # البكسلات المفكوكة + نسخة RGB/تصغير
+    return w * h * (bands + 3)
+
+
+def _image_opts(tool: str, compress, max_dpi: int, style) -> tuple | None:
+    # خيارات _prepare_image لتقدير الذاكرة؛ الأدوات الأخرى تفك الصورة كاملة
+    return (compress, max_dpi, style or "full_bleed") if tool == "images-to-pdf" else None
+
+
+def _estimate_cost(
+    files: List[Tuple[str | None, Path | None, str]], pdf_parallel: int = 0, image_opts: tuple | None = None
+) -> int:
+    # files: [(kind, path, name)]؛ pdf_parallel: ملفات PDF تُعالج واحداً واحداً خارج العملية (gs)
+    # فلا يُحسب منها إلا أكبر pdf_parallel في نفس الوقت
+    decoded: List[int] = []
+    pdfs: List[int] = []
+    stored = 0
+    for kind, path, name in files:
+        if path is None or kind is None:
+            continue
+        size = path.stat().st_size
+        if kind == "image":
+            decoded.append(_image_decode_cost(path, name, image_opts))
+            stored += size * 2  # المدخلات + الناتج يُجمعان في الذاكرة (img2pdf)
+        elif kind == "pdf":
+            pdfs.append(size * PDF_MEM_FACTOR)
+        else:
+            stored += size
+    if pdf_parallel:
+        pdfs = sorted(pdfs, reverse=True)[:pdf_parallel]
+    # الصور تُفك بالتوازي على IMAGE_WORKERS عملية => أكبرها في نفس الوقت
+    return ADMISSION_BASE + sum(sorted(decoded, reverse=True)[:IMAGE_WORKERS]) + sum(pdfs) + stored
+
+
+def _sniff_file(path: Path) -> str | None:
+    with open(path, "rb") as fh:
+        return _sniff(fh.read(_SNIFF_BYTES))
+
+
+class MemoryBudget:
+    def __init__(self, total: int, max_queue: int, max_wait: float):
+        self.total = total
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.used = 0
+        self.waiting = 0
+        self._cond = asyncio.Condition()
+
+    @property
+    def saturation(self) -> float:
+        return self.used / self.total
+
+    async def acquire(self, cost: int, bounded: bool = True):
+        if cost > self.total:
+            raise JobError(
+                "request_too_expensive", need=cost // (1024 * 1024), budget=self.total // (1024 * 1024)
+            )
+        if bounded and self.waiting >= self.max_queue:
+            raise PoolBusy()
+        async with self._cond:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self.used + cost <= self.total), self.max_wait if bounded else None
+                )
+            except asyncio.TimeoutError:
+                raise PoolBusy()
+            finally:
+                self.waiting -= 1
+            self.used += cost
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.used -= cost
+                asyncio.ensure_future(self._wake())
+
+        return release
+
+    async def _wake(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+
+memory_budget = MemoryBudget(MEMORY_BUDGET_MB * 1024 * 1024, LIMIT_MAX_QUEUE, LIMIT_MAX_WAIT)
+
+_loop_lag = 0.0
+_serving_tasks: List[asyncio.Task] = []
+
+
+async def _release_after(body, release):
+    # الـ ZIP المتدفق يعمل أثناء الإرسال => نحتفظ بالمكان حتى آخر بايت
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        release()
+
+
+async def _run_in_class(tool: str, call, bounded: bool = True, cost: int = 0):
+    cls = TOOL_CLASSES.get(_TOOL_CLASS.get(tool))
+    if cls is None and not cost:
+        return await call()
+    t0 = time.perf_counter()
+    releases = []
+    try:
+        # الذاكرة أولاً: طلب ينتظر الميزانية لا يحجز خانة من صنف الأداة عن طلبات أرخص
+        if cost:
+            releases.append(await memory_budget.acquire(cost, bounded))
+        if cls is not None:
+            releases.append(await cls.acquire(bounded))
+    except BaseException:
+        for r in reversed(releases):
+            r()
+        raise
+    record_stage(tool, "admission", time.perf_counter() - t0)
+    if cost:
+        ADMISSION_COST.observe(cost, tool=tool)
+
+    def release():
+        for r in reversed(releases):
+            r()
+
+    try:
+        result = await call()
+    except BaseException:
+        release()
+        raise
+    if isinstance(result, StreamingResponse):
+        result.body_iterator = _release_after(result.body_iterator, release)
+    else:
+        release()
+    return result
+
+
+async def _watch_loop_lag(interval: float = 0.5):
+    global _loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        _loop_lag = max(0.0, loop.time() - t0 - interval)
+
+
+def _start_serving():
+    _serving_tasks.append(asyncio.create_task(_watch_loop_lag()))
+
+
+async def _stop_serving():
+    for t in _serving_tasks:
+        t.cancel()
+    await asyncio.gather(*_serving_tasks, return_exceptions=True)
+    _serving_tasks.clear()
+
+
+def warm_up():
+    # يُستدعى في عملية gunicorn الرئيسية قبل fork (preload_app): ما يُحمّل هنا يُشارك بين الـ workers
+    Image.init()  # كل إضافات الصيغ (عادة تُحمّل عند أول صورة غير JPEG/PNG)
+    import pypdf.filters  # noqa: F401
+    buf = BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, format="JPEG")
+    # تحويل صغير يمرّ بمسارات img2pdf و pypdf (قراءة/كتابة) مرة واحدة
+    PdfWriter(clone_from=PdfReader(BytesIO(img2pdf.convert(buf.getvalue())))).write(BytesIO())
+    for name in templates.env.list_templates(filter_func=lambda n: n.endswith(".html")):
+        templates.env.get_template(name)
+
+
+@app.get("/readyz")
+async def readyz():
+    # للموازن: 503 قبل أن ينهار زمن الاستجابة (الأرقام لهذا الـ worker فقط)
+    saturation = {name: round(c.saturation, 3) for name, c in TOOL_CLASSES.items()}
+    saturation["memory"] = round(memory_budget.saturation, 3)
+    saturation["jobs"] = round(_job_queue.qsize() / JOB_MAX_QUEUE, 3) if _job_queue is not None else 1.0
+    ready = max(saturation.values()) < READY_MAX_SATURATION and _loop_lag < READY_MAX_LAG
+    return JSONResponse(
+        {"ready": ready, "saturation": saturation, "loop_lag": round(_loop_lag, 3)},
+        status_code=200 if ready else 503,
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+# ------------ Jobs API (async conversions with progress) ------------
+JOBS_DIR = Path(os.getenv("JOBS_DIR", Path(tempfile.gettempdir()) / "pdfweb-jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "100"))
+JOB_TTL = int(os.getenv("JOB_TTL", "1800"))  # تُحذف النتائج بعد هذه المدة (ثوانٍ)
+JOB_TOOLS = {"images-to-pdf", "merge-pdf", "compress-pdf", "ocr-pdf", "office-to-pdf"}
+
+jobs: dict = {}
+_job_queue: asyncio.Queue | None = None
+_job_tasks: List[asyncio.Task] = []
+
+
+class JobError(Exception):
+    def __init__(self, key: str, **kwargs):
+        super().__init__(key)
+        self.key = key
+        self.kwargs = kwargs
+
+
+def _job_public(job: dict) -> dict:
+    # warnings: ملفات/صفحات تُخطّيت والمهمة نجحت (state.json أقدم من الحقل => قائمة فارغة)
+    return {**{k: job[k] for k in ("id", "tool", "state", "progress", "error", "created", "finished")},
+            "warnings": job.get("warnings") or []}
+
+
+JOB_PROGRESS_SAVE_INTERVAL = 0.5  # ثوانٍ بين كتابتين للتقدّم على القرص
+
+
+def _save_job_state(job: dict):
+    # نسخة على القرص حتى يراها أي worker آخر
+    path = JOBS_DIR / job["id"] / "state.json"
+    tmp = path.with_suffix(".tmp")
+    job["saved_at"] = time.monotonic()
+    try:
+        tmp.write_text(json.dumps({**_job_public(job), "filename": job["filename"],
+                                   "media_type": job["media_type"]}))
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def _load_job(job_id: str) -> dict | None:
+    job = jobs.get(job_id)
+    if job is not None:
+        return job
+    if not job_id.isalnum():
+        return None
+    try:
+        return json.loads((JOBS_DIR / job_id / "state.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _set_stage(job: dict, stage: str, total: int = 0):
+    job["progress"] = {"stage": stage, "done": 0, "total": total}
+    _save_job_state(job)
+
+
+def _advance(job: dict):
+    progress = job["progress"]
+    progress["done"] += 1
+    # workers أخرى تقرأ state.json: نكتبه كل فترة قصيرة وعند اكتمال المرحلة لا مع كل صفحة
+    finished = progress["total"] and progress["done"] >= progress["total"]
+    if finished or time.monotonic() - job.get("saved_at", 0) >= JOB_PROGRESS_SAVE_INTERVAL:
+        _save_job_state(job)
+
+
+async def _job_images(job: dict, inputs: List[Tuple[str, Path]], p: dict):
+    out_dir = JOBS_DIR / job["id"]
+    _set_stage(job, "images", len(inputs))
+
+    async def _one(fn, path: Path, *args):
+        result = await _run_image_job(fn, str(path), *args)
+        _advance(job)
+        return result
+
+    if p["per_file"] == "1":
+        if p["prepared"]:
+            calls = [_one(_convert_to_pdf, path, p["style"]) for _, path in inputs]
+        else:
+            calls = [_one(_image_to_pdf, path, p["compress"], p["style"], p["max_dpi"]) for _, path in inputs]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for (name, _), res in zip(inputs, results):
+            if isinstance(res, BaseException):
+                raise JobError("image_process_failed", name=name, error=res)
+        _set_stage(job, "zip", len(results))
+        with ZipFile(out_dir / "result", "w", ZIP_DEFLATED) as zf:
+            for (name, _), blob in zip(inputs, results):
+                zf.writestr(name.rsplit(".", 1)[0] + ".pdf", blob, compress_type=_zip_method(blob))
+                _advance(job)
+        return "images_pdf.zip", "application/zip"
+
+    try:
+        if p["prepared"]:
+            # جُهّزت أثناء الرفع (/api/uploads)؛ img2pdf يقرأ الملفات مباشرة
+            streams = [str(path) for _, path in inputs]
+        else:
+            streams = await asyncio.gather(*(
+                _one(_prepare_image, path, p["compress"], p["max_dpi"], p["style"]) for _, path in inputs
+            ))
+        _set_stage(job, "pdf", len(streams))
+        pdf_data = await asyncio.to_thread(_convert_to_pdf, streams, p["style"])
+        job["progress"]["done"] = len(streams)
+    except Exception as e:
+        raise JobError("pdf_creation_failed", error=e)
+    await asyncio.to_thread((out_dir / "result").write_bytes, pdf_data)
+    return p["outfile"], "application/pdf"
+
+
+async def _job_merge(job: dict, inputs: List[Tuple[str, Path]], p: dict):
+    dst = JOBS_DIR / job["id"] / "result"
+    _set_stage(job, "pages")
+    try:
+        total_pages, errors = await _merge_to_disk(
+            inputs, dst, job["lang"], lambda: _advance(job), p["dedupe"] == "1", p["pages"]
+        )
+    except PoolBusy:
+        raise JobError("server_busy")
+    job["warnings"] += errors
+    if total_pages == 0:
+        raise JobError("no_valid_pages")
+    return p["outfile"], "application/pdf"
+
+
+async def _job_compress(job: dict, inputs: List[Tuple[str, Path]], p: dict):
+    src = inputs[0][1]
+    dst = JOBS_DIR / job["id"] / "result"
+    pages = await asyncio.to_thread(_count_pages, src)
+    ranges = _plan_chunks(pages, src.stat().st_size)
+    _set_stage(job, "gs", len(ranges) or 1)
+    try:
+        if ranges:
+            _, out, err = await _compress_chunked(
+                src, dst, ranges, p["level"], p["dpi"], p["grayscale"], lambda: _advance(job)
+            )
+        else:
+            _, out, err = await gs_pool.run(_build_gs_cmd(src, dst, p["level"], p["dpi"], p["grayscale"]))
+            _advance(job)
+    except PoolBusy:
+        raise JobError("server_busy")
+    except asyncio.TimeoutError:
+        raise JobError("compress_engine_failed", error=f"timeout ({int(GS_TIMEOUT)}s)")
+    if not dst.exists():
+        raise JobError("compress_failed", detail=(err or out or b"").decode("utf-8", "replace"))
+    return p["outfile"], "application/pdf"
+
+
+async def _job_ocr(job: dict, inputs: List[Tuple[str, Path]], p: dict):
+    out_dir = JOBS_DIR / job["id"]
+    if p["ocr_source"] == "images":
+        src = out_dir / "images.pdf"
+        _set_stage(job, "pdf", len(inputs))
+        try:
+            await _images_to_ocr_source([path for _, path in inputs], src)
+        except Exception as e:
+            raise JobError("pdf_creation_failed", error=e)
+    else:
+        src = inputs[0][1]
+    pages = await asyncio.to_thread(_count_pages, src)
+    _set_stage(job, "ocr", pages)
+    # dst بجانب الصور المؤقتة للصفحات داخل مجلد المهمة
+    try:
+        await _ocr_pdf(src, out_dir / "result", p["ocr_lang"], lambda: _advance(job))
+    except PoolBusy:
+        raise JobError("server_busy")
+    except asyncio.TimeoutError:
+        raise JobError("ocr_failed", detail=f"timeout ({int(OCR_TIMEOUT)}s)")
+    except (JobError, asyncio.CancelledError):
+        raise
+    except Exception as e:
+        raise JobError("ocr_failed", detail=e)
+    return p["outfile"], "application/pdf"
+
+
+async def _job_office(job: dict, inputs: List[Tuple[str, Path]], p: dict):
+    out_dir = JOBS_DIR / job["id"]
+    name, path = inputs[0]
+    _set_stage(job, "office", 1)
+    try:
+        _, out, err = await office_pool.convert(_office_input(path, name, out_dir), out_dir / "result")
+    except PoolBusy:
+        raise JobError("server_busy")
+    except asyncio.TimeoutError:
+        raise JobError("office_failed", detail=f"timeout ({int(OFFICE_TIMEOUT)}s)")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        raise JobError("office_failed", detail=e)
+    if not (out_dir / "result").exists():
+        raise JobError("office_failed", detail=(err or out or b"").decode("utf-8", "replace"))
+    _advance(job)
+    return p["outfile"], "application/pdf"
+
+
+_JOB_RUNNERS = {
+    "images-to-pdf": _job_images,
+    "merge-pdf": _job_merge,
+    "compress-pdf": _job_compress,
+    "ocr-pdf": _job_ocr,
+    "office-to-pdf": _job_office,
+}
+
+
+def _job_cache_key(tool: str, uploads: List[UploadFile], p: dict) -> str | None:
+    # نفس مفاتيح نقاط النهاية المباشرة => المهمة تصيب ما خزّنه الطلب العادي والعكس
+    digests = [f.sha256 for f in uploads]
+    if tool == "images-to-pdf":
+        params = {
+            "order": p["order"], "per_file": p["per_file"] == "1", "style": p["style"],
+            "compress": p["compress"] == "1", "max_dpi": p["max_dpi"], "linearize": p["linearize"],
+        }
+        if p["per_file"] == "1":
+            params["names"] = [f.filename or "image" for f in uploads]
+    elif tool == "merge-pdf":
+        params = {
+            "order": p["order"], "dedupe": p["dedupe"] == "1",
+            "pages": p["pages"], "linearize": p["linearize"],
+        }
+    elif tool == "compress-pdf":
+        params = {"level": p["level"], "dpi": p["dpi"], "grayscale": p["grayscale"] == "1",
+                  "linearize": p["linearize"]}
+    elif tool == "ocr-pdf":
+        params = {"lang": p["ocr_lang"], "dpi": OCR_DPI, "linearize": p["linearize"]}
+    elif tool == "office-to-pdf":
+        params = {"linearize": p["linearize"]}
+    else:
+        return None
+    return result_cache.key(tool, digests, params)
+
+
+async def _run_job(job: dict, inputs: List[Tuple[str, Path]], p: dict):
+    dst = JOBS_DIR / job["id"] / "result"
+    key = p.get("cache_key")
+    if key:
+        held = await asyncio.to_thread(result_cache.hold, key)
+        if held is not None:
+            _set_stage(job, "cache", 1)
+            await asyncio.to_thread(shutil.move, held, dst)
+            _advance(job)
+            if job["tool"] == "images-to-pdf" and p["per_file"] == "1":
+                return "images_pdf.zip", "application/zip"
+            return p["outfile"], "application/pdf"
+    warned = len(job["warnings"])
+    filename, media_type = await _JOB_RUNNERS[job["tool"]](job, inputs, p)
+    if p["linearize"] and media_type == "application/pdf":
+        _set_stage(job, "linearize", 1)
+        await _linearize(dst)
+        _advance(job)
+    # إصابة الكاش لا تعرف تنبيهات المعالجة (صفحات خارج النطاق، ملف تالف) => لا نخزن نتيجة لها تنبيهات
+    if key and len(job["warnings"]) == warned:
+        await asyncio.to_thread(result_cache.put_file, key, dst)
+    return filename, media_type
+
+
+async def _job_worker():
+    while True:
+        job, inputs, params = await _job_queue.get()
+        job["state"] = "running"
+        _save_job_state(job)
+        try:
+            cost = await asyncio.to_thread(
+                _estimate_cost, [(_sniff_file(path), path, name) for name, path in inputs], 0,
+                _image_opts(job["tool"], params.get("compress"), params.get("max_dpi") or 0, params.get("style")),
+            )
+            job["filename"], job["media_type"] = await _run_in_class(
+                job["tool"], lambda: _run_job(job, inputs, params), bounded=False, cost=cost
+            )
+            job["state"] = "done"
+        except asyncio.CancelledError:
+            raise
+        except JobError as e:
+            job["state"] = "failed"
+            job["error"] = msg(e.key, job["lang"], **e.kwargs)
+        except Exception as e:
+            job["state"] = "failed"
+            job["error"] = msg("compress_engine_failed" if job["tool"] == "compress-pdf" else "pdf_creation_failed",
+                               job["lang"], error=e)
+        finally:
+            job["finished"] = time.time()
+            _save_job_state(job)
+            for _, path in inputs:
+                path.unlink(missing_ok=True)
+            _job_queue.task_done()
+
+
+async def _job_janitor():
+    while True:
+        await asyncio.sleep(60)
+        now = time.time()
+        for job_id, job in list(jobs.items()):
+            if job["finished"] and now - job["finished"] > JOB_TTL:
+                jobs.pop(job_id, None)
+        # نحذف من القرص أيضاً (يشمل مهام workers أخرى وجلسات الرفع المتروكة)
+        entries = []
+        for root in (JOBS_DIR, UPLOAD_SESSION_DIR):
+            try:
+                entries += list(root.iterdir())
+            except OSError:
+                pass
+        for d in entries:
+            try:
+                if now - d.stat().st_mtime > JOB_TTL:
+                    shutil.rmtree(d, ignore_errors=True)
+            except OSError:
+                pass
+
+
+def _start_job_workers():
+    global _job_queue
+    _job_queue = asyncio.Queue(maxsize=JOB_MAX_QUEUE)
+    _job_tasks.extend(asyncio.create_task(_job_worker()) for _ in range(JOB_WORKERS))
+    _job_tasks.append(asyncio.create_task(_job_janitor()))
+
+
+async def _stop_job_workers():
+    for t in _job_tasks:
+        t.cancel()
+    await asyncio.gather(*_job_tasks, return_exceptions=True)
+    _job_tasks.clear()
+
+
+def _new_job_dir() -> Tuple[str, Path]:
+    job_id = os.urandom(12).hex()
+    job_dir = JOBS_DIR / job_id
+    job_dir.mkdir(parents=True)
+    return job_id, job_dir
+
+
+def _submit_job(
+    job_id: str, tool: str, lang: str, inputs: List[Tuple[str, Path]], params: dict, warnings: List[str] | None = None
+) -> dict:
+    job = {
+        "id": job_id, "tool": tool, "lang": lang, "state": "queued",
+        "progress": {"stage": "queued", "done": 0, "total": len(inputs)},
+        "error": None, "warnings": list(warnings or []), "created": time.time(), "finished": None,
+        "filename": None, "media_type": None,
+    }
+    jobs[job_id] = job
+    _save_job_state(job)
+    _job_queue.put_nowait((job, inputs, params))
+    return job
+
+
+@app.post("/api/jobs/{tool}")
+async def create_job(
+    tool: str,
+    images: List[UploadFile] = File(None),
+    files: List[UploadFile] = File(None),
+    file: UploadFile = File(None),
+    document: UploadFile = File(None),
+    outfile: str = Form(None),
+    order: str = Form("name"),
+    per_file: str = Form(None),
+    style: str = Form("full_bleed"),
+    compress: str = Form(None),
+    max_dpi: str = Form(""),
+    dedupe: str = Form(None),
+    pages: str = Form(None),
+    ocr_lang: str = Form("eng"),
+    level: str = Form("medium"),
+    dpi: str = Form("150"),
+    grayscale: str = Form(None),
+    linearize: str = Form(None),
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+
+    if tool not in JOB_TOOLS:
+        return JSONResponse({"error": msg("unknown_tool", lang, tool=tool)}, status_code=404)
+    try:
+        selection = _parse_page_spec(pages)
+    except ValueError as e:
+        return JSONResponse({"error": msg("bad_page_range", lang, spec=e)}, status_code=400)
+    picks: dict = {}
+    warnings: List[str] = []
+
+    if tool == "images-to-pdf":
+        uploads = images or []
+        if not uploads:
+            return JSONResponse({"error": msg("no_images", lang)}, status_code=400)
+        if len(uploads) > MAX_IMAGES:
+            return JSONResponse(
+                {"error": msg("too_many_images", lang, count=len(uploads), max=MAX_IMAGES)},
+                status_code=400,
+            )
+        if order == "name":
+            uploads.sort(key=lambda f: (f.filename or "").lower())
+        default_out = "images.pdf"
+    elif tool == "merge-pdf":
+        try:
+            # الأرقام بترتيب الرفع الأصلي، قبل استبعاد غير الـ PDF
+            picks = _pick_pages(files or [], selection)
+        except ValueError as e:
+            return JSONResponse({"error": msg("bad_page_range", lang, spec=e)}, status_code=400)
+        uploads = [f for f in (files or []) if f.kind == "pdf"]
+        if not uploads:
+            return JSONResponse({"error": msg("no_files", lang)}, status_code=400)
+        warnings = [msg("not_pdf", lang, name=f.filename or "file.pdf") for f in files if f.kind != "pdf"]
+        if order == "name":
+            uploads.sort(key=lambda f: (f.filename or "").lower())
+        default_out = "merged.pdf"
+    elif tool == "ocr-pdf":
+        uploads = [file] if file else (images or [])
+        if not uploads:
+            return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
+        if len(uploads) > MAX_IMAGES:
+            return JSONResponse(
+                {"error": msg("too_many_images", lang, count=len(uploads), max=MAX_IMAGES)},
+                status_code=400,
+            )
+        if PDFTOPPM_BIN is None or TESSERACT_BIN is None:
+            return JSONResponse({"error": msg("ocr_missing", lang)}, status_code=500)
+        if order == "name":
+            uploads.sort(key=lambda f: (f.filename or "").lower())
+        default_out = "ocr.pdf"
+    elif tool == "office-to-pdf":
+        if not document:
+            return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
+        if not office_pool.available:
+            return JSONResponse({"error": msg("office_missing", lang)}, status_code=500)
+        if _office_ext(document.filename or "") is None:
+            return JSONResponse(
+                {"error": msg("not_office", lang, name=document.filename or "document")}, status_code=400
+            )
+        uploads = [document]
+        default_out = (document.filename or "document").rsplit(".", 1)[0] + ".pdf"
+    else:
+        if not file:
+            return JSONResponse({"error": msg("no_file_uploaded", lang)}, status_code=400)
+        if GS_BIN is None:
+            return JSONResponse({"error": msg("gs_missing", lang)}, status_code=500)
+        uploads = [file]
+        default_out = "compressed.pdf"
+        # تطبيع كما في /api/compress-pdf حتى يتطابق مفتاح الكاش
+        level = level if level in ("low", "medium", "high") else "medium"
+        try:
+            dpi = str(int(dpi)) if dpi else ""
+        except ValueError:
+            dpi = ""
+        grayscale = "1" if grayscale == "1" else None
+
+    if _job_queue is None or _job_queue.full():
+        return JSONResponse(
+            {"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "10"}
+        )
+    # ما لن يُقبل أبداً يُرفض الآن بدل أن يفشل بعد الانتظار في الطابور
+    try:
+        cost = await asyncio.to_thread(
+            _estimate_cost, [(f.kind, f.path, f.filename or "file") for f in uploads], 0,
+            _image_opts(tool, compress, _parse_max_dpi(max_dpi), style),
+        )
+        if cost > memory_budget.total:
+            raise JobError(
+                "request_too_expensive", need=cost // (1024 * 1024), budget=memory_budget.total // (1024 * 1024)
+            )
+    except JobError as e:
+        return JSONResponse({"error": msg(e.key, lang, **e.kwargs)}, status_code=413)
+
+    outfile = outfile or default_out
+    if not outfile.lower().endswith(".pdf"):
+        outfile += ".pdf"
+
+    job_id, job_dir = _new_job_dir()
+    inputs: List[Tuple[str, Path]] = []
+    for i, f in enumerate(uploads):
+        path = job_dir / f"in-{i}"
+        await asyncio.to_thread(shutil.move, f.path, path)
+        inputs.append((f.filename or "file", path))
+
+    params = {
+        "outfile": outfile, "per_file": per_file, "style": style, "compress": compress,
+        "max_dpi": _parse_max_dpi(max_dpi), "dedupe": dedupe,
+        "pages": [picks.get(f) for f in uploads],
+        "ocr_lang": _parse_ocr_lang(ocr_lang), "ocr_source": "images" if tool == "ocr-pdf" and images else "pdf",
+        "level": level, "dpi": dpi, "grayscale": grayscale, "linearize": linearize == "1",
+        "prepared": False, "order": order,
+    }
+    params["cache_key"] = _job_cache_key(tool, uploads, params)
+    job = _submit_job(job_id, tool, lang, inputs, params, warnings)
+    return JSONResponse(_job_public(job), status_code=202)
+
+
+@app.get("/api/jobs/{job_id}")
+def job_status(job_id: str, lang: str = "ar"):
+    job = _load_job(job_id)
+    if job is None:
+        return JSONResponse({"error": msg("job_not_found", lang)}, status_code=404)
+    return _job_public(job)
+
+
+@app.get("/api/jobs/{job_id}/result")
+def job_result(job_id: str, lang: str = "ar"):
+    job = _load_job(job_id)
+    if job is None:
+        return JSONResponse({"error": msg("job_not_found", lang)}, status_code=404)
+    if job["state"] != "done":
+        return JSONResponse(
+            {"error": job["error"] or msg("job_not_ready", lang), **_job_public(job)},
+            status_code=409,
+        )
+    path = JOBS_DIR / job_id / "result"
+    if not path.exists():
+        return JSONResponse({"error": msg("job_not_found", lang)}, status_code=404)
+    # نتيجة المهمة لا تتغير بعد انتهائها => معرّفها ETag ثابت لاستئناف التنزيل
+    return _file_response(path, job["media_type"], job["filename"], cache=None, etag=job_id)
+
+
+# ------------ Upload sessions (parallel chunked upload for images) ------------
+# الواجهة تصغّر الصور في المتصفح ثم ترفعها أجزاءً متوازية (PUT + Content-Range) إلى جلسة على القرص.
+# الجزء الأخير لكل صورة يجمعها ويجهّزها (_prepare_image) داخل صنف الصور وميزانية الذاكرة، بينما
+# بقية الصور ما زالت تُرفع؛ ثم finish يحوّل الدفعة إلى مهمة images-to-pdf تجمعها فقط.
+# الحالة كلها على القرص => أي worker يستقبل أي جزء
+UPLOAD_SESSION_DIR = Path(os.getenv("UPLOAD_SESSION_DIR", Path(tempfile.gettempdir()) / "pdfweb-uploads"))
+UPLOAD_CHUNK_MB = int(os.getenv("UPLOAD_CHUNK_MB", "1"))
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)$")
+
+
+def _upload_session(sid: str) -> Tuple[Path, dict] | None:
+    if not sid.isalnum():
+        return None
+    d = UPLOAD_SESSION_DIR / sid
+    try:
+        return d, json.loads((d / "session.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _pin_upload_total(d: Path, index: int, total: int) -> str | None:
+    # الحجم الكلي يُثبَّت مع أول جزء لكل صورة؛ => مفتاح خطأ أو None
+    path = d / f"{index}.total"
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            pinned = int(path.read_text() or -1)
+        except (OSError, ValueError):
+            pinned = -1
+        return None if pinned == total else "bad_upload_chunk"
+    with os.fdopen(fd, "w") as fh:
+        fh.write(str(total))
+    # حد الطلب الواحد (MAX_REQUEST_MB) يشمل كل صور الجلسة
+    pinned_sum = 0
+    for p in d.glob("*.total"):
+        try:
+            pinned_sum += int(p.read_text() or 0)
+        except (OSError, ValueError):
+            pass
+    if pinned_sum > MAX_REQUEST_MB * 1024 * 1024:
+        path.unlink(missing_ok=True)
+        return "request_too_large"
+    return None
+
+
+def _assemble_upload(d: Path, index: int, total: int) -> bool:
+    # => True إذا اكتملت الصورة بهذا الجزء وجُمعت هنا
+    parts = sorted(d.glob(f"{index}.*.part"))
+    pos = 0
+    for p in parts:
+        if int(p.name.split(".")[1]) != pos:
+            return False
+        pos += p.stat().st_size
+    if pos != total:
+        return False
+    # آخر جزأين قد يصلا إلى workers مختلفة معاً: واحد فقط يجمع
+    lock = d / f"{index}.lock"
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    # اسم مؤقت ثم os.replace: وجود d/index يعني صورة كاملة (upload_chunk يعتمد على ذلك عند الإعادة)،
+    # والأجزاء لا تُحذف إلا بعده => فشل الكتابة (قرص ممتلئ) يترك الجزء الأخير قابلاً للإعادة
+    tmp = d / f".{index}.{os.urandom(4).hex()}"
+    try:
+        with open(tmp, "wb") as out:
+            for p in parts:
+                with open(p, "rb") as fh:
+                    shutil.copyfileobj(fh, out, SPOOL_CHUNK)
+        os.replace(tmp, d / str(index))
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        lock.unlink(missing_ok=True)
+        raise
+    for p in parts:
+        p.unlink(missing_ok=True)
+    return True
+
+
+async def _prepare_upload(path: Path, session: dict):
+    # => path.prep: JPEG مصغّر، أو رابط للأصل إن كان صالحاً كما هو.
+    # bounded: الطابور الممتلئ => PoolBusy (503) والعميل يعيد إرسال الجزء الأخير
+    cost = await asyncio.to_thread(
+        _estimate_cost, [("image", path, path.name)], 0,
+        _image_opts("images-to-pdf", session["compress"], session["max_dpi"], session["style"]),
+    )
+    result = await _run_in_class(
+        "images-to-pdf",
+        lambda: _run_image_job(_prepare_image, str(path), session["compress"], session["max_dpi"], session["style"]),
+        cost=cost,
+    )
+    tmp = path.with_name(f".{path.name}.{os.urandom(4).hex()}")
+    if isinstance(result, bytes):
+        await asyncio.to_thread(tmp.write_bytes, result)
+    else:
+        os.link(path, tmp)
+    os.replace(tmp, path.with_name(path.name + ".prep"))
+
+
+@app.post("/api/uploads")
+def create_upload(
+    count: int = Form(...),
+    style: str = Form("full_bleed"),
+    compress: str = Form(None),
+    max_dpi: str = Form(""),
+    sizes: List[int] = Form(None),
+    names: List[str] = Form(None),
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    if count < 1:
+        return JSONResponse({"error": msg("no_images", lang)}, status_code=400)
+    if count > MAX_IMAGES:
+        return JSONResponse({"error": msg("too_many_images", lang, count=count, max=MAX_IMAGES)}, status_code=400)
+    # صورة 0 بايت لا ترسل أي جزء (Content-Range لا يصف جسماً فارغاً) => finish يبقى 409 للأبد
+    for i, size in enumerate(sizes or []):
+        if size <= 0:
+            name = names[i] if names and i < len(names) else f"#{i + 1}"
+            return JSONResponse({"error": msg("empty_image", lang, name=name)}, status_code=400)
+    sid = os.urandom(12).hex()
+    d = UPLOAD_SESSION_DIR / sid
+    d.mkdir(parents=True)
+    session = {
+        "count": count, "style": style, "compress": "1" if compress == "1" else None,
+        "max_dpi": _parse_max_dpi(max_dpi),
+    }
+    (d / "session.json").write_text(json.dumps(session))
+    return {"id": sid, "chunk": UPLOAD_CHUNK_MB * 1024 * 1024}
+
+
+@app.put("/api/uploads/{sid}/{index}")
+async def upload_chunk(request: Request, sid: str, index: int, name: str = "image", lang: str = "ar"):
+    lang = normalize_lang(lang)
+    found = _upload_session(sid)
+    if found is None:
+        return JSONResponse({"error": msg("upload_not_found", lang)}, status_code=404)
+    d, session = found
+    m = _CONTENT_RANGE.match(request.headers.get("content-range", ""))
+    if m is None or not 0 <= index < session["count"]:
+        return JSONResponse({"error": msg("bad_upload_chunk", lang)}, status_code=400)
+    start, end, total = (int(g) for g in m.groups())
+    if total > MAX_FILE_MB * 1024 * 1024:
+        return JSONResponse({"error": msg("file_too_large", lang, name=name, max=MAX_FILE_MB)}, status_code=413)
+    size = end - start + 1
+    if end < start or end >= total or size > UPLOAD_CHUNK_MB * 1024 * 1024:
+        return JSONResponse({"error": msg("bad_upload_chunk", lang)}, status_code=400)
+    if (d / f"{index}.json").exists():
+        return {"complete": True}  # إعادة إرسال بعد انقطاع
+    path = d / str(index)
+
+    if not path.exists():
+        error = await asyncio.to_thread(_pin_upload_total, d, index, total)
+        if error == "request_too_large":
+            return JSONResponse({"error": msg(error, lang, max=MAX_REQUEST_MB)}, status_code=413)
+        if error:
+            return JSONResponse({"error": msg(error, lang)}, status_code=400)
+        tmp = d / f".{index}.{start}.{os.urandom(4).hex()}"
+        received = 0
+        t0 = time.perf_counter()
+        try:
+            with open(tmp, "wb") as fh:
+                async for chunk in request.stream():
+                    received += len(chunk)
+                    if received > size:
+                        break
+                    await asyncio.to_thread(fh.write, chunk)
+        except OSError:
+            received = -1  # الجلسة حُذفت أثناء الرفع
+        record_stage("images-to-pdf", "upload_read", time.perf_counter() - t0)
+        if received != size:
+            tmp.unlink(missing_ok=True)
+            return JSONResponse({"error": msg("bad_upload_chunk", lang)}, status_code=400)
+        os.replace(tmp, d / f"{index}.{start:012d}.part")
+
+        if not await asyncio.to_thread(_assemble_upload, d, index, total):
+            return {"complete": False}
+        if await asyncio.to_thread(_sniff_file, path) != "image":
+            path.unlink(missing_ok=True)
+            (d / f"{index}.lock").unlink(missing_ok=True)
+            (d / f"{index}.total").unlink(missing_ok=True)
+            return JSONResponse({"error": msg("not_image", lang, name=name)}, status_code=400)
+        BYTES_IN.inc(total, tool="images-to-pdf")
+    # else: الصورة مجمّعة لكن تجهيزها رُفض سابقاً (503) => هذه إعادة المحاولة
+
+    try:
+        await _prepare_upload(path, session)
+    except PoolBusy:
+        return JSONResponse({"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "5"})
+    except JobError as e:
+        return JSONResponse({"error": msg(e.key, lang, **e.kwargs)}, status_code=413)
+    except Exception as e:
+        return JSONResponse({"error": msg("image_process_failed", lang, name=name, error=e)}, status_code=400)
+    (d / f"{index}.json").write_text(json.dumps({"name": name}))
+    return {"complete": True}
+
+
+@app.post("/api/uploads/{sid}/finish")
+async def finish_upload(
+    sid: str,
+    outfile: str = Form("images.pdf"),
+    per_file: str = Form(None),
+    linearize: str = Form(None),
+    lang: str = Form("ar"),
+):
+    lang = normalize_lang(lang)
+    found = _upload_session(sid)
+    if found is None:
+        return JSONResponse({"error": msg("upload_not_found", lang)}, status_code=404)
+    d, session = found
+    names: dict = {}
+    for i in range(session["count"]):
+        try:
+            names[i] = json.loads((d / f"{i}.json").read_text())["name"]
+        except (OSError, ValueError):
+            pass
+    if len(names) < session["count"]:
+        return JSONResponse(
+            {"error": msg("upload_incomplete", lang, done=len(names), total=session["count"])}, status_code=409
+        )
+    if _job_queue is None or _job_queue.full():
+        return JSONResponse(
+            {"error": msg("server_busy", lang)}, status_code=503, headers={"Retry-After": "10"}
+        )
+
+    # .json يُكتب بعد التجهيز => كل الصور جاهزة هنا
+    prepared = [d / f"{i}.prep" for i in range(session["count"])]
+    try:
+        # الصور مجهّزة مسبقاً => المهمة تمررها كما هي (نفس خيارات params أدناه)
+        cost = await asyncio.to_thread(
+            _estimate_cost, [("image", p, names[i]) for i, p in enumerate(prepared)], 0,
+            _image_opts("images-to-pdf", None, 0, session["style"]),
+        )
+        if cost > memory_budget.total:
+            raise JobError(
+                "request_too_expensive", need=cost // (1024 * 1024), budget=memory_budget.total // (1024 * 1024)
+            )
+    except JobError as e:
+        return JSONResponse({"error": msg(e.key, lang, **e.kwargs)}, status_code=413)
+
+    if not outfile.lower().endswith(".pdf"):
+        outfile += ".pdf"
+    job_id, job_dir = _new_job_dir()
+    inputs: List[Tuple[str, Path]] = []
+    for i, p in enumerate(prepared):
+        path = job_dir / f"in-{i}"
+        await asyncio.to_thread(shutil.move, p, path)
+        inputs.append((names[i], path))
+    shutil.rmtree(d, ignore_errors=True)
+
+    # prepared: المدخلات مصغّرة ومُطبّعة مسبقاً => المهمة تجمعها فقط بدون _prepare_image
+    params = {
+        "outfile": outfile, "per_file": per_file, "style": session["style"], "compress": None,
+        "max_dpi": 0, "linearize": linearize == "1", "prepared": True,
+    }
+    job = _submit_job(job_id, "images-to-pdf", lang, inputs, params)
+    return JSONResponse(_job_public(job), status_code=202)
@@ -0,0 +1,347 @@
+"""Benchmark / load test for /api/images-to-pdf, /api/merge-pdf and /api/compress-pdf.
+
+    python bench.py                       # in-process, quick corpus
+    python bench.py --mode both --full    # + local uvicorn, 1–1000 page PDFs, up to 50 MP images
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --baseline bench_baseline.json   # exit 1 on regression
+
+Requires httpx (pip install httpx); the corpus is generated offline into --corpus.
+"""
+from io import BytesIO
+from pathlib import Path
+from typing import List, Tuple
+import argparse, asyncio, json, os, socket, statistics, subprocess, sys, tempfile, threading, time
+
+from PIL import Image
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+import img2pdf
+
+BASE_DIR = Path(__file__).resolve().parent
+
+QUICK = {"megapixels": [1, 12], "pdf_pages": [1, 50, 200]}
+FULL = {"megapixels": [1, 12, 24, 50], "pdf_pages": [1, 50, 200, 1000]}
+
+
+# ------------ Corpus ------------
+def _mp_size(mp: float) -> Tuple[int, int]:
+    w = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+    return w, int(w * 3 / 4)
+
+
+def _photo(size: Tuple[int, int]) -> Image.Image:
+    # ضوضاء + تدرّج: أقرب لصورة كاميرا من لون ثابت (لا تنضغط بشكل غير واقعي)
+    w, h = size
+    noise = Image.effect_noise((w, h), 40).convert("L")
+    grad = Image.linear_gradient("L").resize((w, h))
+    return Image.merge("RGB", (noise, grad, grad.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def _make_images(root: Path, megapixels: List[float]) -> dict:
+    out = {}
+    for mp in megapixels:
+        img = _photo(_mp_size(mp))
+        for fmt, ext in (("JPEG", "jpg"), ("PNG", "png"), ("WEBP", "webp")):  # webp ≈ HEIC: يحتاج تحويلاً
+            path = root / f"img-{mp}mp.{ext}"
+            if not path.exists():
+                img.save(path, format=fmt, **({"quality": 88} if fmt != "PNG" else {}))
+            out[f"{ext}-{mp}mp"] = path
+    return out
+
+
+def _text_pdf(path: Path, pages: int):
+    writer = PdfWriter()
+    # قاموس الخط مباشر (inline) في كل صفحة: pypdf لا يوفّر API عامة لإضافة كائن غير مباشر
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for n in range(pages):
+        page = writer.add_blank_page(595, 842)
+        lines = "".join(f"0 -14 Td (Page {n + 1} line {i} lorem ipsum dolor sit amet) Tj " for i in range(45))
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 11 Tf 50 800 Td {lines}ET".encode())
+        page.replace_contents(stream)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+    with open(path, "wb") as fh:
+        writer.write(fh)
+
+
+def _scanned_pdf(path: Path, pages: int):
+    buf = BytesIO()
+    _photo((1240, 1754)).convert("L").save(buf, format="JPEG", quality=80)  # A4 @150dpi رمادي
+    with open(path, "wb") as fh:
+        img2pdf.convert([buf.getvalue()] * pages, outputstream=fh)
+
+
+def _make_pdfs(root: Path, page_counts: List[int]) -> dict:
+    out = {}
+    for pages in page_counts:
+        for kind, fn in (("text", _text_pdf), ("scanned", _scanned_pdf)):
+            path = root / f"{kind}-{pages}p.pdf"
+            if not path.exists():
+                fn(path, pages)
+            out[f"{kind}-{pages}p"] = path
+    return out
+
+
+def build_corpus(root: Path, spec: dict) -> Tuple[dict, dict]:
+    root.mkdir(parents=True, exist_ok=True)
+    return _make_images(root, spec["megapixels"]), _make_pdfs(root, spec["pdf_pages"])
+
+
+# ------------ Scenarios ------------
+def scenarios(images: dict, pdfs: dict, with_gs: bool) -> List[dict]:
+    out = []
+    for key, path in images.items():
+        out.append({
+            "name": f"images-to-pdf/{key}x5", "url": "/api/images-to-pdf",
+            "files": [("images", path, "image/" + path.suffix[1:])] * 5, "data": {"max_dpi": ""},
+        })
+    for key in [k for k in images if k.startswith("jpg-")]:
+        out.append({
+            "name": f"images-to-pdf/{key}x5@150dpi", "url": "/api/images-to-pdf",
+            "files": [("images", images[key], "image/jpeg")] * 5, "data": {"max_dpi": "150"},
+        })
+    for key, path in pdfs.items():
+        out.append({
+            "name": f"merge-pdf/{key}x3", "url": "/api/merge-pdf",
+            "files": [("files", path, "application/pdf")] * 3, "data": {},
+        })
+        if with_gs:
+            out.append({
+                "name": f"compress-pdf/{key}", "url": "/api/compress-pdf",
+                "files": [("file", path, "application/pdf")], "data": {"level": "medium"},
+            })
+    return out
+
+
+# ------------ Drivers ------------
+def _percentile(values: List[float], q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def _tree_rss_kb(root: int) -> int:
+    # RSS الحالي للعملية وكل أبنائها (gs، soffice، workers الصور، workers الخادم)
+    parents = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = Path(f"/proc/{entry.name}/stat").read_text()
+            parents.setdefault(int(stat.rsplit(")", 1)[1].split()[1]), []).append(int(entry.name))
+        except (OSError, ValueError, IndexError):
+            continue
+    total, stack = 0, [root]
+    while stack:
+        pid = stack.pop()
+        stack.extend(parents.get(pid, ()))
+        try:
+            for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+                    break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    # ذروة مجموع RSS لشجرة العمليات خلال سيناريو واحد فقط
+    # (ru_maxrss/VmHWM تراكمية طوال عمر العملية ولا تشمل الأبناء)
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak_kb = max(self.peak_kb, _tree_rss_kb(self.pid))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        if Path("/proc").is_dir():
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    @property
+    def peak_mb(self) -> float:
+        return self.peak_kb / 1024.0
+
+
+async def _run_scenario(client, sc: dict, requests: int, concurrency: int, server_pid: int | None) -> dict:
+    payload = [(field, (path.name, path.read_bytes(), ctype)) for field, path, ctype in sc["files"]]
+    in_bytes = sum(len(f[1][1]) for f in payload)
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    out_sizes: List[int] = []
+    errors = 0
+
+    async def _one(i: int):
+        nonlocal errors
+        async with sem:
+            data = {**sc["data"], "outfile": f"bench-{i}.pdf", "lang": "en"}
+            t0 = time.perf_counter()
+            r = await client.post(sc["url"], files=payload, data=data)
+            body = r.content
+            latencies.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                errors += 1
+            else:
+                out_sizes.append(len(body))
+
+    with RssSampler(server_pid or os.getpid()) as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(_one(i) for i in range(requests)))
+        wall = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "rps": round(requests / wall, 2),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "size_ratio": round(statistics.mean(out_sizes) / in_bytes, 3) if out_sizes else None,
+    }
+
+
+async def _bench_inprocess(scs, requests, concurrencies) -> dict:
+    import httpx
+    import app as pdfweb
+
+    results = {}
+    async with pdfweb.lifespan(pdfweb.app):
+        transport = httpx.ASGITransport(app=pdfweb.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for sc in scs:
+                for c in concurrencies:
+                    key = f"inproc/{sc['name']}/c{c}"
+                    results[key] = await _run_scenario(client, sc, requests, c, None)
+                    print(key, results[key], flush=True)
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _bench_uvicorn(scs, requests, concurrencies) -> dict:
+    import httpx
+
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BASE_DIR,
+    )
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/healthz")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            for sc in scs:
+                for c in concurrencies:
+                    key = f"uvicorn/{sc['name']}/c{c}"
+                    results[key] = await _run_scenario(client, sc, requests, c, proc.pid)
+                    print(key, results[key], flush=True)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return results
+
+
+# ------------ Baseline ------------
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for key, cur in results.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        for metric in ("p95_ms", "peak_rss_mb"):
+            if old.get(metric) and cur.get(metric) and cur[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {old[metric]} -> {cur[metric]}")
+        if old.get("rps") and cur.get("rps") and cur["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{key}: rps {old['rps']} -> {cur['rps']}")
+        # أي خطأ جديد تراجع مهما كانت السرعة؛ baseline بلا الحقل = 0
+        if cur.get("errors", 0) > old.get("errors", 0):
+            regressions.append(f"{key}: errors {old.get('errors', 0)} -> {cur['errors']}")
+        # حجم الناتج في الاتجاهين: أكبر = ضغط أسوأ، أصغر بكثير = صفحات أو صور ناقصة غالباً
+        ratio_old, ratio_cur = old.get("size_ratio"), cur.get("size_ratio")
+        if ratio_old and ratio_cur is not None and abs(ratio_cur - ratio_old) > ratio_old * tolerance:
+            regressions.append(f"{key}: size_ratio {ratio_old} -> {ratio_cur}")
+    return regressions
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--mode", choices=["inproc", "uvicorn", "both"], default="inproc")
+    p.add_argument("--full", action="store_true", help="corpus كامل (حتى 50 MP و1000 صفحة)")
+    p.add_argument("--corpus", type=Path, default=Path(tempfile.gettempdir()) / "pdfweb-bench-corpus")
+    p.add_argument("--requests", type=int, default=8, help="طلبات لكل سيناريو")
+    p.add_argument("--concurrency", default="1,4", help="مثال: 1,4,16 (1 = تسلسلي)")
+    p.add_argument("--filter", default="", help="تشغيل السيناريوهات التي يحتوي اسمها على أحد هذه النصوص (مفصولة بفواصل)")
+    p.add_argument("--out", type=Path, help="حفظ النتائج JSON")
+    p.add_argument("--baseline", type=Path, help="مقارنة مع ملف baseline")
+    p.add_argument("--save-baseline", type=Path)
+    p.add_argument("--tolerance", type=float, default=0.25)
+    args = p.parse_args()
+
+    # قياس العمل الحقيقي، لا الكاش
+    os.environ.setdefault("RESULT_CACHE_TTL", "0")
+    # ملفات الـ corpus الممسوحة (200+ صفحة) أكبر من حد الرفع الافتراضي؛ نقيس المعالجة لا رفض 413
+    os.environ.setdefault("MAX_FILE_MB", "2048")
+    os.environ.setdefault("MAX_REQUEST_MB", "8192")
+    sys.path.insert(0, str(BASE_DIR))
+
+    images, pdfs = build_corpus(args.corpus, FULL if args.full else QUICK)
+    import app as pdfweb
+    filters = [f for f in args.filter.split(",") if f] or [""]
+    scs = [
+        sc for sc in scenarios(images, pdfs, pdfweb.GS_BIN is not None)
+        if any(f in sc["name"] for f in filters)
+    ]
+    concurrencies = [int(c) for c in args.concurrency.split(",") if c]
+
+    results = {}
+    if args.mode in ("inproc", "both"):
+        results.update(asyncio.run(_bench_inprocess(scs, args.requests, concurrencies)))
+    if args.mode in ("uvicorn", "both"):
+        results.update(asyncio.run(_bench_uvicorn(scs, args.requests, concurrencies)))
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2, sort_keys=True))
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
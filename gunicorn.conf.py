@@ -0,0 +1,42 @@
+"""Production server: preforked uvicorn workers with the app preloaded.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Development still runs a single process: uvicorn app:app --reload
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or max(2, multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# التطبيق يُحمّل مرة في العملية الرئيسية ثم fork: الوحدات (pypdf, PIL, img2pdf) والقوالب مشتركة
+preload_app = True
+
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))  # OCR والضغط قد تطول
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+# إعادة تدوير الـ worker من وقت لآخر (تجزؤ ذاكرة PIL/pypdf)
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = "-" if os.getenv("ACCESS_LOG", "0") == "1" else None
+
+# كل worker يقرأ *_WORKERS عند الاستيراد؛ نقسم الأنوية بينها بدل أن يطلب كل واحد cpu_count عملية
+_cpus = multiprocessing.cpu_count()
+for _name in ("IMAGE_WORKERS", "GS_WORKERS", "OCR_WORKERS", "THUMB_WORKERS"):
+    os.environ.setdefault(_name, str(max(1, _cpus // workers)))
+# LibreOffice: كل نسخة ~200-300 MB وهي خاملة وتكبر حتى OFFICE_MAX_RSS_MB (1 GB) قبل إعادة تشغيلها،
+# والعدد الكلي = workers × OFFICE_WORKERS. لذلك لا نسخ عند الإقلاع: كل worker يشغّل نسخته عند أول
+# تحويل يصله (ثوانٍ لأول طلب فقط). OFFICE_WARM=1 لتسخينها في كل worker مسبقاً إن كانت الذاكرة تكفي
+os.environ.setdefault("OFFICE_WORKERS", "1")
+os.environ.setdefault("OFFICE_WARM", "0")
+os.environ["WEB_CONCURRENCY"] = str(workers)  # ميزانية الذاكرة الافتراضية تُقسم على الـ workers
+
+
+def on_starting(server):
+    # preload_app استورد app قبل هذه النقطة
+    import app
+
+    app.warm_up()
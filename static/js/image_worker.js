@@ -0,0 +1,53 @@
+// Web Worker: يصغّر الصورة في المتصفح إلى دقة صفحة A4 المطلوبة ويعيد ترميزها JPEG قبل الرفع.
+// نفس حساب _target_scale في app.py حتى تطابق النتيجة ما كان الخادم سيفعله.
+const A4_MM = [210, 297];
+
+function targetScale(w, h, maxDpi, style){
+  const margin = style === 'a4_margins' ? 16 : 0;
+  const shortPx = (A4_MM[0] - margin) / 25.4 * maxDpi;
+  const longPx  = (A4_MM[1] - margin) / 25.4 * maxDpi;
+  return Math.min(1, longPx / Math.max(w, h), shortPx / Math.min(w, h));
+}
+
+// canvas لا يكتب الدقة: نضعها في ترويسة JFIF حتى يبقى حجم الصفحة كما يحسبه img2pdf
+function setJfifDpi(bytes, dpi){
+  const jfif = bytes[2] === 0xFF && bytes[3] === 0xE0 &&
+    String.fromCharCode(bytes[6], bytes[7], bytes[8], bytes[9]) === 'JFIF' && bytes[10] === 0;
+  if (!jfif) return;
+  bytes[13] = 1;  // الوحدة: بكسل لكل إنش
+  bytes[14] = bytes[16] = dpi >> 8;
+  bytes[15] = bytes[17] = dpi & 0xFF;
+}
+
+async function prepare({ file, maxDpi, style }){
+  const bmp = await createImageBitmap(file, { imageOrientation: 'from-image' });
+  const scale = targetScale(bmp.width, bmp.height, maxDpi, style);
+  if (scale >= 1){
+    // لا فائدة من إعادة الترميز: نرفع الأصل كما هو
+    bmp.close();
+    return file;
+  }
+  const w = Math.max(1, Math.round(bmp.width * scale));
+  const h = Math.max(1, Math.round(bmp.height * scale));
+  const canvas = new OffscreenCanvas(w, h);
+  const ctx = canvas.getContext('2d');
+  ctx.fillStyle = '#fff';  // الشفافية => أبيض كما في _ensure_rgb
+  ctx.fillRect(0, 0, w, h);
+  ctx.imageSmoothingQuality = 'high';
+  ctx.drawImage(bmp, 0, 0, w, h);
+  bmp.close();
+  const out = new Uint8Array(await (await canvas.convertToBlob({ type: 'image/jpeg', quality: 0.85 })).arrayBuffer());
+  setJfifDpi(out, maxDpi);
+  return new Blob([out], { type: 'image/jpeg' });
+}
+
+// صورة واحدة في كل مرة: فك عدة صور من كاميرا الجوال معاً يستهلك الذاكرة بسرعة
+let chain = Promise.resolve();
+self.onmessage = (e) => {
+  const { id } = e.data;
+  chain = chain
+    .then(() => prepare(e.data))
+    // صيغة لا يفكها المتصفح => نرفع الأصل كما هو؛ الخادم يقبل صيغه فقط (HEIC مثلاً يُرفض بـ not_image)
+    .catch(() => e.data.file)
+    .then(blob => self.postMessage({ id, blob }));
+};
@@ -0,0 +1,99 @@
+import asyncio
+import os
+from io import BytesIO
+from types import SimpleNamespace
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pytest
+
+import app as pdfweb
+from app import ResultCache
+
+
+def test_stream_zip_emits_each_member_as_it_arrives():
+    text = b"%PDF-1.4 " + b"stream of text " * 4000   # يُضغط => deflate
+    packed = os.urandom(100_000)                       # مضغوط أصلاً => stored
+    produced = []
+    chunks = []
+
+    async def entries():
+        for name, data in (("a.pdf", text), ("b.pdf", packed)):
+            produced.append(name)
+            yield name, data
+
+    async def collect():
+        async for chunk in pdfweb._stream_zip(entries()):
+            chunks.append((len(produced), chunk))
+
+    asyncio.run(collect())
+    # العضو الأول أُرسل قبل إنتاج الثاني
+    assert chunks[0][0] == 1 and len(chunks[0][1]) > 0
+    with ZipFile(BytesIO(b"".join(c for _, c in chunks))) as zf:
+        assert zf.namelist() == ["a.pdf", "b.pdf"]
+        assert zf.read("a.pdf") == text and zf.read("b.pdf") == packed
+        assert zf.getinfo("a.pdf").compress_type == ZIP_DEFLATED
+        assert zf.getinfo("b.pdf").compress_type == ZIP_STORED
+        assert zf.testzip() is None
+
+
+def test_zip_sink_is_not_seekable():
+    sink = pdfweb._ZipSink()
+    assert not hasattr(sink, "seek")
+    sink.write(b"abc")
+    assert sink.tell() == 3 and sink.drain() == b"abc" and sink.drain() == b""
+
+
+@pytest.fixture
+def batch(tmp_path, monkeypatch):
+    # gs مزيّف يكتب ناتجاً بالحجم المطلوب؛ الكاش معطّل
+    monkeypatch.setattr(pdfweb, "result_cache", ResultCache(tmp_path / "cache", 0, 0))
+    out_size = {}
+
+    async def fake_run(cmd, *args, **kwargs):
+        size = out_size["n"]
+        if isinstance(size, BaseException):
+            raise size
+        if size is not None:
+            dst = next(a[len("-sOutputFile="):] for a in cmd if a.startswith("-sOutputFile="))
+            with open(dst, "wb") as fh:
+                fh.write(b"x" * size)
+        return 0, b"", b"gs error"
+
+    monkeypatch.setattr(pdfweb.gs_pool, "run", fake_run)
+
+    def run(size, kind="pdf", in_size=1000):
+        out_size["n"] = size
+        src = tmp_path / "in.pdf"
+        src.write_bytes(b"x" * in_size)
+        f = SimpleNamespace(filename="a.pdf", kind=kind, size=in_size, sha256="0" * 64, path=src)
+        dst = tmp_path / "out.pdf"
+        params = {"level": "medium", "dpi": "150", "grayscale": None}
+        entry, result = asyncio.run(pdfweb._compress_batch_file(f, dst, params, asyncio.Semaphore(1), "en"))
+        return entry, result, dst
+
+    return run
+
+
+def test_batch_keeps_smaller_output(batch):
+    entry, result, dst = batch(400)
+    assert entry["status"] == "ok" and (entry["in"], entry["out"], entry["ratio"]) == (1000, 400, 0.4)
+    assert result == dst and dst.stat().st_size == 400
+
+
+@pytest.mark.parametrize("size", [1000, 1500])
+def test_batch_skips_output_not_smaller(batch, size):
+    # مساوٍ أو أكبر => "larger" ولا يدخل الـ ZIP
+    entry, result, dst = batch(size)
+    assert entry["status"] == "larger" and entry["out"] == size
+    assert result is None and not dst.exists()
+
+
+def test_batch_non_pdf_is_reported_not_compressed(batch):
+    entry, result, _ = batch(400, kind="image")
+    assert entry["status"] == "not_pdf" and result is None
+
+
+@pytest.mark.parametrize("failure", [None, asyncio.TimeoutError(), pdfweb.PoolBusy()])
+def test_batch_gs_failure_is_per_file(batch, failure):
+    entry, result, _ = batch(failure)
+    assert entry["status"] == "failed" and entry["error"] and result is None
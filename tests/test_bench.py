@@ -0,0 +1,20 @@
+import bench
+
+
+def test_compare_flags_new_errors():
+    base = {"merge": {"p95_ms": 100, "errors": 0}, "ocr": {"errors": 2}}
+    cur = {"merge": {"p95_ms": 100, "errors": 1}, "ocr": {"errors": 2}}
+    assert bench.compare(cur, base, 0.25) == ["merge: errors 0 -> 1"]
+
+
+def test_compare_flags_size_ratio_drift_both_ways():
+    base = {"a": {"size_ratio": 0.5}, "b": {"size_ratio": 0.5}, "c": {"size_ratio": 0.5}}
+    cur = {"a": {"size_ratio": 0.7}, "b": {"size_ratio": 0.3}, "c": {"size_ratio": 0.6}}
+    assert bench.compare(cur, base, 0.25) == ["a: size_ratio 0.5 -> 0.7", "b: size_ratio 0.5 -> 0.3"]
+
+
+def test_compare_ignores_missing_baseline_fields():
+    # baseline قديم بلا errors/size_ratio، أو سيناريو بلا ناتج
+    base = {"a": {"p95_ms": 100}, "b": {"size_ratio": 0.5}}
+    cur = {"a": {"p95_ms": 110, "errors": 0, "size_ratio": 0.4}, "b": {"size_ratio": None}, "new": {"errors": 3}}
+    assert bench.compare(cur, base, 0.25) == []
@@ -0,0 +1,91 @@
+import os
+import time
+
+import pytest
+
+import app as pdfweb
+from app import ResultCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfweb, "RESULT_CACHE_EVICT_INTERVAL", 0.0)  # كل كتابة تمسح
+    return ResultCache(tmp_path / "cache", max_bytes=3000, ttl=60)
+
+
+def age(path, created_ago: float, used_ago: float | None = None):
+    now = time.time()
+    os.utime(path, (now - (created_ago if used_ago is None else used_ago), now - created_ago))
+
+
+def test_put_and_read(cache):
+    key = cache.key("merge-pdf", ["a", "b"], {"order": "name"})
+    assert key != cache.key("merge-pdf", ["b", "a"], {"order": "name"})
+    assert key != cache.key("merge-pdf", ["a", "b"], {"order": "as_is"})
+    assert cache.read(key) is None
+    cache.put_bytes(key, b"pdf")
+    assert cache.read(key) == b"pdf"
+    assert [p.name for p in cache.root.iterdir()] == [key]  # لا ملفات .tmp- متبقية
+
+
+def test_ttl_is_absolute(cache):
+    # الاستخدام يحدّث atime فقط؛ الصلاحية تُحسب من وقت الإنشاء
+    cache.put_bytes("k", b"x")
+    age(cache.root / "k", created_ago=50)
+    assert cache.get("k") is not None
+    st = (cache.root / "k").stat()
+    assert time.time() - st.st_mtime == pytest.approx(50, abs=1)
+    assert time.time() - st.st_atime < 2
+    age(cache.root / "k", created_ago=61, used_ago=0)
+    assert cache.get("k") is None
+    assert not (cache.root / "k").exists()
+
+
+def test_lru_eviction_keeps_recently_used(cache):
+    for name in ("a", "b", "c"):
+        cache.put_bytes(name, b"x" * 1000)
+    age(cache.root / "a", created_ago=30, used_ago=1)   # أقدم إنشاءً لكن استُخدم للتو
+    age(cache.root / "b", created_ago=20, used_ago=20)
+    age(cache.root / "c", created_ago=10, used_ago=10)
+    cache.put_bytes("d", b"x" * 1000)
+    assert sorted(p.name for p in cache.root.iterdir()) == ["a", "c", "d"]
+
+
+def test_eviction_drops_expired_and_stale_temp_files(cache):
+    cache.put_bytes("old", b"x")
+    age(cache.root / "old", created_ago=120)
+    stale = cache.root / ".tmp-crashed"
+    stale.write_bytes(b"x")
+    age(stale, created_ago=7200)
+    fresh = cache.root / ".hold-inflight"
+    fresh.write_bytes(b"x")
+    cache.put_bytes("new", b"x")
+    assert sorted(p.name for p in cache.root.iterdir()) == [".hold-inflight", "new"]
+
+
+def test_hold_survives_eviction_and_expiry(cache):
+    cache.put_bytes("k", b"result")
+    held = cache.hold("k")
+    assert held is not None and held.name.startswith(".hold-")
+    age(cache.root / "k", created_ago=120)
+    cache.put_bytes("other", b"x" * 2999)  # مسح: "k" منتهية، والحد ممتلئ
+    assert not (cache.root / "k").exists()
+    assert held.read_bytes() == b"result"  # الطلب الجاري ما زال يرسل نسخته
+    held.unlink()
+    assert cache.hold("k") is None
+
+
+def test_put_file_copies_source(cache, tmp_path):
+    src = tmp_path / "src.pdf"
+    src.write_bytes(b"%PDF-1.4 data")
+    cache.put_file("k", src)
+    src.unlink()
+    assert cache.read("k") == b"%PDF-1.4 data"
+
+
+@pytest.mark.parametrize("max_bytes, ttl", [(0, 60), (3000, 0)])
+def test_disabled(tmp_path, max_bytes, ttl):
+    cache = ResultCache(tmp_path / "c", max_bytes=max_bytes, ttl=ttl)
+    cache.put_bytes("k", b"x")
+    assert cache.get("k") is None and cache.hold("k") is None
+    assert not (tmp_path / "c").exists()
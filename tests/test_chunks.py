@@ -0,0 +1,61 @@
+import pytest
+
+import app as pdfweb
+
+MB = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def chunk_settings(monkeypatch):
+    monkeypatch.setattr(pdfweb, "GS_CHUNK_MIN_PAGES", 80)
+    monkeypatch.setattr(pdfweb, "GS_CHUNK_MIN_MB", 25)
+    monkeypatch.setattr(pdfweb, "GS_CHUNK_PAGES", 25)
+    monkeypatch.setattr(pdfweb, "GS_CHUNK_PARALLEL", 4)
+
+
+def covers(ranges, pages):
+    # متتالية، بلا فجوات ولا تداخل، من 1 إلى آخر صفحة
+    assert ranges[0][0] == 1 and ranges[-1][1] == pages
+    for (_, last), (first, _) in zip(ranges, ranges[1:]):
+        assert first == last + 1
+    return True
+
+
+@pytest.mark.parametrize("pages, size", [(79, 1 * MB), (10, 1 * MB), (0, 0)])
+def test_small_documents_run_as_one_gs(pages, size):
+    assert pdfweb._plan_chunks(pages, size) == []
+
+
+def test_too_few_pages_for_two_chunks():
+    # كبير بالحجم لكن 40 صفحة < صفحتين × GS_CHUNK_PAGES
+    assert pdfweb._plan_chunks(40, 100 * MB) == []
+
+
+def test_split_evenly_with_remainder_first():
+    # 80 صفحة => 3 أجزاء (80 // 25)؛ الصفحتان الزائدتان في الأجزاء الأولى
+    ranges = pdfweb._plan_chunks(80, 1 * MB)
+    assert ranges == [(1, 27), (28, 54), (55, 80)]
+    assert covers(ranges, 80)
+
+
+def test_capped_by_parallel_limit():
+    ranges = pdfweb._plan_chunks(1000, 1 * MB)
+    assert len(ranges) == 4
+    assert covers(ranges, 1000)
+    assert {last - first + 1 for first, last in ranges} == {250}
+
+
+def test_size_alone_triggers_chunking():
+    assert pdfweb._plan_chunks(60, 30 * MB) == [(1, 30), (31, 60)]
+
+
+def test_single_worker_never_chunks(monkeypatch):
+    monkeypatch.setattr(pdfweb, "GS_CHUNK_PARALLEL", 1)
+    assert pdfweb._plan_chunks(1000, 500 * MB) == []
+
+
+@pytest.mark.parametrize("pages", [50, 51, 99, 100, 101, 257, 999])
+def test_every_page_in_exactly_one_chunk(pages):
+    ranges = pdfweb._plan_chunks(pages, 100 * MB)
+    assert ranges and covers(ranges, pages)
+    assert all(last - first + 1 >= 25 for first, last in ranges)
@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import img2pdf
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+
+import app as pdfweb
+
+
+def photo(path, size, orientation=None):
+    img = Image.new("RGB", size, (200, 120, 40))
+    exif = Image.Exif()
+    if orientation:
+        exif[pdfweb._EXIF_ORIENTATION_TAG] = orientation
+    img.save(path, format="JPEG", quality=80, exif=exif)
+    return str(path)
+
+
+def displayed(pdf: bytes):
+    # => (أبعاد الصفحة كما تُعرض، أبعاد الصورة المرسومة) بعد تطبيق /Rotate
+    page = PdfReader(BytesIO(pdf)).pages[0]
+    w, h = float(page.mediabox.width), float(page.mediabox.height)
+    m = re.search(rb"([\d.]+) 0 0 ([\d.]+) [\d.]+ [\d.]+ cm", page.get_contents().get_data())
+    iw, ih = float(m.group(1)), float(m.group(2))
+    if (page.get("/Rotate") or 0) % 180:
+        w, h, iw, ih = h, w, ih, iw
+    return (round(w), round(h)), (round(iw), round(ih))
+
+
+@pytest.mark.parametrize("orientation", [6, 8])
+def test_a4_margins_rotated_phone_photo_matches_upright(tmp_path, orientation):
+    # صورة جوال عمودية مخزنة بالعرض (4:3) مع EXIF 6/8 => نفس صفحة الصورة العمودية الحقيقية
+    rotated = photo(tmp_path / "rot.jpg", (400, 300), orientation)
+    upright = photo(tmp_path / "up.jpg", (300, 400))
+    page, image = displayed(pdfweb._image_to_pdf(rotated, None, "a4_margins"))
+    assert (page, image) == displayed(pdfweb._image_to_pdf(upright, None, "a4_margins"))
+    assert page[0] < page[1]          # A4 عمودية
+    assert image[0] < image[1]        # والصورة عمودية أيضاً
+    # 3:4 أضيق من صندوق A4 => العرض يملأ الصندوق (≈550x733pt لا 550x412pt)
+    assert image[0] == pytest.approx(page[0] - 2 * img2pdf.mm_to_pt(8.0), abs=1)
+    assert image[1] == pytest.approx(image[0] * 4 / 3, abs=1)
+
+
+def test_full_bleed_keeps_jpeg_passthrough(tmp_path):
+    # بدون هوامش الصفحة تأخذ أبعاد الصورة و/Rotate يكفي: لا فك ولا إعادة ترميز
+    src = photo(tmp_path / "rot.jpg", (400, 300), 6)
+    assert pdfweb._prepare_image(src, None, 0, "full_bleed") == src
+    page, image = displayed(pdfweb._image_to_pdf(src, None, "full_bleed"))
+    assert page[0] < page[1] and image == page
+
+
+def _square(x):
+    return x * x
+
+
+def _crash(_):
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+@pytest.fixture
+def image_pool(monkeypatch):
+    monkeypatch.setattr(pdfweb, "IMAGE_ENGINE", "process")
+    monkeypatch.setattr(pdfweb, "IMAGE_WORKERS", 2)
+    pdfweb._shutdown_image_pool()
+    yield
+    pdfweb._shutdown_image_pool()
+
+
+def test_image_pool_recovers_from_killed_child(image_pool):
+    # عملية فرعية قُتلت من الخارج (OOM) => الطلب التالي يُعاد على pool جديد وينجح
+    assert asyncio.run(pdfweb._run_image_job(_square, 3)) == 9
+    for child in multiprocessing.active_children():
+        os.kill(child.pid, signal.SIGKILL)
+    time.sleep(0.2)
+    assert asyncio.run(pdfweb._run_image_job(_square, 4)) == 16
+
+
+def test_image_pool_fails_only_the_crashing_request(image_pool):
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(pdfweb._run_image_job(_crash, 0))
+    assert asyncio.run(pdfweb._run_image_job(_square, 5)) == 25
+
+
+def test_decode_cost_follows_prepare_image(tmp_path):
+    # التقدير يحسب الفك فقط حيث يفك _prepare_image فعلاً
+    jpeg = photo(tmp_path / "a.jpg", (4000, 3000))
+    rotated = photo(tmp_path / "r.jpg", (4000, 3000), 6)
+    rgba = tmp_path / "a.png"
+    Image.new("RGBA", (4000, 3000)).save(rgba)
+    full = 4000 * 3000 * (3 + 3)
+    cost = pdfweb._image_decode_cost
+    assert cost(jpeg, "a.jpg", (None, 0, "full_bleed")) == 0
+    assert cost(rotated, "r.jpg", (None, 0, "full_bleed")) == 0
+    assert cost(rotated, "r.jpg", (None, 0, "a4_margins")) == full
+    assert cost(rgba, "a.png", (None, 0, "full_bleed")) == 4000 * 3000 * (4 + 3)
+    assert cost(jpeg, "a.jpg", None) == full  # OCR وغيرها
+    # 150 DPI على A4 => ~1754px للضلع الطويل: draft بمقياس 1/2
+    assert pdfweb._target_scale((4000, 3000), 150, "full_bleed") < 0.5
+    assert cost(jpeg, "a.jpg", (None, 150, "full_bleed")) == 2000 * 1500 * (3 + 3)
+    # 72 DPI => ~842px: draft بمقياس 1/4
+    assert cost(jpeg, "a.jpg", (None, 72, "full_bleed")) == 1000 * 750 * (3 + 3)
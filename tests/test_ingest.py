@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+
+import pytest
+from starlette.datastructures import Headers
+
+import app as pdfweb
+from app import UploadRejected, _SNIFF_BYTES, _UploadIngest
+
+BOUNDARY = b"----pdfwebtestboundary"
+PDF = b"%PDF-1.4\n" + b"0" * (3 * _SNIFF_BYTES) + b"\n%%EOF\n"
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 200
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, chunk: int):
+        self.headers = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY.decode()}"})
+        self.query_params = {}
+        self._body = body
+        self._chunk = chunk
+
+    async def stream(self):
+        for i in range(0, len(self._body), self._chunk):
+            yield self._body[i:i + self._chunk]
+
+
+def multipart(*parts) -> bytes:
+    # parts: (name, filename|None, data)
+    out = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        out += b"--" + BOUNDARY + b"\r\nContent-Disposition: " + disposition.encode() + b"\r\n\r\n" + data + b"\r\n"
+    return out + b"--" + BOUNDARY + b"--\r\n"
+
+
+def ingest(body: bytes, chunk: int = 65536):
+    ing = _UploadIngest(FakeRequest(body, chunk))
+    form = asyncio.run(ing.parse())
+    return ing, form
+
+
+@pytest.mark.parametrize("chunk", [1, 7, len(BOUNDARY) - 1, len(BOUNDARY) + 3, _SNIFF_BYTES + 1, 65536])
+def test_boundary_split_across_chunks(chunk):
+    body = multipart(("lang", None, b"en"), ("files", "a.pdf", PDF), ("files", "b.pdf", PDF))
+    ing, form = ingest(body, chunk)
+    assert form["lang"] == "en"
+    files = form.getlist("files")
+    assert [f.filename for f in files] == ["a.pdf", "b.pdf"]
+    assert files[0].path.read_bytes() == PDF
+    assert files[0].sha256 == hashlib.sha256(PDF).hexdigest()
+    assert files[0].kind == "pdf"
+    for f in ing.files:
+        f.discard()
+
+
+def test_empty_file_field_is_dropped():
+    ing, form = ingest(multipart(("files", "", b""), ("files", "a.pdf", PDF)))
+    assert [f.filename for f in form.getlist("files")] == ["a.pdf"]
+    for f in ing.files:
+        f.discard()
+
+
+@pytest.mark.parametrize("data", [PDF[:100], PDF], ids=["under-sniff", "over-sniff"])
+def test_empty_filename_with_content_is_kept(data):
+    # أكبر من _SNIFF_BYTES أو أصغر: المحتوى موجود فلا يُحذف لمجرد غياب الاسم
+    ing, form = ingest(multipart(("file", "", data)), chunk=256)
+    (f,) = form.getlist("file")
+    assert f.filename == ""
+    assert f.kind == "pdf"
+    assert f.path.read_bytes() == data
+    assert f.size == len(data)
+    f.discard()
+
+
+def test_file_too_large(monkeypatch):
+    monkeypatch.setattr(pdfweb, "MAX_FILE_MB", 0)
+    with pytest.raises(UploadRejected) as exc:
+        ingest(multipart(("file", "a.pdf", PDF)))
+    assert exc.value.status == 413
+    assert exc.value.key == "file_too_large"
+
+
+def test_request_too_large(monkeypatch):
+    monkeypatch.setattr(pdfweb, "MAX_REQUEST_MB", 0)
+    with pytest.raises(UploadRejected) as exc:
+        ingest(multipart(("file", "a.pdf", PDF)))
+    assert exc.value.status == 413
+    assert exc.value.key == "request_too_large"
+
+
+def test_oversized_text_field():
+    with pytest.raises(UploadRejected) as exc:
+        ingest(multipart(("outfile", None, b"x" * (pdfweb.MAX_FIELD_BYTES + 1))))
+    assert exc.value.key == "bad_upload"
+
+
+@pytest.mark.parametrize("field, data, key", [
+    ("file", JPEG, "must_be_pdf"),
+    ("images", PDF, "not_image"),
+    ("document", PDF, "not_office"),
+])
+def test_magic_bytes_rejected(field, data, key):
+    with pytest.raises(UploadRejected) as exc:
+        ingest(multipart((field, "x.bin", data)), chunk=64)
+    assert exc.value.status == 400
+    assert exc.value.key == key
+
+
+def test_magic_bytes_skipped_for_merge():
+    # الدمج يتجاهل غير الـ PDF بدل رفض الطلب كله؛ لا شيء يُكتب على القرص
+    ing, form = ingest(multipart(("files", "x.jpg", JPEG), ("files", "a.pdf", PDF)))
+    skipped, kept = form.getlist("files")
+    assert skipped.kind != "pdf" and skipped.path.stat().st_size == 0
+    assert kept.kind == "pdf"
+    for f in ing.files:
+        f.discard()
@@ -0,0 +1,163 @@
+import asyncio
+import re
+
+import img2pdf
+import pytest
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+import app as pdfweb
+
+
+def blank_pdf(path, pages: int, width: int = 200):
+    writer = PdfWriter()
+    for n in range(pages):
+        writer.add_blank_page(width + n, 300)  # العرض يميّز الصفحة
+    with open(path, "wb") as fh:
+        writer.write(fh)
+    return path
+
+
+def image_pdf(path, jpeg: bytes):
+    path.write_bytes(img2pdf.convert(jpeg))
+    return path
+
+
+@pytest.mark.parametrize("picked, expected", [
+    ([0, 1, 2, 6, 4, 3], "1-3,7,5-4"),
+    ([9], "10"),
+    ([0, 2, 4], "1,3,5"),
+    ([4, 3, 2, 1, 0], "5-1"),
+    ([], ""),
+])
+def test_qpdf_ranges(picked, expected):
+    assert pdfweb._qpdf_ranges(picked) == expected
+
+
+def test_plan_merge_selection_and_errors(tmp_path):
+    a = blank_pdf(tmp_path / "a.pdf", 5)
+    b = blank_pdf(tmp_path / "b.pdf", 3)
+    bad = tmp_path / "bad.pdf"
+    bad.write_bytes(b"%PDF-1.4\nnot really")
+    entries = [("a.pdf", a), ("bad.pdf", bad), ("b.pdf", b), ("a2.pdf", a)]
+    selection = [[(5, 4), (1, 1)], None, [(2, 9)], []]
+    plan, total, errors = pdfweb._plan_merge(entries, "en", None, selection)
+    # الملف المستبعد كلياً ("4:") لا يدخل أمر qpdf
+    assert plan == [(a, "5-4,1"), (b, "2-3")]
+    assert total == 5
+    assert len(errors) == 2  # bad.pdf + الصفحات 2-9 خارج b.pdf
+
+
+def test_merge_without_qpdf_falls_back_to_pypdf(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfweb, "QPDF_BIN", None)
+    a = blank_pdf(tmp_path / "a.pdf", 4)
+    b = blank_pdf(tmp_path / "b.pdf", 2, width=500)
+    dst = tmp_path / "out.pdf"
+    total, errors = asyncio.run(
+        pdfweb._merge_to_disk([("a.pdf", a), ("b.pdf", b)], dst, "en", selection=[[(3, 2)], None])
+    )
+    assert (total, errors) == (4, [])
+    widths = [round(float(p.mediabox.width)) for p in PdfReader(dst).pages]
+    assert widths == [202, 201, 500, 501]
+
+
+@pytest.mark.skipif(pdfweb.QPDF_BIN is None, reason="qpdf not installed")
+def test_merge_with_qpdf(tmp_path):
+    a = blank_pdf(tmp_path / "a.pdf", 4)
+    b = blank_pdf(tmp_path / "b.pdf", 2, width=500)
+    dst = tmp_path / "out.pdf"
+    total, errors = asyncio.run(
+        pdfweb._merge_to_disk([("a.pdf", a), ("b.pdf", b)], dst, "en", selection=[[(3, 2)], None])
+    )
+    assert (total, errors) == (4, [])
+    widths = [round(float(p.mediabox.width)) for p in PdfReader(dst).pages]
+    assert widths == [202, 201, 500, 501]
+
+
+def test_parse_page_spec():
+    assert pdfweb._parse_page_spec("1:1-3,7;2:2-") == {1: [(1, 3), (7, 7)], 2: [(2, None)]}
+    assert pdfweb._parse_page_spec(" 3 : 5-1 ; ") == {3: [(5, 1)]}   # عكسي + مسافات
+    assert pdfweb._parse_page_spec("2:") == {2: []}                 # استبعاد الملف
+    assert pdfweb._parse_page_spec("1:-4") == {1: [(1, 4)]}
+    assert pdfweb._parse_page_spec(None) == {}
+
+
+def test_parse_page_spec_duplicate_keys_accumulate():
+    assert pdfweb._parse_page_spec("1:1;2:4;1:3-2") == {1: [(1, 1), (3, 2)], 2: [(4, 4)]}
+
+
+@pytest.mark.parametrize("spec", ["a.pdf:1", "0:1", "-1:1", "1", "1:x", "1:0", "1:2-0", "x;y:1,2:3.pdf:1"])
+def test_parse_page_spec_rejects(spec):
+    with pytest.raises(ValueError):
+        pdfweb._parse_page_spec(spec)
+
+
+def test_pick_pages_by_upload_position():
+    files = [object(), object(), object()]
+    picks = pdfweb._pick_pages(files, {1: [(2, 2)], 3: []})
+    assert [picks[f] for f in files] == [[(2, 2)], None, []]
+
+
+def test_pick_pages_unknown_index():
+    with pytest.raises(ValueError, match="3, 5"):
+        pdfweb._pick_pages([object(), object()], {3: [(1, 1)], 5: [], 1: []})
+
+
+@pytest.mark.parametrize("ranges, picked, missing", [
+    ([(2, 4)], [1, 2, 3], []),
+    ([(4, 2)], [3, 2, 1], []),            # عكسي
+    ([(3, None)], [2, 3, 4], []),          # مفتوح حتى النهاية
+    ([(1, 1), (1, 1)], [0, 0], []),        # التكرار مسموح
+    ([(4, 9)], [3, 4], ["4-9"]),           # يتجاوز => الموجود فقط + تنبيه
+    ([(7, 7)], [], ["7"]),
+    ([(9, 3)], [4, 3, 2], ["9-3"]),
+])
+def test_select_pages(ranges, picked, missing):
+    assert pdfweb._select_pages(5, ranges) == (picked, missing)
+
+
+def test_merge_dedupe_shares_identical_image(tmp_path):
+    # نفس الشعار في ملفين => XObject صورة واحد في الناتج تشير إليه الصفحتان
+    logo = tmp_path / "logo.jpg"
+    Image.new("RGB", (64, 48), (10, 90, 200)).save(logo, format="JPEG")
+    a = image_pdf(tmp_path / "a.pdf", logo.read_bytes())
+    b = image_pdf(tmp_path / "b.pdf", logo.read_bytes())
+    dst = tmp_path / "out.pdf"
+    total, errors = asyncio.run(
+        pdfweb._merge_to_disk([("a.pdf", a), ("b.pdf", b)], dst, "en", dedupe=True)
+    )
+    assert (total, errors) == (2, [])
+    assert len(re.findall(rb"/Subtype\s*/Image", dst.read_bytes())) == 1
+    refs = {
+        xobj.raw_get(name).idnum
+        for page in PdfReader(dst).pages
+        for xobj in [page["/Resources"]["/XObject"]]
+        for name in xobj
+    }
+    assert len(refs) == 1
+
+
+def test_merge_without_dedupe_keeps_both_images(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfweb, "QPDF_BIN", None)
+    logo = tmp_path / "logo.jpg"
+    Image.new("RGB", (64, 48), (10, 90, 200)).save(logo, format="JPEG")
+    a = image_pdf(tmp_path / "a.pdf", logo.read_bytes())
+    b = image_pdf(tmp_path / "b.pdf", logo.read_bytes())
+    dst = tmp_path / "out.pdf"
+    asyncio.run(pdfweb._merge_to_disk([("a.pdf", a), ("b.pdf", b)], dst, "en"))
+    assert len(re.findall(rb"/Subtype\s*/Image", dst.read_bytes())) == 2
+
+
+def test_merge_dedupe_skipped_when_pypdf_internals_unknown(tmp_path, monkeypatch):
+    # pypdf بتخطيط داخلي مختلف => الدمج ينجح بلا إزالة تكرار بدل أن ينكسر
+    monkeypatch.setattr(pdfweb, "_PYPDF_OBJECTS", False)
+    logo = tmp_path / "logo.jpg"
+    Image.new("RGB", (64, 48), (10, 90, 200)).save(logo, format="JPEG")
+    a = image_pdf(tmp_path / "a.pdf", logo.read_bytes())
+    b = image_pdf(tmp_path / "b.pdf", logo.read_bytes())
+    dst = tmp_path / "out.pdf"
+    total, errors = asyncio.run(
+        pdfweb._merge_to_disk([("a.pdf", a), ("b.pdf", b)], dst, "en", dedupe=True)
+    )
+    assert (total, errors) == (2, [])
+    assert len(re.findall(rb"/Subtype\s*/Image", dst.read_bytes())) == 2
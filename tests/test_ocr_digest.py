@@ -0,0 +1,69 @@
+import hashlib
+
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+import app as pdfweb
+
+
+def text_pdf(path, texts, width=200):
+    writer = PdfWriter()
+    for text in texts:
+        page = writer.add_blank_page(width, 300)
+        font = DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"), NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        })
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 20 150 Td ({text}) Tj ET".encode())
+        page.replace_contents(content)
+    with open(path, "wb") as fh:
+        writer.write(fh)
+    return path
+
+
+def test_same_page_in_another_file_has_same_digest(tmp_path):
+    # رقم الكائن وموضع الصفحة يختلفان؛ المحتوى والموارد والأبعاد واحدة => نفس مفتاح الكاش
+    a = pdfweb._page_digests(text_pdf(tmp_path / "a.pdf", ["one", "two"]))
+    b = pdfweb._page_digests(text_pdf(tmp_path / "b.pdf", ["intro", "extra", "two"]))
+    assert a[1] == b[2]
+    assert len(set(a + b)) == 4
+
+
+def test_size_and_content_change_digest(tmp_path):
+    base = pdfweb._page_digests(text_pdf(tmp_path / "a.pdf", ["one"]))
+    assert base != pdfweb._page_digests(text_pdf(tmp_path / "b.pdf", ["one"], width=201))
+    assert base != pdfweb._page_digests(text_pdf(tmp_path / "c.pdf", ["One"]))
+    assert base == pdfweb._page_digests(text_pdf(tmp_path / "d.pdf", ["one"]))
+
+
+def digest(obj):
+    h = hashlib.sha256()
+    pdfweb._hash_pdf_object(obj, h, set())
+    return h.hexdigest()
+
+
+def test_ignored_keys():
+    # /Parent و/Annots و/StructParents لا تغيّر ما يرسمه tesseract
+    page = DictionaryObject({NameObject("/MediaBox"): ArrayObject([NumberObject(0), NumberObject(0)])})
+    decorated = DictionaryObject(page)
+    decorated[NameObject("/Annots")] = ArrayObject([NumberObject(1)])
+    decorated[NameObject("/StructParents")] = NumberObject(7)
+    decorated[NameObject("/Parent")] = DictionaryObject({NameObject("/Count"): NumberObject(3)})
+    assert digest(page) == digest(decorated)
+    decorated[NameObject("/Rotate")] = NumberObject(90)
+    assert digest(page) != digest(decorated)
+
+
+def test_reference_cycle_terminates(tmp_path):
+    # مرجع دائري (صفحة => مورد => الصفحة) يُبصم مرة واحدة ثم بـ "n R"
+    writer = PdfWriter()
+    page = writer.add_blank_page(100, 100)
+    page[NameObject("/Resources")] = DictionaryObject({NameObject("/Self"): page.indirect_reference})
+    path = tmp_path / "cycle.pdf"
+    with open(path, "wb") as fh:
+        writer.write(fh)
+    assert len(pdfweb._page_digests(path)) == 1
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app as pdfweb
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "result.pdf"
+    path.write_bytes(DATA)
+    api = FastAPI()
+
+    @api.get("/file")
+    def file(cache: str | None = "MISS"):
+        return pdfweb._file_response(path, "application/pdf", "out.pdf", cache=cache, etag="abc123")
+
+    return TestClient(api)
+
+
+def test_full_response_headers(client):
+    r = client.get("/file")
+    assert r.status_code == 200 and r.content == DATA
+    assert r.headers["content-length"] == str(len(DATA))
+    assert r.headers["etag"] == '"abc123"'
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["x-cache"] == "MISS"
+    assert r.headers["content-disposition"] == 'attachment; filename="out.pdf"'
+    assert "x-cache" not in client.get("/file", params={"cache": ""}).headers
+
+
+def test_range_resumes_download(client):
+    r = client.get("/file", headers={"Range": "bytes=1000-"})
+    assert r.status_code == 206 and r.content == DATA[1000:]
+    assert r.headers["content-range"] == f"bytes 1000-{len(DATA) - 1}/{len(DATA)}"
+
+
+@pytest.mark.parametrize("etag, status", [('"abc123"', 206), ('"stale"', 200)])
+def test_if_range_uses_content_etag(client, etag, status):
+    # ETag من مفتاح المحتوى: الاستئناف يصح فقط إن لم يتغير الناتج
+    r = client.get("/file", headers={"Range": "bytes=10-19", "If-Range": etag})
+    assert r.status_code == status
+    assert r.content == (DATA[10:20] if status == 206 else DATA)
+
+
+def test_linearize_without_qpdf_keeps_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfweb, "QPDF_BIN", None)
+    path = tmp_path / "out.pdf"
+    path.write_bytes(b"%PDF-1.4 original")
+    assert asyncio.run(pdfweb._linearize(path)) is False
+    assert path.read_bytes() == b"%PDF-1.4 original"
+
+
+@pytest.mark.parametrize("code, written, expected", [
+    (0, True, True),
+    (3, True, True),    # تحذيرات فقط
+    (2, True, False),   # خطأ => الأصل يبقى والناتج الجزئي يُحذف
+    (0, False, False),
+])
+def test_linearize_result_codes(tmp_path, monkeypatch, code, written, expected):
+    monkeypatch.setattr(pdfweb, "QPDF_BIN", "qpdf")
+
+    async def fake_run(cmd, *args, **kwargs):
+        if written:
+            with open(cmd[-1], "wb") as fh:
+                fh.write(b"%PDF-1.4 linearized")
+        return code, b"", b""
+
+    monkeypatch.setattr(pdfweb.qpdf_pool, "run", fake_run)
+    path = tmp_path / "out.pdf"
+    path.write_bytes(b"%PDF-1.4 original")
+    assert asyncio.run(pdfweb._linearize(path)) is expected
+    assert path.read_bytes() == (b"%PDF-1.4 linearized" if expected else b"%PDF-1.4 original")
+    assert [p.name for p in tmp_path.iterdir()] == ["out.pdf"]
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as pdfweb
+
+
+def put_parts(d, index, data: bytes, chunk: int, skip=()):
+    for start in range(0, len(data), chunk):
+        if start not in skip:
+            (d / f"{index}.{start:012d}.part").write_bytes(data[start:start + chunk])
+
+
+def test_assemble_waits_for_every_part(tmp_path):
+    data = os.urandom(10_000)
+    put_parts(tmp_path, 0, data, 4096, skip={4096})
+    assert not pdfweb._assemble_upload(tmp_path, 0, len(data))
+    put_parts(tmp_path, 0, data, 4096)
+    assert pdfweb._assemble_upload(tmp_path, 0, len(data))
+    assert (tmp_path / "0").read_bytes() == data
+    assert not list(tmp_path.glob("0.*.part"))
+    assert not pdfweb._assemble_upload(tmp_path, 0, len(data))  # جُمعت مرة واحدة فقط
+
+
+def test_assemble_failure_leaves_no_partial_image(tmp_path, monkeypatch):
+    # الكتابة تفشل في المنتصف => لا ملف d/0 ناقص، والأجزاء والقفل جاهزة لإعادة الجزء الأخير
+    data = os.urandom(10_000)
+    put_parts(tmp_path, 0, data, 4096)
+
+    def full_disk(src, dst, length=0):
+        dst.write(src.read(100))
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(pdfweb.shutil, "copyfileobj", full_disk)
+    with pytest.raises(OSError):
+        pdfweb._assemble_upload(tmp_path, 0, len(data))
+    assert not (tmp_path / "0").exists()
+    assert len(list(tmp_path.glob("0.*.part"))) == 3
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+    monkeypatch.undo()
+    assert pdfweb._assemble_upload(tmp_path, 0, len(data))
+    assert (tmp_path / "0").read_bytes() == data
+
+
+def test_session_rejects_empty_image(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdfweb, "UPLOAD_SESSION_DIR", tmp_path)
+    client = TestClient(pdfweb.app)
+    r = client.post("/api/uploads", data={"count": "2", "sizes": ["10", "0"], "names": ["a.jpg", "b.jpg"],
+                                          "lang": "en"})
+    assert r.status_code == 400
+    assert "b.jpg" in r.json()["error"]
+    assert list(tmp_path.iterdir()) == []
+    r = client.post("/api/uploads", data={"count": "2", "sizes": ["10", "5"], "lang": "en"})
+    assert r.status_code == 200
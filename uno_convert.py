@@ -0,0 +1,60 @@
+"""Convert one document to PDF through a running LibreOffice listener.
+
+Runs under a Python that can import `uno` (apt: python3-uno), not the app's venv:
+
+    /usr/bin/python3 uno_convert.py PIPE_NAME SRC DST
+    /usr/bin/python3 uno_convert.py PIPE_NAME --ping      # health check
+
+Used by the office pool in app.py; every LibreOffice instance listens on its own pipe.
+"""
+import sys
+
+import uno
+from com.sun.star.beans import PropertyValue
+
+# الترتيب مهم: مستند Impress يدعم DrawingDocument أيضاً
+FILTERS = (
+    ("com.sun.star.text.TextDocument", "writer_pdf_Export"),
+    ("com.sun.star.sheet.SpreadsheetDocument", "calc_pdf_Export"),
+    ("com.sun.star.presentation.PresentationDocument", "impress_pdf_Export"),
+    ("com.sun.star.drawing.DrawingDocument", "draw_pdf_Export"),
+)
+
+
+def _props(**kwargs):
+    out = []
+    for name, value in kwargs.items():
+        p = PropertyValue()
+        p.Name, p.Value = name, value
+        out.append(p)
+    return tuple(out)
+
+
+def main(argv) -> int:
+    pipe = argv[1]
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+    ctx = resolver.resolve(f"uno:pipe,name={pipe};urp;StarOffice.ComponentContext")
+    if argv[2] == "--ping":
+        return 0
+
+    src, dst = argv[2], argv[3]
+    desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+    # بدون ماكرو وبدون تحديث الروابط الخارجية
+    doc = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(src), "_blank", 0,
+        _props(Hidden=True, ReadOnly=True, MacroExecutionMode=0, UpdateDocMode=0),
+    )
+    if doc is None:
+        print("could not load document", file=sys.stderr)
+        return 2
+    try:
+        export = next((f for service, f in FILTERS if doc.supportsService(service)), "writer_pdf_Export")
+        doc.storeToURL(uno.systemPathToFileUrl(dst), _props(FilterName=export))
+    finally:
+        doc.close(True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))